@@ -0,0 +1,47 @@
+import os
+import json
+import argparse
+
+# Benchmarks run headless, without a window or audio device.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from scripts.benchmark import benchmark_physics, print_physics, benchmark_horde, print_horde, benchmark_memory, print_memory, benchmark_combat, print_combat, benchmark_projectiles, print_projectiles, benchmark_lod, print_lod
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Measure the cost of the game's hot paths without any display.")
+	parser.add_argument("--entities", type=int, default=500, help="Number of entities to simulate.")
+	parser.add_argument("--frames", type=int, default=600, help="Number of frames to time.")
+	parser.add_argument("--enemies", type=int, default=500, help="Number of enemies in the server tick benchmark, 0 to skip it.")
+	parser.add_argument("--players", type=int, default=32, help="Number of players the enemies and projectiles check hits against.")
+	parser.add_argument("--projectiles", type=int, default=1000, help="Number of projectiles kept in flight, 0 to skip them.")
+	parser.add_argument("--projectile-speed", type=float, default=1.5, help="Pixels per frame, enemies fire at 1.5.")
+	parser.add_argument("--level", type=int, default=0, help="Map the entities are scattered over.")
+	parser.add_argument("--json", help="Also write the report to this file.")
+	args = parser.parse_args()
+
+	report = {"physics": benchmark_physics(entity_count=args.entities, frames=args.frames, level_id=args.level)}
+	print_physics(report["physics"])
+
+	if args.enemies > 0:
+		report["horde"] = benchmark_horde(enemy_count=args.enemies, frames=args.frames, level_id=args.level)
+		print_horde(report["horde"])
+
+		report["combat"] = benchmark_combat(player_count=args.players, enemy_count=args.enemies, frames=args.frames, level_id=args.level)
+		print_combat(report["combat"])
+
+		report["lod"] = benchmark_lod(enemies_per_copy=args.enemies // 4, frames=args.frames, level_id=args.level)
+		print_lod(report["lod"])
+
+	if args.projectiles > 0:
+		report["projectiles"] = benchmark_projectiles(projectile_count=args.projectiles, player_count=args.players, frames=args.frames,
+													speed=args.projectile_speed, level_id=args.level)
+		print_projectiles(report["projectiles"])
+
+	report["memory"] = benchmark_memory(frames=args.frames)
+	print_memory(report["memory"])
+
+	if args.json:
+		with open(args.json, "w") as f:
+			json.dump(report, f, indent=4)
@@ -0,0 +1,47 @@
+import os
+import socket
+import argparse
+
+# No window or audio device is needed to simulate the world.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from scripts.socket.dedicated_server import DedicatedServer, TICK_RATE
+from scripts.socket.room_server import RoomServer
+from scripts.socket.capture import TrafficRecorder
+from scripts.socket.metrics import MetricsEndpoint, MetricsLog
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Run a headless, authoritative Silly Ninja server.")
+	parser.add_argument("--ip", default=socket.gethostbyname(socket.gethostname()), help="IP address to listen on.")
+	parser.add_argument("--port", type=int, default=5050, help="Port to listen on.")
+	parser.add_argument("--tick-rate", type=int, default=TICK_RATE, help="Simulation ticks per second.")
+	parser.add_argument("--transport", choices=("tcp", "udp"), default="tcp", help="Transport used to talk to clients.")
+	parser.add_argument("--rooms", action="store_true", help="Host any number of named rooms on this port, instead of a single session.")
+	parser.add_argument("--capture", help="Record every message to this file, for traffic_report.py (\".gz\" to compress it).")
+	parser.add_argument("--batched-physics", action="store_true", help="Move all enemies at once with NumPy, for levels crowded with them.")
+	parser.add_argument("--enemy-lod", action="store_true", help="Update the enemies far from every player less often, or not at all. " +
+						"This changes the game away from the players: far enemies walk, turn and shoot only on their turns, so they cover less ground.")
+	parser.add_argument("--metrics-port", type=int, help="Serve live metrics over HTTP on this port, on localhost only.")
+	parser.add_argument("--metrics-log", help="Append the metrics to this file as JSON lines, every 10 seconds.")
+	args = parser.parse_args()
+
+	capture = TrafficRecorder(args.capture, "server") if args.capture else None
+	server_type = RoomServer if args.rooms else DedicatedServer
+	server = server_type(args.ip, args.port, tick_rate=args.tick_rate, transport=args.transport, capture=capture,
+						batched_physics=args.batched_physics, enemy_lod=args.enemy_lod)
+
+	exporters = []
+	if args.metrics_port:
+		exporters.append(MetricsEndpoint(server.metrics, args.metrics_port))
+	if args.metrics_log:
+		exporters.append(MetricsLog(server.metrics, args.metrics_log))
+	for exporter in exporters:
+		exporter.start()
+
+	server.serve_forever()
+	for exporter in exporters:
+		exporter.close()
+	if capture is not None:
+		capture.close()
@@ -0,0 +1,74 @@
+import bisect
+import math
+
+from scripts.regions import VIEW_RADIUS, region_of
+
+
+# In regions around a player's own, see scripts.regions. Enemies this close are updated every tick, one region more
+# than what the players see, so that none can walk into a view between two ticks without having been updated all along.
+NEAR_RADIUS = VIEW_RADIUS + 1
+WAKE_RADIUS = 4  # Enemies farther than this from every player sleep until one comes closer.
+FAR_INTERVAL = 4  # Ticks between two updates of an enemy out of everyone's way, on average.
+FAR_BUDGET = 64  # Most enemies out of everyone's way updated in a single tick, near ones don't count.
+
+
+class AIScheduler:
+	""" Picks the enemies worth updating each tick, by how far they are from the closest player.
+		Near ones are updated every tick. Far ones take turns, a few per tick within a budget, so that their
+		ledge probes and line of fire checks are spread over many ticks. The farthest ones sleep.
+		Far enemies simply live slower, every update is still a whole step of their AI and physics, so between their turns
+		they neither move nor shoot: they cover a fraction of the ground they would have, which changes where they are
+		once a player gets close. Only the far ones are held to the budget, near ones are always updated. """
+	def __init__(self, near_radius=NEAR_RADIUS, wake_radius=WAKE_RADIUS, far_interval=FAR_INTERVAL, far_budget=FAR_BUDGET):
+		self.near_radius = near_radius
+		self.wake_radius = wake_radius
+		self.far_interval = far_interval
+		self.far_budget = far_budget
+		self.cursor = 0  # Index in the enemy list the next far turn starts from.
+		# Set while some client has no player in the world yet, it's sent every enemy step by step, so they all have to be updated.
+		self.wake_all = False
+		self.counts = {"near": 0, "far": 0, "asleep": 0, "updated": 0}  # Of the latest tick.
+
+
+	def regions_around(self, players, radius):
+		regions = set()
+		for player in players:
+			center_x, center_y = region_of(player.pos)
+			for x in range(center_x - radius, center_x + radius + 1):
+				for y in range(center_y - radius, center_y + radius + 1):
+					regions.add((x, y))
+		return regions
+
+
+	def schedule(self, enemies, players):
+		""" The enemies to update this tick, in the order of 'enemies'. """
+		if self.wake_all or not players:
+			self.counts = {"near": len(enemies), "far": 0, "asleep": 0, "updated": len(enemies)}
+			return list(enemies)
+
+		near_regions = self.regions_around(players, self.near_radius)
+		wake_regions = self.regions_around(players, self.wake_radius)
+		due = []
+		far = []  # Indices in 'enemies'.
+		asleep = 0
+		for index, enemy in enumerate(enemies):
+			region = region_of(enemy.pos)
+			if region in near_regions:
+				due.append(index)
+			elif region in wake_regions:
+				far.append(index)
+			else:
+				asleep += 1
+
+		near = len(due)
+		if far:
+			# Round robin from where the previous tick stopped, every far enemy gets its turn.
+			turns = min(math.ceil(len(far) / self.far_interval), self.far_budget)
+			start = bisect.bisect_left(far, self.cursor)
+			picked = (far[start:] + far[:start])[:turns]
+			self.cursor = picked[-1] + 1
+			due.extend(picked)
+			due.sort()
+
+		self.counts = {"near": near, "far": len(far), "asleep": asleep, "updated": len(due)}
+		return [enemies[index] for index in due]
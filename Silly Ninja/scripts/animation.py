@@ -1,4 +1,7 @@
 class Animation:
+	# Every entity and particle owns a copy.
+	__slots__ = ("images", "image_duration", "frame", "loop", "done")
+
 	def __init__(self, images, image_duration=5, loop=True):
 		self.images = images
 		# How many frames we want each image to show.
@@ -11,6 +14,11 @@ class Animation:
 	def copy(self):
 		return Animation(self.images, self.image_duration, self.loop)
 
+
+	def restart(self):
+		self.frame = 0
+		self.done = False
+
 	
 	def current_frame_image(self):
 		return self.images[int(self.frame / self.image_duration)]
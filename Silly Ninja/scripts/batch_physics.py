@@ -0,0 +1,171 @@
+try:
+	import numpy
+except ImportError:
+	# Batched physics is optional, every enemy updates on its own without it.
+	numpy = None
+
+from scripts.tilemap import NEIGHBOR_OFFSETS
+
+
+UP, DOWN, LEFT, RIGHT = range(4)
+
+if numpy is not None:
+	# NEIGHBOR_OFFSETS split by axis, in the same order.
+	NEIGHBOR_XS = numpy.array([offset_x for offset_x, _ in NEIGHBOR_OFFSETS], dtype=numpy.int64)
+	NEIGHBOR_YS = numpy.array([offset_y for _, offset_y in NEIGHBOR_OFFSETS], dtype=numpy.int64)
+
+
+def is_available():
+	return numpy is not None
+
+
+class EnemyBatch:
+	""" Keeps the positions, velocities and collision flags of a level's enemies in arrays, and moves all of them at once.
+		Once attached, each enemy's 'pos' and 'velocity' are views onto its row, so the rest of the game reads and writes them as usual.
+		Enemies still decide their moves and react to them one by one, only gravity and tile collisions are vectorized.
+		Gives the same positions as PhysicsEntity.move(), down to the bit. """
+	def __init__(self):
+		if numpy is None:
+			raise RuntimeError("Batched physics needs NumPy, install it with \"python -m pip install numpy\".")
+
+		self.positions = numpy.zeros((0, 2))
+		self.velocities = numpy.zeros((0, 2))
+		self.sizes = numpy.zeros((0, 2), dtype=numpy.int64)
+		self.collisions = numpy.zeros((0, 4), dtype=bool)
+		self.grid = numpy.zeros((0, 0), dtype=bool)
+		self.grid_origin = (0, 0)
+		self.tile_size = 16
+		self.allocate_scratch(0)
+
+
+	def allocate_scratch(self, count):
+		# Room for every enemy of the level and each of its neighbor cells, ticks only ever use the first rows.
+		shape = (count, len(NEIGHBOR_OFFSETS))
+		self.neighbor_xs = numpy.empty(shape, dtype=numpy.int64)
+		self.neighbor_ys = numpy.empty(shape, dtype=numpy.int64)
+		self.grid_xs = numpy.empty(shape, dtype=numpy.int64)
+		self.grid_ys = numpy.empty(shape, dtype=numpy.int64)
+		self.candidates = numpy.empty(shape, dtype=bool)
+		self.in_grid = numpy.empty(shape, dtype=bool)
+		self.step_collisions = numpy.empty((count, 4), dtype=bool)
+
+
+	def attach(self, enemies, tilemap):
+		""" Takes over the enemies of a freshly loaded level, along with the tilemap's solidity grid.
+			Enemies are only spawned by loading a level, so the arrays never need to grow until the next one. """
+		count = len(enemies)
+		self.positions = numpy.array([enemy.pos for enemy in enemies], dtype=float).reshape(count, 2)
+		self.velocities = numpy.array([enemy.velocity for enemy in enemies], dtype=float).reshape(count, 2)
+		self.sizes = numpy.array([enemy.size for enemy in enemies], dtype=numpy.int64).reshape(count, 2)
+		self.collisions = numpy.zeros((count, 4), dtype=bool)
+		self.allocate_scratch(count)
+
+		for slot, enemy in enumerate(enemies):
+			enemy.batch_slot = slot
+			enemy.pos = self.positions[slot]
+			enemy.velocity = self.velocities[slot]
+
+		self.grid = numpy.frombuffer(bytes(tilemap.solid_grid), dtype=numpy.uint8).reshape(tilemap.grid_height, tilemap.grid_width) == 1
+		self.grid_origin = (tilemap.grid_x, tilemap.grid_y)
+		self.tile_size = tilemap.tile_size
+
+
+	def resolve_axis(self, positions, sizes, frame_movement, collisions, axis):
+		""" PhysicsEntity.resolve_axis() for every row at once.
+			The solid neighbor cells that overlap each row across the axis are found for all nine offsets in one pass.
+			Only pushing the rows along the axis has to follow the offsets in order, since each push moves the row for the next
+			check, and it's skipped for the offsets where no row has a solid cell. """
+		if not self.grid.size:
+			# A map without any physics tile, nothing to collide with.
+			return positions[:, axis].copy()
+
+		count = len(positions)
+		tile_size = self.tile_size
+		grid_height, grid_width = self.grid.shape
+		edges = numpy.trunc(positions)
+		cells = numpy.floor_divide(positions, tile_size).astype(numpy.int64)
+
+		# The neighbor cells of every row, as a (rows, offsets) grid each.
+		xs = numpy.add(cells[:, 0, None], NEIGHBOR_XS, out=self.neighbor_xs[:count])
+		ys = numpy.add(cells[:, 1, None], NEIGHBOR_YS, out=self.neighbor_ys[:count])
+		grid_xs = numpy.subtract(xs, self.grid_origin[0], out=self.grid_xs[:count])
+		grid_ys = numpy.subtract(ys, self.grid_origin[1], out=self.grid_ys[:count])
+		in_grid = numpy.less(grid_xs, grid_width, out=self.in_grid[:count])
+		in_grid &= grid_ys < grid_height
+		in_grid &= grid_xs >= 0
+		in_grid &= grid_ys >= 0
+		numpy.clip(grid_xs, 0, grid_width - 1, out=grid_xs)
+		numpy.clip(grid_ys, 0, grid_height - 1, out=grid_ys)
+		candidates = numpy.logical_and(self.grid[grid_ys, grid_xs], in_grid, out=self.candidates[:count])
+
+		# Moving along one axis doesn't change the overlap across the other, it's settled for every offset here.
+		across = 1 - axis
+		tile_across = (ys if axis == 0 else xs) * tile_size
+		candidates &= edges[:, across, None] < tile_across + tile_size
+		candidates &= tile_across < (edges[:, across] + sizes[:, across])[:, None]
+		offsets = numpy.flatnonzero(candidates.any(axis=0))
+		if not len(offsets):
+			return positions[:, axis].copy()
+
+		tiles_along = (xs if axis == 0 else ys) * tile_size
+		size = sizes[:, axis]
+		forward, backward = (RIGHT, LEFT) if axis == 0 else (DOWN, UP)
+		moving_forward = frame_movement > 0
+		moving_backward = frame_movement < 0
+		edge = edges[:, axis]
+		hit_any = numpy.zeros(count, dtype=bool)
+		for offset in offsets.tolist():
+			tile_edge = tiles_along[:, offset]
+			hit = candidates[:, offset] & (edge < tile_edge + tile_size) & (tile_edge < edge + size)
+			edge = numpy.where(hit & moving_forward, tile_edge - size, edge)
+			edge = numpy.where(hit & moving_backward, tile_edge + tile_size, edge)
+			hit_any |= hit
+
+		collisions[:, forward] = hit_any & moving_forward
+		collisions[:, backward] = hit_any & moving_backward
+		return numpy.where(hit_any, edge, positions[:, axis])
+
+
+	def move(self, slots, movements):
+		""" PhysicsEntity.move() for the enemies in 'slots', 'movements' being theirs as an (n, 2) array. """
+		positions = self.positions[slots]
+		velocities = self.velocities[slots]
+		sizes = self.sizes[slots]
+		collisions = self.step_collisions[:len(slots)]
+		collisions.fill(False)
+		frame_movement = movements + velocities
+
+		positions[:, 0] += frame_movement[:, 0]
+		positions[:, 0] = self.resolve_axis(positions, sizes, frame_movement[:, 0], collisions, 0)
+		positions[:, 1] += frame_movement[:, 1]
+		positions[:, 1] = self.resolve_axis(positions, sizes, frame_movement[:, 1], collisions, 1)
+
+		velocities[:, 1] = numpy.minimum(5, velocities[:, 1] + 0.1)
+		velocities[collisions[:, DOWN] | collisions[:, UP], 1] = 0
+
+		# Written back in place, the enemies' views keep pointing at their rows.
+		self.positions[slots] = positions
+		self.velocities[slots] = velocities
+		self.collisions[slots] = collisions
+
+
+	def update(self, enemies, tilemap):
+		""" Enemy.update() for every enemy of the level, returns the IDs of the ones that died. """
+		if not enemies:
+			return set()
+
+		movements = [enemy.think(tilemap) for enemy in enemies]
+		slots = numpy.fromiter((enemy.batch_slot for enemy in enemies), dtype=numpy.int64, count=len(enemies))
+		self.move(slots, numpy.array(movements, dtype=float).reshape(len(enemies), 2))
+
+		dead_enemies = set()
+		for enemy, movement, (up, down, left, right) in zip(enemies, movements, self.collisions[slots].tolist()):
+			collisions = enemy.collisions
+			collisions["up"] = up
+			collisions["down"] = down
+			collisions["left"] = left
+			collisions["right"] = right
+			enemy.animate(movement)
+			if enemy.react(movement):
+				dead_enemies.add(enemy.id)
+		return dead_enemies
@@ -0,0 +1,482 @@
+import math
+import random
+import time
+import tracemalloc
+
+from scripts.entities import PhysicsEntity, Enemy
+from scripts.visual_effects import Particle, Spark
+from scripts.clouds import Cloud
+from scripts.tilemap import Tile, Tilemap
+from scripts.animation import Animation
+from scripts.headless import HeadlessGame
+from scripts.batch_physics import is_available as batched_physics_available
+from scripts.soak import percentile
+
+
+FRAME_BUDGET = 1 / 60  # Seconds, one frame of the displayed game.
+
+
+def spawn_walkers(game, count, seed=0):
+	""" Scatters 'count' enemy sized entities over the level, with the direction each walks in at the speed of an enemy. """
+	rng = random.Random(seed)
+	tilemap = game.tilemap
+	left = tilemap.grid_x * tilemap.tile_size
+	top = tilemap.grid_y * tilemap.tile_size
+	width = tilemap.grid_width * tilemap.tile_size
+	height = tilemap.grid_height * tilemap.tile_size
+
+	entities = []
+	directions = []
+	for i in range(count):
+		entity = PhysicsEntity(game, "enemy", (left + rng.random() * width, top + rng.random() * height), (8, 15), id=f"enemy_{i + 1}")
+		entity.set_action("run")
+		entities.append(entity)
+		directions.append(rng.choice((-0.5, 0.5)))
+	return entities, directions
+
+
+def benchmark_physics(entity_count=500, frames=600, level_id=0, seed=0):
+	""" Times PhysicsEntity.update for a crowd of entities on a real map, frame by frame, without any display. """
+	game = HeadlessGame()
+	game.level_id = level_id
+	game.load_level(level_id)
+	entities, directions = spawn_walkers(game, entity_count, seed=seed)
+	tilemap = game.tilemap
+
+	def step():
+		for i, entity in enumerate(entities):
+			entity.update(tilemap, movement=(directions[i], 0))
+			# Turn around at walls, so that the crowd keeps colliding instead of piling up.
+			if entity.collisions["left"] or entity.collisions["right"]:
+				directions[i] = -directions[i]
+
+	frame_times = []
+	for _ in range(frames):
+		start_time = time.perf_counter()
+		step()
+		frame_times.append(time.perf_counter() - start_time)
+
+	# Memory churned through within a frame, measured apart since tracing slows everything down.
+	tracemalloc.start()
+	allocated = []
+	for _ in range(min(frames, 60)):
+		tracemalloc.reset_peak()
+		before, _ = tracemalloc.get_traced_memory()
+		step()
+		allocated.append(tracemalloc.get_traced_memory()[1] - before)
+	tracemalloc.stop()
+
+	return {
+		"entities": entity_count,
+		"frames": frames,
+		"frame_ms": {
+			"mean": sum(frame_times) / len(frame_times) * 1000,
+			"p50": percentile(frame_times, 0.5) * 1000,
+			"p99": percentile(frame_times, 0.99) * 1000,
+			"max": max(frame_times) * 1000
+		},
+		"budget_percent": sum(frame_times) / len(frame_times) / FRAME_BUDGET * 100,
+		"peak_bytes_per_frame": max(allocated)
+	}
+
+
+def spawn_horde(game, count, seed=0):
+	""" Replaces the enemies of the loaded level with 'count' of them, each standing on a random floor tile. """
+	rng = random.Random(seed)
+	tilemap = game.tilemap
+	floors = [(x, y) for y in range(tilemap.grid_y + 1, tilemap.grid_y + tilemap.grid_height)
+						for x in range(tilemap.grid_x, tilemap.grid_x + tilemap.grid_width)
+						if tilemap.is_solid_cell(x, y) and not tilemap.is_solid_cell(x, y - 1)]
+
+	game.clear_enemies()
+	for i in range(count):
+		x, y = rng.choice(floors)
+		pos = (x * tilemap.tile_size + rng.random() * (tilemap.tile_size - 8), y * tilemap.tile_size - 15)
+		game.spawn_enemy(game.enemy_pool.acquire(game, pos, (8, 15), id=f"enemy_{i + 1}", client_id=game.client_id))
+
+	if game.enemy_batch is not None:
+		game.enemy_batch.attach(game.enemies, tilemap)
+
+
+def time_ticks(game, frames):
+	frame_times = []
+	for _ in range(frames):
+		start_time = time.perf_counter()
+		game.tick()
+		frame_times.append(time.perf_counter() - start_time)
+
+	return {
+		"mean": sum(frame_times) / len(frame_times) * 1000,
+		"p50": percentile(frame_times, 0.5) * 1000,
+		"p99": percentile(frame_times, 0.99) * 1000,
+		"max": max(frame_times) * 1000
+	}
+
+
+def benchmark_horde(enemy_count=500, frames=600, level_id=0, seed=0):
+	""" Times the dedicated server's world tick with a horde of enemies, updated one by one and then batched.
+		Both runs start from the same spawns and random seed. """
+	report = {"enemies": enemy_count, "frames": frames, "frame_ms": {}}
+	backends = ("scalar", "batched") if batched_physics_available() else ("scalar",)
+	for backend in backends:
+		game = HeadlessGame(batched_physics=backend == "batched")
+		game.level_id = level_id
+		game.load_level(level_id)
+		spawn_horde(game, enemy_count, seed=seed)
+		game.transition = 0
+
+		random.seed(seed)
+		report["frame_ms"][backend] = time_ticks(game, frames)
+
+	if "batched" in report["frame_ms"]:
+		report["speedup"] = report["frame_ms"]["scalar"]["mean"] / report["frame_ms"]["batched"]["mean"]
+	return report
+
+
+def widen_level(game, copies):
+	""" Repeats the loaded map 'copies' times side by side, to get maps of any size out of the real ones. """
+	tilemap = game.tilemap
+	tiles = list(tilemap.map.values())
+	for copy in range(1, copies):
+		shift = copy * tilemap.grid_width
+		for tile in tiles:
+			x, y = int(tile.pos[0]) + shift, int(tile.pos[1])
+			tilemap.map[f"{x};{y}"] = Tile(tile.type, tile.variant, (x, y))
+	tilemap.rebuild_solidity()
+
+
+def benchmark_lod(copies=(1, 2, 4, 8), enemies_per_copy=100, player_count=4, frames=300, level_id=0, seed=0):
+	""" Times the dedicated server's tick on ever wider maps with as many enemies per copy of the map,
+		the players all staying in the first copy, with every enemy updated and with the AI scheduler. """
+	report = {"enemies_per_copy": enemies_per_copy, "players": player_count, "frames": frames, "tick_ms": {}, "updated": {}}
+	for count in copies:
+		for backend in ("every_enemy", "scheduled"):
+			rng = random.Random(seed)
+			game = HeadlessGame(enemy_lod=backend == "scheduled")
+			game.load_level(level_id)
+			widen_level(game, count)
+			spawn_horde(game, enemies_per_copy * count, seed=seed)
+			game.transition = 0
+
+			tilemap = game.tilemap
+			for i in range(player_count):
+				player = game.players.register(i, f"player_{i + 1}", f"client_{i}", f"player_{i + 1}")
+				player.pos = [(tilemap.grid_x + rng.random() * tilemap.grid_width / count) * tilemap.tile_size, game.spawn_pos[1]]
+
+			random.seed(seed)
+			report["tick_ms"].setdefault(backend, {})[count] = time_ticks(game, frames)["mean"]
+			if game.ai_scheduler is not None:
+				report["updated"][count] = game.ai_scheduler.counts
+	return report
+
+
+def benchmark_combat(player_count=32, enemy_count=500, projectile_count=200, frames=600, level_id=0, seed=0):
+	""" Times the hit checks of a frame, every enemy against the players' dashes and every projectile against the players,
+		by scanning all the players and through their spatial hash. """
+	rng = random.Random(seed)
+	game = HeadlessGame()
+	game.load_level(level_id)
+	spawn_horde(game, enemy_count, seed=seed)
+	tilemap = game.tilemap
+	width = tilemap.grid_width * tilemap.tile_size
+	height = tilemap.grid_height * tilemap.tile_size
+	left = tilemap.grid_x * tilemap.tile_size
+	top = tilemap.grid_y * tilemap.tile_size
+
+	for i in range(player_count):
+		player = game.players.register(i, f"player_{i + 1}", f"client_{i}", f"player_{i + 1}")
+		player.pos = [left + rng.random() * width, top + rng.random() * height]
+	points = [(left + rng.random() * width, top + rng.random() * height) for _ in range(projectile_count)]
+	players = game.players
+	enemies = game.enemies
+
+	def scan():
+		hits = 0
+		for enemy in enemies:
+			rect = enemy.rect()
+			hits += sum(1 for player in players if rect.colliderect(player.rect()))
+		for point in points:
+			hits += sum(1 for player in players if player.rect().collidepoint(point))
+		return hits
+
+	def look_up():
+		players.index_positions()
+		hits = 0
+		for enemy in enemies:
+			hits += len(players.overlapping(enemy.rect()))
+		for point in points:
+			hits += len(players.at_point(point))
+		return hits
+
+	report = {"players": player_count, "enemies": enemy_count, "projectiles": projectile_count, "frames": frames, "frame_ms": {}}
+	for name, check in (("scan", scan), ("spatial_hash", look_up)):
+		frame_times = []
+		for _ in range(frames):
+			start_time = time.perf_counter()
+			report["hits"] = check()
+			frame_times.append(time.perf_counter() - start_time)
+		report["frame_ms"][name] = {"mean": sum(frame_times) / len(frame_times) * 1000, "p99": percentile(frame_times, 0.99) * 1000}
+	report["speedup"] = report["frame_ms"]["scan"]["mean"] / report["frame_ms"]["spatial_hash"]["mean"]
+	return report
+
+
+def benchmark_projectiles(projectile_count=1000, player_count=32, frames=600, speed=1.5, level_id=0, seed=0):
+	""" Times the projectiles of a frame under heavy fire: 'projectile_count' of them kept in flight at 'speed' pixels
+		per frame, checked against the walls and the players. Also counts the ones that went through a wall without stopping. """
+	rng = random.Random(seed)
+	game = HeadlessGame()
+	game.load_level(level_id)
+	tilemap = game.tilemap
+	tile_size = tilemap.tile_size
+	floors = [(x, y - 1) for y in range(tilemap.grid_y + 1, tilemap.grid_y + tilemap.grid_height)
+							for x in range(tilemap.grid_x, tilemap.grid_x + tilemap.grid_width)
+							if tilemap.is_solid_cell(x, y) and not tilemap.is_solid_cell(x, y - 1)]
+
+	def random_spot():
+		x, y = rng.choice(floors)
+		return ((x + rng.random()) * tile_size, (y + rng.random()) * tile_size)
+
+	for i in range(player_count):
+		player = game.players.register(i, f"player_{i + 1}", f"client_{i}", f"player_{i + 1}")
+		player.pos = list(random_spot())
+	game.players.index_positions()
+
+	projectiles = game.projectiles
+	can_be_hit = lambda player: abs(player.dashing) < 50
+	frame_times = []
+	walls = hits = tunneled = 0
+	for _ in range(frames):
+		while len(projectiles) < projectile_count:
+			projectiles.fire(random_spot(), rng.choice((-speed, speed)))
+
+		start_time = time.perf_counter()
+		walls += len(projectiles.advance(tilemap))
+		hits += len(projectiles.hits(game.players, can_be_hit))
+		frame_times.append(time.perf_counter() - start_time)
+
+		for slot in projectiles.active:
+			row = int(projectiles.ys[slot] // tile_size)
+			first, last = sorted((int(projectiles.previous_xs[slot] // tile_size), int(projectiles.xs[slot] // tile_size)))
+			if any(tilemap.is_solid_cell(cell, row) for cell in range(first + 1, last)):
+				tunneled += 1
+
+	return {
+		"projectiles": projectile_count,
+		"players": player_count,
+		"speed": speed,
+		"frames": frames,
+		"frame_ms": {
+			"mean": sum(frame_times) / len(frame_times) * 1000,
+			"p99": percentile(frame_times, 0.99) * 1000
+		},
+		"wall_hits": walls,
+		"player_hits": hits,
+		"tunneled": tunneled
+	}
+
+
+def traced_bytes(build):
+	""" Memory still held by whatever 'build' returns, as seen by tracemalloc. """
+	tracemalloc.start()
+	before, _ = tracemalloc.get_traced_memory()
+	kept = build()
+	after, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del kept
+	return after - before
+
+
+UNSLOTTED_CLASSES = {}
+
+
+def unslotted(obj):
+	""" A copy of a slotted object the way it used to be stored, in a __dict__, so both can be measured side by side.
+		Each class gets a stand-in with the same body minus the slots, for its instances to be laid out like they used to.
+		Every entity owns its animation, it's unslotted along with it. """
+	cls = type(obj)
+	if cls not in UNSLOTTED_CLASSES:
+		slots = getattr(cls, "__slots__", ())
+		body = {name: value for name, value in vars(cls).items() if name not in slots and name != "__slots__"}
+		UNSLOTTED_CLASSES[cls] = type(f"Unslotted{cls.__name__}", (), body)
+	copy = object.__new__(UNSLOTTED_CLASSES[cls])
+	for base in reversed(cls.__mro__):
+		for name in getattr(base, "__slots__", ()):
+			if hasattr(obj, name):
+				value = getattr(obj, name)
+				setattr(copy, name, unslotted(value) if isinstance(value, Animation) else value)
+	return copy
+
+
+def unslotted_tile(tile):
+	# Tiles also used to keep list positions and their own copy of the type name read from the map.
+	copy = unslotted(tile)
+	copy.pos = list(tile.pos)
+	copy.type = "".join(list(tile.type))
+	return copy
+
+
+def unslot_tilemap(tilemap):
+	tilemap.map = {tile_loc: unslotted_tile(tile) for tile_loc, tile in tilemap.map.items()}
+	tilemap.offgrid_tiles = [unslotted_tile(tile) for tile in tilemap.offgrid_tiles]
+	return tilemap
+
+
+def spawn_effects(game, rng, frame):
+	""" What the displayed game spawns in a busy frame: leaves falling from the trees, a shot every 20 frames
+		and a kill every 30, with their sparks and dust. Returns how many objects were created. """
+	created = 0
+	for rect in game.leaf_spawners:
+		if rng.random() * 49999 < rect[2] * rect[3]:
+			pos = (rect[0] + rng.random() * rect[2], rect[1] + rng.random() * rect[3])
+			game.spawn_particle("leaf", pos, [rng.random() * 0.1 - 0.2, rng.random() * 0.2 + 0.1], rng.randint(0, 17))
+			created += 1
+
+	center = (rng.random() * 300, rng.random() * 200)
+	if frame % 20 == 0:
+		game.projectiles.fire(center, 1.5)
+		for i in range(4):
+			game.spawn_spark(center, rng.random() - 0.5, rng.random() + 2)
+		created += 4
+
+	if frame % 30 == 0:
+		for i in range(20, 31):
+			angle = rng.random() * math.pi * 2
+			game.spawn_spark(center, angle, rng.random() * 2 + 2)
+			speed = rng.random() * 5
+			velocity = [math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5]
+			game.spawn_particle("dust", center, velocity=velocity, start_frame=rng.randint(0, 7))
+		created += 22
+
+	return created
+
+
+def update_effects(game):
+	for spark in game.sparks.copy():
+		if spark.update():
+			game.sparks.remove(spark)
+			game.spark_pool.release(spark)
+	for particle in game.particles.copy():
+		if particle.update():
+			game.particles.remove(particle)
+			game.particle_pool.release(particle)
+	game.projectiles.advance(game.tilemap)
+
+
+def benchmark_memory(frames=600, seed=0):
+	""" Measures what every map holds once loaded, what each entity and effect costs, and how much memory
+		the effects of a busy frame churn through. Maps and objects are measured both as they are and
+		copied into a __dict__ the way they were stored before __slots__, which tells what the slots save. """
+	game = HeadlessGame()
+	report = {"maps": {}, "objects": {}, "effects": {}}
+
+	for level_id in range(game.max_level + 1):
+		def load():
+			tilemap = Tilemap(game)
+			tilemap.load(f"assets/maps/{level_id}.json")
+			return tilemap
+		tilemap = load()
+		tiles = len(tilemap.map) + len(tilemap.offgrid_tiles)
+		size = traced_bytes(load)
+		unslotted_size = traced_bytes(lambda: unslot_tilemap(load()))
+		report["maps"][level_id] = {"tiles": tiles, "bytes": size, "unslotted_bytes": unslotted_size,
+									"bytes_per_tile": size / tiles if tiles else 0.0}
+
+	count = 1000
+	builders = {
+		"Tile": lambda i: Tile("grass", i % 9, (i, i)),
+		"Enemy": lambda i: Enemy(game, (i, i), (8, 15), id=f"enemy_{i}", client_id="server"),
+		"Spark": lambda i: Spark((i, i), 0.5, 2),
+		"Particle": lambda i: Particle(game, "dust", (i, i), velocity=[0.5, 0.5]),
+		"Cloud": lambda i: Cloud((i, i), None, 0.05, 0.5)
+	}
+	for name, build in builders.items():
+		report["objects"][name] = {
+			"slotted": traced_bytes(lambda: [build(i) for i in range(count)]) / count,
+			"unslotted": traced_bytes(lambda: [unslotted(build(i)) for i in range(count)]) / count
+		}
+
+	# Levels reload on every death in solo, once the pool holds the first try's enemies none are built anymore.
+	game.load_level(0)
+	built = game.enemy_pool.built
+	reloads = 20
+	for _ in range(reloads):
+		game.load_level(0)
+	report["reload"] = {"reloads": reloads, "enemies": len(game.enemies), "enemies_built": game.enemy_pool.built - built}
+
+	game.leaf_spawners = [(tree.pos[0] + 4, tree.pos[1] + 4, 23, 13) for tree in game.tilemap.extract([("large_decor", 2)], keep=True)]
+	rng = random.Random(seed)
+	created = 0
+	built = game.spark_pool.built + game.particle_pool.built
+	live = []
+	tracemalloc.start()
+	for frame in range(frames):
+		created += spawn_effects(game, rng, frame)
+		update_effects(game)
+		live.append(tracemalloc.get_traced_memory()[0])
+	tracemalloc.stop()
+
+	report["effects"] = {
+		"frames": frames,
+		"objects_per_frame": created / frames,
+		"built_per_frame": (game.spark_pool.built + game.particle_pool.built - built) / frames,
+		"live_bytes": {"mean": sum(live) / len(live) - live[0], "max": max(live) - live[0]}
+	}
+	# What the effects built within a frame took, at the measured size of each, the others came out of the pools.
+	sizes = report["objects"]
+	for layout in ("slotted", "unslotted"):
+		size = (sizes["Particle"][layout] + sizes["Spark"][layout]) / 2
+		report["effects"][f"{layout}_bytes_per_frame"] = report["effects"]["built_per_frame"] * size
+	return report
+
+
+def print_physics(report):
+	frame = report["frame_ms"]
+	print(f"[PHYSICS]: {report['entities']} entities, {report['frames']} frames.")
+	print(f"  Frame time (ms): mean={frame['mean']:.2f}  p50={frame['p50']:.2f}  p99={frame['p99']:.2f}  max={frame['max']:.2f}")
+	print(f"  Frame budget used: {report['budget_percent']:.0f}%")
+	print(f"  Peak memory allocated within a frame: {report['peak_bytes_per_frame']} bytes")
+
+
+def print_horde(report):
+	print(f"[HORDE]: {report['enemies']} enemies, {report['frames']} server ticks.")
+	for backend, frame in report["frame_ms"].items():
+		print(f"  {backend.capitalize():<8} tick time (ms): mean={frame['mean']:.2f}  p50={frame['p50']:.2f}  p99={frame['p99']:.2f}  max={frame['max']:.2f}")
+	if "speedup" in report:
+		print(f"  Batched physics speedup: {report['speedup']:.2f}x")
+	else:
+		print("  Batched physics skipped, NumPy is not installed.")
+
+
+def print_combat(report):
+	print(f"[COMBAT]: {report['players']} players against {report['enemies']} enemies and {report['projectiles']} projectiles, {report['frames']} frames.")
+	for name, frame in report["frame_ms"].items():
+		print(f"  {name.replace('_', ' ').capitalize():<13} frame time (ms): mean={frame['mean']:.2f}  p99={frame['p99']:.2f}")
+	print(f"  Spatial hash speedup: {report['speedup']:.1f}x")
+
+
+def print_projectiles(report):
+	print(f"[PROJECTILES]: {report['projectiles']} in flight at {report['speed']} px/frame, {report['players']} players, {report['frames']} frames.")
+	print(f"  Frame time (ms): mean={report['frame_ms']['mean']:.2f}  p99={report['frame_ms']['p99']:.2f}")
+	print(f"  Hits: {report['wall_hits']} walls, {report['player_hits']} players, {report['tunneled']} through a wall")
+
+
+def print_lod(report):
+	print(f"[ENEMY LOD]: {report['enemies_per_copy']} enemies per copy of the map, {report['players']} players, {report['frames']} server ticks.")
+	for count, every in report["tick_ms"]["every_enemy"].items():
+		counts = report["updated"][count]
+		print(f"  {count} cop{'y' if count == 1 else 'ies'}: every enemy={every:.2f} ms  scheduled={report['tick_ms']['scheduled'][count]:.2f} ms  "
+			f"(near={counts['near']} far={counts['far']} asleep={counts['asleep']} updated={counts['updated']})")
+
+
+def print_memory(report):
+	print("[MEMORY]: Resident size of each map once loaded, without -> with slots.")
+	for level_id, loaded in report["maps"].items():
+		print(f"  Map {level_id}: {loaded['tiles']:>5} tiles  {loaded['unslotted_bytes']:>8} -> {loaded['bytes']:>8} bytes  "
+			f"({loaded['bytes_per_tile']:.0f} bytes/tile)")
+	print("  Bytes per object: " + "  ".join(f"{name}={size['unslotted']:.0f}->{size['slotted']:.0f}" for name, size in report["objects"].items()))
+	effects = report["effects"]
+	print(f"  Effects: {effects['objects_per_frame']:.2f} objects/frame, {effects['built_per_frame']:.2f} built/frame, "
+		f"~{effects['unslotted_bytes_per_frame']:.0f} -> ~{effects['slotted_bytes_per_frame']:.0f} bytes/frame allocated, "
+		f"live mean={effects['live_bytes']['mean']:.0f} max={effects['live_bytes']['max']:.0f} bytes")
+	reload = report["reload"]
+	print(f"  Level reloads: {reload['reloads']} reloads of {reload['enemies']} enemies, {reload['enemies_built']} enemies built")
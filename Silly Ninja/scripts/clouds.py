@@ -2,6 +2,8 @@ import random
 
 
 class Cloud:
+	__slots__ = ("pos", "image", "speed", "depth")
+
 	def __init__(self, pos, image, speed, depth):
 		self.pos = list(pos)
 		self.image = image
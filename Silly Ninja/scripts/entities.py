@@ -3,7 +3,9 @@ import random
 import time
 import pygame
 
-from scripts.visual_effects import Particle, Projectile, Spark
+from scripts.tilemap import NEIGHBOR_OFFSETS
+from scripts.spatial_hash import SpatialHash
+from scripts.entity_pool import EntityPool
 from scripts.ui.ui_elements import Text
 
 
@@ -12,6 +14,10 @@ DARK_GOLDEN_ROD = pygame.Color("darkgoldenrod")
 
 
 class PhysicsEntity:
+	# Levels spawn entities by the dozen, without a __dict__ each one takes about half the memory.
+	__slots__ = ("id", "client_id", "game", "type", "pos", "size", "velocity", "last_movement", "collisions",
+				"animation", "action", "anim_offset", "facing_left")
+
 	def __init__(self, game, entity_type, pos, size, id="", client_id="solo"):
 		self.id = id
 		self.client_id = client_id
@@ -29,55 +35,106 @@ class PhysicsEntity:
 		self.facing_left = False
 
 
+	def reset(self, pos, id="", client_id="solo"):
+		""" Puts the entity back at 'pos' as if it was just built, for pooled entities. Its lists are written in place. """
+		self.id = id
+		self.client_id = client_id
+		self.pos[0], self.pos[1] = pos[0], pos[1]
+		self.velocity[0] = self.velocity[1] = 0
+		self.last_movement = (0, 0)
+		collisions = self.collisions
+		collisions["up"] = collisions["down"] = collisions["left"] = collisions["right"] = False
+		self.facing_left = False
+
+
 	def rect(self):
 		return pygame.Rect(self.pos[0], self.pos[1], self.size[0], self.size[1])
 
 
+	def resolve_axis(self, tilemap, axis, frame_movement, forward, backward):
+		""" Pushes the entity out of the physics tiles around it along one axis, returns its new coordinate on that axis.
+			Works on plain numbers and the tilemap's solidity grid, so that it allocates nothing per entity.
+			Positions snap to whole pixels on contact, the same way pygame.Rect truncates them. """
+		tile_size = tilemap.tile_size
+		width, height = self.size
+		left = int(self.pos[0])
+		top = int(self.pos[1])
+		cell_x = int(self.pos[0] // tile_size)
+		cell_y = int(self.pos[1] // tile_size)
+		coordinate = self.pos[axis]
+
+		# Tilemap.is_solid_cell(), inlined.
+		grid = tilemap.solid_grid
+		grid_width = tilemap.grid_width
+		grid_height = tilemap.grid_height
+		for offset_x, offset_y in NEIGHBOR_OFFSETS:
+			x = cell_x + offset_x - tilemap.grid_x
+			y = cell_y + offset_y - tilemap.grid_y
+			if x < 0 or y < 0 or x >= grid_width or y >= grid_height or not grid[y * grid_width + x]:
+				continue
+			tile_left = (cell_x + offset_x) * tile_size
+			tile_top = (cell_y + offset_y) * tile_size
+			if left < tile_left + tile_size and tile_left < left + width and top < tile_top + tile_size and tile_top < top + height:
+				if axis == 0:
+					if frame_movement > 0:
+						left = tile_left - width
+						self.collisions[forward] = True
+					if frame_movement < 0:
+						left = tile_left + tile_size
+						self.collisions[backward] = True
+					coordinate = left
+				else:
+					if frame_movement > 0:
+						top = tile_top - height
+						self.collisions[forward] = True
+					if frame_movement < 0:
+						top = tile_top + tile_size
+						self.collisions[backward] = True
+					coordinate = top
+
+		return coordinate
+
+
 	def set_action(self, action):
 		if self.action != action:
 			self.action = action
 			self.animation = self.game.assets[f"{self.type}/{self.action}"].copy()
 
 
+	def restart_action(self, action):
+		# Same as a fresh set_action(), reusing the animation if it's already the right one.
+		if self.action == action:
+			self.animation.restart()
+		else:
+			self.set_action(action)
+
+
 	def update(self, tilemap, movement=(0, 0)):
-		self.collisions = {"up": False, "down": False, "left": False, "right": False}
-		frame_movement = (movement[0] + self.velocity[0], movement[1] + self.velocity[1])
+		self.move(tilemap, movement)
+		self.animate(movement)
+
+
+	def move(self, tilemap, movement):
+		collisions = self.collisions
+		collisions["up"] = collisions["down"] = collisions["left"] = collisions["right"] = False
+		frame_movement_x = movement[0] + self.velocity[0]
+		frame_movement_y = movement[1] + self.velocity[1]
 
 		# Handle collision for the X axis.
-		self.pos[0] += frame_movement[0]
-		entity_rect = self.rect()
-		for rect in tilemap.physics_neighbor_rects(self.pos):
-			if entity_rect.colliderect(rect):
-				# Moving to the right and collide with something.
-				if frame_movement[0] > 0:
-					entity_rect.right = rect.left
-					self.collisions["right"] = True
-				# Moving to the left and collide with something.
-				if frame_movement[0] < 0:
-					entity_rect.left = rect.right
-					self.collisions["left"] = True
-				self.pos[0] = entity_rect.x
+		self.pos[0] += frame_movement_x
+		self.pos[0] = self.resolve_axis(tilemap, 0, frame_movement_x, "right", "left")
 
 		# Handle collision for the Y axis.
-		self.pos[1] += frame_movement[1]
-		entity_rect = self.rect()
-		for rect in tilemap.physics_neighbor_rects(self.pos):
-			if entity_rect.colliderect(rect):
-				# Moving down and collide with something.
-				if frame_movement[1] > 0:
-					entity_rect.bottom = rect.top
-					self.collisions["down"] = True
-				# Moving up and collide with something.
-				if frame_movement[1] < 0:
-					entity_rect.top = rect.bottom
-					self.collisions["up"] = True
-				self.pos[1] = entity_rect.y
+		self.pos[1] += frame_movement_y
+		self.pos[1] = self.resolve_axis(tilemap, 1, frame_movement_y, "down", "up")
 
 		# Handle gravity.
 		self.velocity[1] = min(5, self.velocity[1] + 0.1)
 		if self.collisions["down"] or self.collisions["up"]:
 			self.velocity[1] = 0
 
+
+	def animate(self, movement):
 		# Update the animation.
 		if movement[0] > 0:
 			self.facing_left = False
@@ -94,11 +151,17 @@ class PhysicsEntity:
 
 
 class Enemy(PhysicsEntity):
+	__slots__ = ("walking", "is_dead", "fired", "in_view", "batch_slot", "span", "sight_lines")
+
 	def __init__(self, game, pos, size, id="", client_id="solo"):
 		super().__init__(game, "enemy", pos, size, id=id, client_id=client_id)
 		self.walking = 0
 		self.is_dead = False
 		self.fired = False
+		self.in_view = True  # Whether the server replicates it at full rate to this client.
+		self.batch_slot = None  # Its row in the EnemyBatch moving it, if any.
+		self.span = None  # The walkable span under its front the last time it looked.
+		self.sight_lines = None  # {player_id: (muzzle cell, row, target cell, clear)} of the lines of fire it checked.
 		self.set_action("idle")
 
 
@@ -106,21 +169,89 @@ class Enemy(PhysicsEntity):
 		return f"Enemy: [ID={self.id:<12}, Client_ID={self.client_id:<9}, IS_DEAD={self.is_dead!s:<5}]"
 
 
+	def reset(self, game, pos, size, id="", client_id="solo"):
+		self.game = game
+		self.size = size
+		super().reset(pos, id=id, client_id=client_id)
+		self.walking = 0
+		self.is_dead = False
+		self.fired = False
+		self.in_view = True
+		self.batch_slot = None
+		self.span = None
+		if self.sight_lines is not None:
+			self.sight_lines.clear()
+		self.restart_action("idle")
+
+
+	def ground_ahead(self, tilemap):
+		""" Whether there's ground right in front of the enemy's feet. Patrolling enemies probe the same span of ground for many
+			frames in a row, so the grid is only looked at once the probe leaves the span it last found. """
+		x = int(self.pos[0]) + self.size[0] // 2 + (-7 if self.facing_left else 7)
+		y = self.pos[1] + 23
+		span = self.span
+		if span is not None and span.left <= x < span.right and span.top <= y < span.bottom:
+			return True
+
+		self.span = tilemap.span_at((x, y))
+		# Walls are solid too, without being the top of any span.
+		return self.span is not None or tilemap.solid_check((x, y))
+
+
+	def find_target(self):
+		""" The closest player in the enemy's line of fire, looked up in the players' spatial hash. """
+		x, y = self.pos
+		# Any player less than 16 pixels above or below has their box in this band, as far as the players go on the facing side.
+		if self.facing_left:
+			candidates = self.game.players.in_box(-math.inf, y - 17, x + 1, y + 17)
+		else:
+			candidates = self.game.players.in_box(x - 1, y - 17, math.inf, y + 17)
+
+		target = None
+		for player in candidates:
+			dist = (player.pos[0] - x, player.pos[1] - y)
+			if abs(dist[1]) < 16 and (dist[0] < 0 if self.facing_left else dist[0] > 0):
+				if target is None or abs(dist[0]) < abs(target.pos[0] - x):
+					target = player
+		return target
+
+
+	def has_line_of_fire(self, player, muzzle):
+		""" Whether a projectile fired from 'muzzle' gets to the player's column without hitting a wall first.
+			Projectiles fly along a row, so the answer only depends on the cells at both ends, and holds until either changes. """
+		target_x = player.rect().centerx
+		tile_size = self.game.tilemap.tile_size
+		key = (int(muzzle[0] // tile_size), int(muzzle[1] // tile_size), target_x // tile_size)
+		if self.sight_lines is None:
+			self.sight_lines = {}
+
+		line = self.sight_lines.get(player.id)
+		if line is None or line[:3] != key:
+			line = key + (self.game.tilemap.raycast(muzzle, (target_x, muzzle[1])) is None,)
+			self.sight_lines[player.id] = line
+		return line[3]
+
+
 	def fire_projectile(self, player):
 		dist = (player.pos[0] - self.pos[0], player.pos[1] - self.pos[1])
 		if abs(dist[1]) < 16:
+			# Nothing's fired at a player behind a wall, the projectile would only burst against it.
 			if self.facing_left and dist[0] < 0:
-				bullet = Projectile(self.game, (self.rect().centerx - 7, self.rect().centery), -1.5, alive_time=0)
-				self.game.projectiles.append(bullet)
+				muzzle = (self.rect().centerx - 7, self.rect().centery)
+				if not self.has_line_of_fire(player, muzzle):
+					return False
+				self.game.projectiles.fire(muzzle, -1.5)
 				self.game.sounds["shoot"].play()
 				for i in range(4):
-					self.game.sparks.append(Spark(bullet.pos, random.random() - 0.5 + math.pi, random.random() + 2))
+					self.game.spawn_spark(muzzle, random.random() - 0.5 + math.pi, random.random() + 2)
 			if not self.facing_left and dist[0] > 0:
-				bullet = Projectile(self.game, (self.rect().centerx + 7, self.rect().centery), 1.5, alive_time=0)
-				self.game.projectiles.append(bullet)
+				muzzle = (self.rect().centerx + 7, self.rect().centery)
+				if not self.has_line_of_fire(player, muzzle):
+					return False
+				self.game.projectiles.fire(muzzle, 1.5)
 				self.game.sounds["shoot"].play()
 				for i in range(4):
-					self.game.sparks.append(Spark(bullet.pos, random.random() - 0.5, random.random() + 2))
+					self.game.spawn_spark(muzzle, random.random() - 0.5, random.random() + 2)
 			return True
 
 		return False
@@ -133,22 +264,29 @@ class Enemy(PhysicsEntity):
 				self.game.sounds["hit"].play()
 				for i in range(20, 31):
 					angle = random.random() * math.pi * 2
-					self.game.sparks.append(Spark(self.rect().center, angle, random.random() * 2 + 2))
+					self.game.spawn_spark(self.rect().center, angle, random.random() * 2 + 2)
 
 					speed = random.random() * 5
 					velocity = [math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5]
-					self.game.particles.append(Particle(self.game, "dust", self.rect().center, velocity=velocity, start_frame=random.randint(0, 7)))
-				self.game.sparks.append(Spark(self.rect().center, 0, random.random() + 5))
-				self.game.sparks.append(Spark(self.rect().center, math.pi, random.random() + 5))
+					self.game.spawn_particle("dust", self.rect().center, velocity=velocity, start_frame=random.randint(0, 7))
+				self.game.spawn_spark(self.rect().center, 0, random.random() + 5)
+				self.game.spawn_spark(self.rect().center, math.pi, random.random() + 5)
 
 				self.is_dead = True
 
 
 	def update(self, tilemap, movement=(0, 0), walking=0, facing_left=False):
+		movement = self.think(tilemap, movement=movement, walking=walking, facing_left=facing_left)
+		super().update(tilemap, movement=movement)
+		return self.react(movement)
+
+
+	def think(self, tilemap, movement=(0, 0), walking=0, facing_left=False):
+		""" Decides where the enemy goes this frame, returns its movement. """
 		# Continue previous movement, if doesn't finish yet.
 		if self.walking:
 			# Check for flipping against ground and wall tiles in front of the moving direction.
-			if tilemap.solid_check((self.rect().centerx + (-7 if self.facing_left else 7), self.pos[1] + 23)):
+			if self.ground_ahead(tilemap):
 				if self.collisions["right"] or self.collisions["left"]:
 					self.facing_left = not self.facing_left
 				else:
@@ -160,9 +298,9 @@ class Enemy(PhysicsEntity):
 			self.walking = max(self.walking - 1, 0)
 			if not self.walking:
 				if self.client_id != "solo":
-					for player in self.game.entities[:4]:
-						if self.fire_projectile(player):
-							break
+					target = self.find_target()
+					if target is not None:
+						self.fire_projectile(target)
 				else:
 					self.fire_projectile(self.game.get_main_player())
 		
@@ -176,8 +314,11 @@ class Enemy(PhysicsEntity):
 			self.walking = walking
 			self.facing_left = facing_left
 
-		super().update(tilemap, movement=movement)
+		return movement
+
 
+	def react(self, movement):
+		""" Follows up on this frame's move, returns whether the enemy died. """
 		# Handle the animation transitions.
 		if movement[0] != 0:
 			self.set_action("run")
@@ -186,9 +327,8 @@ class Enemy(PhysicsEntity):
 
 		# Dies if takes damage from the players' dashes or was dead on other clients' machines.
 		if self.client_id != "solo":
-			for player in self.game.entities[:4]:
-				if self.check_for_dead(player):
-					break
+			for player in self.game.players.overlapping(self.rect()):
+				self.check_for_dead(player)
 		else:
 			self.check_for_dead(self.game.get_main_player())
 
@@ -209,6 +349,9 @@ class Enemy(PhysicsEntity):
 
 
 class Player(PhysicsEntity):
+	__slots__ = ("air_time", "jump_count", "dashing", "wall_slide", "jumped", "died",
+				"player_name", "name_text", "text_offset", "initialized", "ready")
+
 	def __init__(self, player_name, game, pos, size, id="", client_id="solo"):
 		super().__init__(game, "player", pos, size, id=id, client_id=client_id)
 		self.air_time = 0
@@ -229,6 +372,29 @@ class Player(PhysicsEntity):
 			self.set_action("idle")
 
 
+	def reset(self, player_name, game, pos, size, id="", client_id="solo"):
+		# The name tag is kept, building one looks up its font.
+		self.game = game
+		self.size = size
+		super().reset(pos, id=id, client_id=client_id)
+		self.air_time = 0
+		self.jump_count = 1
+		self.dashing = 0
+
+		self.wall_slide = False
+		self.jumped = False
+		self.died = False
+
+		self.player_name = player_name
+		self.name_text.set_text(self.player_name)
+		self.name_text.color = DARK_SLATE_GRAY
+		self.initialized = False
+		self.ready = False
+
+		if self.client_id == "solo":
+			self.restart_action("idle")
+
+
 	def __repr__(self):
 		return (f"Player: [ID={self.id:<12}, Client_ID={self.client_id:<9}, Nickname={self.player_name:^20}, " +
 				f"Initialized={self.initialized!s:<5}, Ready={self.ready!s:<5}]")
@@ -295,7 +461,7 @@ class Player(PhysicsEntity):
 				angle = random.random() * math.pi * 2
 				speed = random.random() * 0.5 + 0.5
 				p_velocity = [math.cos(angle) * speed, math.sin(angle) * speed]
-				self.game.particles.append(Particle(self.game, "dust", self.rect().center, velocity=p_velocity, start_frame=random.randint(0, 7)))
+				self.game.spawn_particle("dust", self.rect().center, velocity=p_velocity, start_frame=random.randint(0, 7))
 		
 		if self.dashing > 0:  # Dash to the right.
 			self.dashing = max(self.dashing - 1, 0)
@@ -312,7 +478,7 @@ class Player(PhysicsEntity):
 
 			# A stream of particles following the dash.
 			p_velocity = [abs(self.dashing) / self.dashing * random.random() * 3, 0]
-			self.game.particles.append(Particle(self.game, "dust", self.rect().center, velocity=p_velocity, start_frame=random.randint(0, 7)))
+			self.game.spawn_particle("dust", self.rect().center, velocity=p_velocity, start_frame=random.randint(0, 7))
 
 		# Gradually reduce horizontal movement to 0.
 		if self.velocity[0] > 0:
@@ -374,4 +540,123 @@ class Player(PhysicsEntity):
 	def dash(self):
 		if not self.dashing and not self.died:
 			self.game.sounds["dash"].play()
-			self.dashing = -60 if self.facing_left else 60
\ No newline at end of file
+			self.dashing = -60 if self.facing_left else 60
+
+
+class PlayerRegistry:
+	""" The players of a multiplayer session, by the index of their client on the server.
+		Players only exist while their client is connected, so iterating over them costs nothing for empty slots. """
+	def __init__(self, game):
+		self.game = game
+		self.players = {}  # {index: Player}
+		self.members = ()  # Players sorted by index, safe to iterate while the network thread updates the registry.
+		# Where the players stood the last time they were indexed, combat looks them up here instead of testing each one.
+		self.grid = SpatialHash()
+		# Players of the clients that left, reused for the next ones to join.
+		self.pool = EntityPool(Player)
+
+
+	def __repr__(self):
+		return "\n".join(map(str, self.members))
+
+
+	def __len__(self):
+		return len(self.members)
+
+
+	def __iter__(self):
+		return iter(self.members)
+
+
+	def __contains__(self, index):
+		return index in self.players
+
+
+	def __getitem__(self, index):
+		return self.players[index]
+
+
+	@staticmethod
+	def index_of(player_id):
+		# Player IDs on the wire are 1-based: "player_1", "player_2",...
+		return int(player_id.rsplit("_", 1)[1]) - 1
+
+
+	def get(self, index):
+		return self.players.get(index)
+
+
+	def by_id(self, player_id):
+		player = self.players.get(self.index_of(player_id))
+		return player if player is not None and player.id == player_id else None
+
+
+	def refresh(self):
+		self.members = tuple(player for _, player in sorted(self.players.items()))
+		self.index_positions()
+
+
+	def index_positions(self):
+		""" Rebuilds the spatial hash of the players, to be called once they moved and before checking hits against them.
+			Players join and leave on the network threads while the simulation indexes them on its own, so every call fills
+			a hash of its own and only then swaps it in: a thread still querying the previous one is never caught halfway. """
+		grid = SpatialHash()
+		for player in self.members:
+			grid.insert(player, player.rect())
+		self.grid = grid
+
+
+	def at_point(self, pos):
+		return self.grid.at_point(pos)
+
+
+	def overlapping(self, rect):
+		return self.grid.overlapping(rect)
+
+
+	def in_box(self, left, top, right, bottom):
+		return self.grid.in_box(left, top, right, bottom)
+
+
+	def register(self, index, nickname, client_id, player_id, re_initialized=False):
+		# Reuse the player already in that slot, so it keeps its state when only its identity changes.
+		player = self.players.get(index)
+		if player is None:
+			player = self.pool.acquire(nickname, self.game, self.game.spawn_pos, (8, 15), id=player_id, client_id="")
+			re_initialized = True
+
+		player.initialize_client(nickname, client_id=client_id, player_id=player_id, re_initialized=re_initialized)
+		self.players[index] = player
+		self.refresh()
+		return player
+
+
+	def unregister(self, index):
+		""" Removes a player, the ones after it move up a slot just like their clients do on the server. """
+		player = self.players.pop(index, None)
+		if player is None:
+			return
+		self.pool.release(player)
+
+		players = {}
+		for i, player in sorted(self.players.items()):
+			if i > index:
+				i -= 1
+				if player.id != "main_player":
+					player.id = f"player_{i + 1}"
+			players[i] = player
+
+		self.players = players
+		self.refresh()
+
+
+	def truncate(self, count):
+		self.pool.release_all(player for i, player in self.players.items() if i >= count)
+		self.players = {i: player for i, player in self.players.items() if i < count}
+		self.refresh()
+
+
+	def clear(self):
+		self.pool.release_all(self.players.values())
+		self.players = {}
+		self.refresh()
@@ -0,0 +1,30 @@
+class EntityPool:
+	""" Keeps the entities or effects a game is done with, and hands them out again instead of building new ones.
+		Pooled classes have a reset() taking the same arguments as their constructor, which puts the object back
+		the way the constructor would have built it while keeping what it already allocated (animations, texts, lists). """
+	def __init__(self, factory):
+		self.factory = factory
+		self.free = []
+		self.built = 0  # How many objects it had to build, the rest of what it handed out was reused.
+
+
+	def __len__(self):
+		return len(self.free)
+
+
+	def acquire(self, *args, **kwargs):
+		if self.free:
+			item = self.free.pop()
+			item.reset(*args, **kwargs)
+			return item
+
+		self.built += 1
+		return self.factory(*args, **kwargs)
+
+
+	def release(self, item):
+		self.free.append(item)
+
+
+	def release_all(self, items):
+		self.free.extend(items)
@@ -0,0 +1,108 @@
+SLOT_BITS = 20  # Handles keep the slot in their low bits and its generation above, room for a million entities at once.
+SLOT_MASK = (1 << SLOT_BITS) - 1
+
+
+class EntityStore:
+	""" The entities of a kind, in a dense list that's iterated as is, each also reachable in O(1) by its handle or its ID.
+		A handle is an integer made of a slot and the generation of that slot. Removing an entity moves the last one into
+		its place instead of shifting all the ones after it, and bumps the generation of its slot so that handles kept
+		to it stop resolving, rather than pointing to whichever entity gets the slot next.
+		The dense list changes in place, other threads should iterate over a copy of it. """
+	def __init__(self):
+		self.items = []  # The entities, in no particular order.
+		self.handles = []  # The handle of each entity, in the same order.
+		self.positions = []  # Where the entity of each slot sits in the dense list, -1 for a free slot.
+		self.generations = []
+		self.free_slots = []
+		self.ids = {}  # {entity_ID: handle}
+
+
+	def __len__(self):
+		return len(self.items)
+
+
+	def __iter__(self):
+		return iter(self.items)
+
+
+	def __contains__(self, handle):
+		return self.position_of(handle) is not None
+
+
+	def position_of(self, handle):
+		slot = handle & SLOT_MASK
+		if slot < len(self.generations) and self.generations[slot] == handle >> SLOT_BITS and self.positions[slot] >= 0:
+			return self.positions[slot]
+		return None
+
+
+	def add(self, entity):
+		""" Stores an entity under its ID, returns its handle. """
+		if self.free_slots:
+			slot = self.free_slots.pop()
+		else:
+			slot = len(self.generations)
+			self.generations.append(0)
+			self.positions.append(-1)
+
+		handle = self.generations[slot] << SLOT_BITS | slot
+		self.positions[slot] = len(self.items)
+		self.items.append(entity)
+		self.handles.append(handle)
+		self.ids[entity.id] = handle
+		return handle
+
+
+	def get(self, handle):
+		position = self.position_of(handle)
+		return self.items[position] if position is not None else None
+
+
+	def handle_of(self, entity_id):
+		return self.ids.get(entity_id)
+
+
+	def find(self, entity_id):
+		handle = self.ids.get(entity_id)
+		return self.get(handle) if handle is not None else None
+
+
+	def remove(self, handle):
+		""" Removes the entity behind a handle and returns it, None if it was already gone. """
+		position = self.position_of(handle)
+		if position is None:
+			return None
+
+		entity = self.items[position]
+		# The last entity fills the hole, then the list drops its last item.
+		last, last_handle = self.items[-1], self.handles[-1]
+		self.items[position] = last
+		self.handles[position] = last_handle
+		self.positions[last_handle & SLOT_MASK] = position
+		self.items.pop()
+		self.handles.pop()
+
+		slot = handle & SLOT_MASK
+		self.positions[slot] = -1
+		self.generations[slot] += 1
+		self.free_slots.append(slot)
+		if self.ids.get(entity.id) == handle:
+			del self.ids[entity.id]
+		return entity
+
+
+	def discard(self, entity_id):
+		""" Removes the entity with that ID and returns it, None if there's none. """
+		handle = self.ids.get(entity_id)
+		return self.remove(handle) if handle is not None else None
+
+
+	def clear(self):
+		for handle in self.handles:
+			slot = handle & SLOT_MASK
+			self.positions[slot] = -1
+			self.generations[slot] += 1
+			self.free_slots.append(slot)
+		self.items.clear()
+		self.handles.clear()
+		self.ids.clear()
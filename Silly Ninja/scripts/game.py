@@ -3,19 +3,24 @@ import random
 import sys
 import os
 import math
-import time
 import threading
 
 from scripts.tilemap import Tilemap
-from scripts.entities import Player, Enemy
+from scripts.entities import Player, Enemy, PlayerRegistry
 from scripts.clouds import Clouds
 from scripts.visual_effects import Particle, Spark
+from scripts.entity_pool import EntityPool
+from scripts.entity_store import EntityStore
+from scripts.projectiles import ProjectilePool
+from scripts.world import WorldMixin
+from scripts.session import SessionMixin
 from scripts.animation import Animation
 from scripts.utils import load_image, load_images, fade_out
-from scripts.socket.client import GameClient, MAX_CLIENT_COUNT
+from scripts.socket.client import GameClient
+from scripts.socket.handshake import Handshake, format_latency
 
 
-class GameBase:
+class GameBase(WorldMixin):
 	def __init__(self, clock, screen, outline_display, normal_display):
 		self.clock = clock
 		self.screen = screen
@@ -65,6 +70,14 @@ class GameBase:
 		self.clouds = Clouds(self.assets["clouds"], count=16)
 
 		self.tilemap = Tilemap(self, 16)
+		# Reused from a level to the next, it keeps the slots it grew to.
+		self.projectiles = ProjectilePool()
+		self.particles = []
+		self.sparks = []
+		# Enemies and effects that are done with go back to these, the next ones are taken out of them rather than built.
+		self.enemy_pool = EntityPool(Enemy)
+		self.spark_pool = EntityPool(Spark)
+		self.particle_pool = EntityPool(Particle)
 
 		self.movement = [False, False]
 
@@ -81,9 +94,7 @@ class GameBase:
 		for tree in self.tilemap.extract([("large_decor", 2)], keep=True):
 			self.leaf_spawners.append(pygame.Rect(tree.pos[0] + 4, tree.pos[1] + 4, 23, 13))
 
-		self.particles = []
-		self.projectiles = []
-		self.sparks = []
+		self.clear_effects()
 
 		self.camera_scroll = [0, 0]
 		self.dead = 0
@@ -106,7 +117,7 @@ class GameBase:
 				pos = (rect.x + random.random() * rect.width, rect.y + random.random() * rect.height)
 				velocity = [random.random() * 0.1 - 0.2, random.random() * 0.2 + 0.1]
 				start_frame = random.randint(0, 17)
-				self.particles.append(Particle(self, "leaf", pos, velocity, start_frame))
+				self.spawn_particle("leaf", pos, velocity, start_frame)
 
 		# Render clouds.
 		self.clouds.update()
@@ -123,6 +134,7 @@ class GameBase:
 			spark.render(self.outline_display, offset=render_scroll)
 			if died:
 				self.sparks.remove(spark)
+				self.spark_pool.release(spark)
 
 		# Render the outline for sprites.
 		display_mask = pygame.mask.from_surface(self.outline_display)
@@ -138,6 +150,7 @@ class GameBase:
 				particle.pos[0] += math.sin(particle.animation.frame * 0.035) * (random.random() * 0.3 + 0.2)
 			if died:
 				self.particles.remove(particle)
+				self.particle_pool.release(particle)
 
 
 	def handle_level_transition(self):
@@ -150,100 +163,82 @@ class GameBase:
 			self.outline_display.blit(transition_surf, (0, 0))
 
 
-# The list of player serves as a template for each client.
-PLAYERS = [
-	Player("unnamed_player_1", None, (50, 50), (8, 15), id="player_1", client_id=""),
-	Player("unnamed_player_2", None, (50, 50), (8, 15), id="player_2", client_id=""),
-	Player("unnamed_player_3", None, (50, 50), (8, 15), id="player_3", client_id=""),
-	Player("unnamed_player_4", None, (50, 50), (8, 15), id="player_4", client_id="")
-]
-
-
-class MultiplayerGameBase(GameBase):
+class MultiplayerGameBase(SessionMixin, GameBase):
 	def initialize(self):
-		# First 4 elements are players.
-		self.entities = PLAYERS.copy()
-		for player in self.entities:
-			player.game = self
+		# Players are registered as clients join, enemies are spawned by each level.
+		self.players = PlayerRegistry(self)
+		# Enemies by handle and by ID, so that state records don't have to search for them. 'enemies' is its dense list.
+		self.enemy_store = EntityStore()
+		self.enemies = self.enemy_store.items
 
 		self.level_id = 0
 		self.player_index = -1
 		self.client = None
 		self.connected = False
 		self.spawn_pos = (0, 0)
+		self.join_summary = ""  # How long joining took, shown in the lobby.
 
 
 	def get_player_name(self):
 		return self.client.nickname
 
 
-	def get_main_player(self):
-		return self.entities[self.player_index]
-
-
 	def respawn(self):
 		self.get_main_player().respawn(self.spawn_pos)
-		self.particles.clear()
-		self.projectiles.clear()
-		self.sparks.clear()
+		self.clear_effects()
 
 		self.camera_scroll = [0, 0]
 		self.dead = 0
 		self.transition = -30
 
 
-	def ready_for_launch(self):
-		for i in range(MAX_CLIENT_COUNT):
-			self.entities[i].ready = self.entities[i].initialized
-
-
-	""" Initialize the all previously connected clients' players if the connection is made the frist time.
-		Or if the server forces re-initialization.
-		Otherwise, initialize just the newly connected client."""
-	def on_connection_made(self, player_index, nicknames, client_ids, re_initialized=False):
-		if not self.connected or re_initialized:
-			self.player_index = player_index
-			
-			main_player = self.get_main_player()
-			for i in range(MAX_CLIENT_COUNT):
-				if i == self.player_index:
-					main_player.initialize_client(nicknames[i], client_id=client_ids[i],
-											player_id="main_player", re_initialized=re_initialized)
-				elif i < len(nicknames):
-					self.entities[i].initialize_client(nicknames[i], client_id=client_ids[i],
-											player_id=f"player_{i + 1}", re_initialized=re_initialized)
-				else:
-					self.entities[i].unregister_client(i)
-			self.connected = True
-		else:
-			self.entities[player_index].initialize_client(nicknames[player_index],
-										client_id=client_ids[player_index], player_id=f"player_{player_index + 1}")
-		
-		print("\n".join(map(str, self.entities)), end="\n\n")
-
-
 	def load_level(self, id):
 		super().load_level(id)
+		self.clear_enemies()
 		enemy_count = 1
 		for spawner in self.tilemap.extract([("spawners", 0), ("spawners", 1)]):
 			if spawner.variant == 0:
-				# Set the spawn position for all 4 players at once.
+				# Set the spawn position for all players at once.
 				self.spawn_pos = tuple(spawner.pos)
-				for i in range(MAX_CLIENT_COUNT):
-					self.entities[i].pos = list(self.spawn_pos)
-					self.entities[i].air_time = 0
+				for player in self.players:
+					player.pos = list(self.spawn_pos)
+					player.air_time = 0
 			else:
-				self.entities.append(Enemy(self, spawner.pos, (8, 15), id=f"enemy_{enemy_count}", client_id=self.client.client_id))
+				self.spawn_enemy(self.enemy_pool.acquire(self, spawner.pos, (8, 15), id=f"enemy_{enemy_count}", client_id=self.client.client_id))
 				enemy_count += 1
 
 
+	def join_session(self, handshake):
+		""" Connects the client and waits for the server to take it in, returns whether it did. """
+		if not self.client.connect():
+			return handshake.fail("ERROR", "Failed to make connection, check IP and port.")
+
+		handshake.enter("JOINING", "Connected, joining lobby...")
+		if not handshake.wait(self.client.handshake_done):
+			return handshake.fail("TIMED OUT", "The server didn't answer, try again.")
+		if not self.connected:
+			return handshake.fail("FAILED", self.client.join_error or "The server closed the connection.")
+
+		self.join_summary = format_latency(self.client, handshake)
+		return True
+
+
+	def launch_session(self, status_text, set_buttons_interactable):
+		handshake = Handshake(status_text)
+		handshake.enter("LAUNCHING", "Starting game session...")
+		set_buttons_interactable(False)
+		self.client.send_manually("*[START GAME]|")
+		if not handshake.wait(self.client.session_started):
+			handshake.fail("TIMED OUT", "The server didn't start the session, try again.")
+		set_buttons_interactable(True)
+
+
 	def disconnect_from_server(self):
 		self.running = False
 		self.connected = False
-		for i in range(MAX_CLIENT_COUNT):
-			self.entities[i].unregister_client(i)
 		self.client.disconnect()
-		self.entities.clear()
+		self.players.clear()
+		self.clear_enemies()
 
 
 	def run(self):
@@ -255,38 +250,25 @@ class GameForHost(MultiplayerGameBase):
 	def initialize(self, server, host_ip, port, nickname):
 		super().initialize()
 		self.server = server
-		self.client = GameClient(self, "host", ip=host_ip, port=port, nickname=nickname)
+		self.client = GameClient(self, "host", ip=host_ip, port=port, nickname=nickname, transport=server.transport)
 
 
 	def start_server(self, status_text, set_buttons_interactable):
-		status_text.set_text("[STARTING]: Initializing LAN server...")
+		handshake = Handshake(status_text)
+		handshake.enter("STARTING", "Initializing LAN server...")
 		set_buttons_interactable(False)
 		threading.Thread(target=self.server.start_server).start()
-		time.sleep(4)
 		
-		if self.server.running:
-			status_text.set_text("[CREATING]: Server started, creating lobby...")
-			threading.Thread(target=self.client.connect).start()
-			time.sleep(4)
-			
-			if self.connected:
-				status_text.set_text("[JOINING]: Lobby created, joining...")
-				time.sleep(2)
-				status_text.set_text(f"[JOINED]: You've hosted and joined the lobby as \"{self.client.nickname}\"")
-				self.client.send_manually(f"*[PLAYER READY]")
-			else:
-				status_text.set_text("[ERROR]: Failed to make connection, check IP and port.")
+		if not handshake.wait(self.server.bound):
+			handshake.fail("TIMED OUT", "Server failed to start, check IP and port.")
+		elif not self.server.running:
+			handshake.fail("ERROR", "Server failed to start, check IP and port.")
 		else:
-			status_text.set_text("[TIMED OUT]: Server failed to start, check IP and port.")
-
-		set_buttons_interactable(True)
-
+			handshake.enter("CREATING", "Server started, creating lobby...")
+			if self.join_session(handshake):
+				handshake.enter("JOINED", f"You've hosted and joined the lobby as \"{self.client.nickname}\"")
+				self.client.send_manually(f"*[PLAYER READY]")
 
-	def launch_session(self, status_text, set_buttons_interactable):
-		status_text.set_text("[LAUNCHING]: Starting game session...")
-		set_buttons_interactable(False)
-		time.sleep(3)
-		self.client.send_manually("*[START GAME]")
 		set_buttons_interactable(True)
 
 
@@ -294,13 +276,17 @@ class GameForHost(MultiplayerGameBase):
 		super().run()
 
 		while self.running and self.connected:
+			self.process_network()
+			if not self.running:
+				return
+
 			self.outline_display.fill((0, 0, 0, 0))
 			self.normal_display.blit(self.assets["background"], (0, 0))
 
 			self.screenshake = max(self.screenshake - 1, 0)
 
 			# Handle level transitions.
-			if not len(self.entities[4:]) and self.level_id < self.max_level:
+			if not len(self.enemies) and self.level_id < self.max_level:
 				self.transition += 1
 				if self.transition > 30:
 					print("Entering the next level...")
@@ -325,7 +311,8 @@ class GameForHost(MultiplayerGameBase):
 			self.render_terrain(render_scroll)
 
 			# Update and render the enemies on the main loop, only for the host.
-			for enemy in self.entities[4:]:
+			self.players.index_positions()
+			for enemy in self.enemies.copy():
 				enemy.update(self.tilemap, movement=(0, 0))
 				enemy.render(self.outline_display, offset=render_scroll)
 
@@ -334,43 +321,33 @@ class GameForHost(MultiplayerGameBase):
 				self.get_main_player().update(self.tilemap, movement=(self.movement[1] - self.movement[0], 0))
 				self.get_main_player().render(self.outline_display, offset=render_scroll)
 			
-			for player in self.entities[:4]:
+			for player in self.players:
 				if player.initialized and player.id != "main_player" and not player.died:
 					player.render(self.outline_display, offset=render_scroll)
 
-			# Render the gun projectiles.
-			for projectile in self.projectiles.copy():
-				# [[x, y], direction, alive_time]
-				projectile.update()
-				projectile.render(self.outline_display, offset=render_scroll)
-				if self.tilemap.solid_check(projectile.pos):
-					self.projectiles.remove(projectile)
-					for i in range(4):
-						self.sparks.append(Spark(projectile.pos, random.random() - 0.5 + (math.pi if projectile.direction > 0 else 0), random.random() + 2))
-				elif projectile.alive_time > 360:
-					self.projectiles.remove(projectile)
+			# Update and render the gun projectiles, the players just moved.
+			self.players.index_positions()
+			for x, y, direction in self.projectiles.advance(self.tilemap):
+				for i in range(4):
+					self.spawn_spark((x, y), random.random() - 0.5 + (math.pi if direction > 0 else 0), random.random() + 2)
+			self.projectiles.render(self.outline_display, self.assets["projectile"], offset=render_scroll)
+
+			# Check if any player gets shot.
+			for player in self.projectiles.hits(self.players, lambda player: abs(player.dashing) < 50):
+				self.sounds["hit"].play()
+				if player.id == "main_player":
+					self.get_main_player().died = True
+					self.dead += 1
+					self.screenshake = max(self.screenshake, 16)
 				
-				# Check if any player gets shot.
-				else:
-					for player in self.entities[:4]:
-						if abs(player.dashing) < 50 and player.rect().collidepoint(projectile.pos):
-							self.projectiles.remove(projectile)
-							self.sounds["hit"].play()
-							if player.id == "main_player":
-								self.get_main_player().died = True
-								self.dead += 1
-								self.screenshake = max(self.screenshake, 16)
-							
-							# Generate sparks and dust.
-							for i in range(30):
-								angle = random.random() * math.pi * 2
-								self.sparks.append(Spark(player.rect().center, angle, random.random() + 2))
-
-								speed = random.random() * 5
-								velocity = [math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5]
-								self.particles.append(Particle(self, "dust", player.rect().center,
-																velocity=velocity, start_frame=random.randint(0, 7)))
-							break
+				# Generate sparks and dust.
+				for i in range(30):
+					angle = random.random() * math.pi * 2
+					self.spawn_spark(player.rect().center, angle, random.random() + 2)
+
+					speed = random.random() * 5
+					velocity = [math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5]
+					self.spawn_particle("dust", player.rect().center, velocity=velocity, start_frame=random.randint(0, 7))
 
 			self.render_effects(render_scroll)
 
@@ -409,7 +386,7 @@ class GameForHost(MultiplayerGameBase):
 			self.normal_display.blit(self.outline_display, (0, 0))
 
 			# Render the players' name tags over anything else.
-			for player in self.entities[:4]:
+			for player in self.players:
 				if player.initialized and not player.died:
 					player.render_name_tag(self.normal_display, offset=render_scroll)
 
@@ -417,29 +394,27 @@ class GameForHost(MultiplayerGameBase):
 			screenshake_offset = (random.random() * self.screenshake - self.screenshake / 2, random.random() * self.screenshake - self.screenshake / 2)
 			self.screen.blit(pygame.transform.scale(self.normal_display, self.screen.get_size()), screenshake_offset)
 			
+			# The send thread picks up this frame's state from here.
+			self.client.publish_state()
+
 			pygame.display.update()
 			self.clock.tick(60)
 
 
 class GameForClient(MultiplayerGameBase):
-	def initialize(self, host_ip, port, nickname):
+	def initialize(self, host_ip, port, nickname, transport="tcp", room=""):
 		super().initialize()
-		self.client = GameClient(self, "client_unverified", ip=host_ip, port=port, nickname=nickname)
+		self.client = GameClient(self, "client_unverified", ip=host_ip, port=port, nickname=nickname, transport=transport, room=room)
 
 
 	def join_lobby(self, status_text, set_buttons_interactable):
-		status_text.set_text("[CONNECTING]: Attempting to connect to server...")
+		handshake = Handshake(status_text)
+		handshake.enter("CONNECTING", "Attempting to connect to server...")
 		set_buttons_interactable(False)
-		threading.Thread(target=self.client.connect).start()
-		time.sleep(5)
 		
-		if self.connected:
-			status_text.set_text("[JOINING]: Connected, joining lobby...")
-			time.sleep(3)
-			status_text.set_text(f"[JOINED]: You've joined the lobby as \"{self.client.nickname}\"")
+		if self.join_session(handshake):
+			handshake.enter("JOINED", f"You've joined the lobby as \"{self.client.nickname}\"")
 			self.client.send_manually(f"*[PLAYER READY]")
-		else:
-			status_text.set_text("[TIMED OUT]: Host not found, check IP and port.")
 		
 		set_buttons_interactable(True)
 
@@ -448,13 +423,17 @@ class GameForClient(MultiplayerGameBase):
 		super().run()
 
 		while self.running and self.connected:
+			self.process_network()
+			if not self.running:
+				return
+
 			self.outline_display.fill((0, 0, 0, 0))
 			self.normal_display.blit(self.assets["background"], (0, 0))
 
 			self.screenshake = max(self.screenshake - 1, 0)
 
 			# Handle level transitions.
-			if not len(self.entities[4:]) and self.level_id < self.max_level:
+			if not len(self.enemies) and self.level_id < self.max_level:
 				self.transition += 1
 				if self.transition > 30:
 					print("Entering the next level...")
@@ -478,52 +457,43 @@ class GameForClient(MultiplayerGameBase):
 
 			self.render_terrain(render_scroll)
 
-			# Render the enemies.
-			for enemy in self.entities[4:]:
-				enemy.render(self.outline_display, offset=render_scroll)
+			# Render the enemies, those out of view are only kept roughly in place by the server.
+			for enemy in self.enemies.copy():
+				if enemy.in_view:
+					enemy.render(self.outline_display, offset=render_scroll)
 
 			# Update and render the main player and other initialized players.
 			if not self.dead:
 				self.get_main_player().update(self.tilemap, movement=(self.movement[1] - self.movement[0], 0))
 				self.get_main_player().render(self.outline_display, offset=render_scroll)
 			
-			for player in self.entities[:4]:
+			for player in self.players:
 				if player.initialized and player.id != "main_player" and not player.died:
 					player.render(self.outline_display, offset=render_scroll)
 
-			# Render the gun projectiles.
-			for projectile in self.projectiles.copy():
-				# [[x, y], direction, alive_time]
-				projectile.update()
-				projectile.render(self.outline_display, offset=render_scroll)
-				if self.tilemap.solid_check(projectile.pos):
-					self.projectiles.remove(projectile)
-					for i in range(4):
-						self.sparks.append(Spark(projectile.pos, random.random() - 0.5 + (math.pi if projectile.direction > 0 else 0), random.random() + 2))
-				elif projectile.alive_time > 360:
-					self.projectiles.remove(projectile)
+			# Update and render the gun projectiles, the players just moved.
+			self.players.index_positions()
+			for x, y, direction in self.projectiles.advance(self.tilemap):
+				for i in range(4):
+					self.spawn_spark((x, y), random.random() - 0.5 + (math.pi if direction > 0 else 0), random.random() + 2)
+			self.projectiles.render(self.outline_display, self.assets["projectile"], offset=render_scroll)
+
+			# Check if any player gets shot.
+			for player in self.projectiles.hits(self.players, lambda player: abs(player.dashing) < 50):
+				self.sounds["hit"].play()
+				if player.id == "main_player":
+					self.get_main_player().died = True
+					self.dead += 1
+					self.screenshake = max(self.screenshake, 16)
 				
-				# Check if any player gets shot.
-				else:
-					for player in self.entities[:4]:
-						if abs(player.dashing) < 50 and player.rect().collidepoint(projectile.pos):
-							self.projectiles.remove(projectile)
-							self.sounds["hit"].play()
-							if player.id == "main_player":
-								self.get_main_player().died = True
-								self.dead += 1
-								self.screenshake = max(self.screenshake, 16)
-							
-							# Generate sparks and dust.
-							for i in range(30):
-								angle = random.random() * math.pi * 2
-								self.sparks.append(Spark(player.rect().center, angle, random.random() + 2))
-
-								speed = random.random() * 5
-								velocity = [math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5]
-								self.particles.append(Particle(self, "dust", player.rect().center,
-																velocity=velocity, start_frame=random.randint(0, 7)))
-							break
+				# Generate sparks and dust.
+				for i in range(30):
+					angle = random.random() * math.pi * 2
+					self.spawn_spark(player.rect().center, angle, random.random() + 2)
+
+					speed = random.random() * 5
+					velocity = [math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5]
+					self.spawn_particle("dust", player.rect().center, velocity=velocity, start_frame=random.randint(0, 7))
 
 			self.render_effects(render_scroll)
 
@@ -562,7 +532,7 @@ class GameForClient(MultiplayerGameBase):
 			self.normal_display.blit(self.outline_display, (0, 0))
 
 			# Render the players' name tags over anything else.
-			for player in self.entities[:4]:
+			for player in self.players:
 				if player.initialized and not player.died:
 					player.render_name_tag(self.normal_display, offset=render_scroll)
 
@@ -570,6 +540,9 @@ class GameForClient(MultiplayerGameBase):
 			screenshake_offset = (random.random() * self.screenshake - self.screenshake / 2, random.random() * self.screenshake - self.screenshake / 2)
 			self.screen.blit(pygame.transform.scale(self.normal_display, self.screen.get_size()), screenshake_offset)
 			
+			# The send thread picks up this frame's state from here.
+			self.client.publish_state()
+
 			pygame.display.update()
 			self.clock.tick(60)
 
@@ -578,6 +551,8 @@ class GameSolo(GameBase):
 	def __init__(self, clock, screen, outline_display, normal_display):
 		super().__init__(clock, screen, outline_display, normal_display)
 		self.player = Player("", self, (50, 50), (8, 15))
+		self.enemy_store = EntityStore()
+		self.enemies = self.enemy_store.items
 		self.start_game()
 
 
@@ -587,12 +562,15 @@ class GameSolo(GameBase):
 
 	def load_level(self, id):
 		super().load_level(id)
-		self.enemies = []
+		# Reloaded on every death, the enemies of the previous try are brought back instead of built again.
+		self.clear_enemies()
+		enemy_count = 1
 		for spawner in self.tilemap.extract([("spawners", 0), ("spawners", 1)]):
 			if spawner.variant == 0:
 				self.player.respawn(spawner.pos)
 			else:
-				self.enemies.append(Enemy(self, spawner.pos, (8, 15)))
+				self.spawn_enemy(self.enemy_pool.acquire(self, spawner.pos, (8, 15), id=f"enemy_{enemy_count}"))
+				enemy_count += 1
 
 	def run(self):
 		super().run()
@@ -633,39 +611,33 @@ class GameSolo(GameBase):
 				died = enemy.update(self.tilemap, movement=(0, 0))
 				enemy.render(self.outline_display, offset=render_scroll)
 				if died:
-					self.enemies.remove(enemy)
+					self.despawn_enemies((enemy.id,))
 
 			# Render the player.
 			if not self.dead:
 				self.player.update(self.tilemap, movement=(self.movement[1] - self.movement[0], 0))
 				self.player.render(self.outline_display, offset=render_scroll)
 
-			# Render the gun projectiles.
-			for projectile in self.projectiles.copy():
-				# [[x, y], direction, alive_time]
-				projectile.update()
-				projectile.render(self.outline_display, offset=render_scroll)
-				if self.tilemap.solid_check(projectile.pos):
-					self.projectiles.remove(projectile)
-					for i in range(4):
-						self.sparks.append(Spark(projectile.pos, random.random() - 0.5 + (math.pi if projectile.direction > 0 else 0), random.random() + 2))
-				elif projectile.alive_time > 360:
-					self.projectiles.remove(projectile)
-				
-				# If the player gets shot.
-				elif abs(self.player.dashing) < 50 and self.player.rect().collidepoint(projectile.pos):
-					self.projectiles.remove(projectile)
-					self.sounds["hit"].play()
-					self.player.died = True
-					self.dead += 1
-					self.screenshake = max(self.screenshake, 16)
-					for i in range(30):
-						angle = random.random() * math.pi * 2
-						self.sparks.append(Spark(self.player.rect().center, angle, random.random() + 2))
-
-						speed = random.random() * 5
-						velocity = [math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5]
-						self.particles.append(Particle(self, "dust", self.player.rect().center, velocity=velocity, start_frame=random.randint(0, 7)))
+			# Update and render the gun projectiles.
+			for x, y, direction in self.projectiles.advance(self.tilemap):
+				for i in range(4):
+					self.spawn_spark((x, y), random.random() - 0.5 + (math.pi if direction > 0 else 0), random.random() + 2)
+			self.projectiles.render(self.outline_display, self.assets["projectile"], offset=render_scroll)
+
+			# If the player gets shot, once per projectile that went through them.
+			hit_count = self.projectiles.hits_rect(self.player.rect()) if abs(self.player.dashing) < 50 else 0
+			for _ in range(hit_count):
+				self.sounds["hit"].play()
+				self.player.died = True
+				self.dead += 1
+				self.screenshake = max(self.screenshake, 16)
+				for i in range(30):
+					angle = random.random() * math.pi * 2
+					self.spawn_spark(self.player.rect().center, angle, random.random() + 2)
+
+					speed = random.random() * 5
+					velocity = [math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed * 0.5]
+					self.spawn_particle("dust", self.player.rect().center, velocity=velocity, start_frame=random.randint(0, 7))
 
 			self.render_effects(render_scroll)
 
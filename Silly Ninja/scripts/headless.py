@@ -0,0 +1,237 @@
+import os
+
+from scripts.tilemap import Tilemap
+from scripts.entities import Enemy, PlayerRegistry
+from scripts.batch_physics import EnemyBatch
+from scripts.projectiles import ProjectilePool
+from scripts.visual_effects import Particle, Spark
+from scripts.entity_pool import EntityPool
+from scripts.entity_store import EntityStore
+from scripts.ai_scheduler import AIScheduler
+from scripts.animation import Animation
+from scripts.utils import BASE_IMAGE_PATH
+from scripts.world import WorldMixin
+from scripts.session import SessionMixin
+from scripts.socket.client import MAX_CLIENT_COUNT
+
+
+# Frames are never rendered without a display, so only the frame count of each animation matters.
+def load_frame_placeholders(path):
+	return [None] * len(os.listdir(BASE_IMAGE_PATH + path))
+
+
+class SilentSound:
+	def play(self, loops=0):
+		pass
+
+
+	def set_volume(self, volume):
+		pass
+
+
+class HeadlessGame(WorldMixin):
+	""" Simulates a multiplayer session without any display or audio.
+		Mirrors the attributes of GameBase that the entities rely on. """
+	def __init__(self, client_id="server", batched_physics=False, enemy_lod=False):
+		self.client_id = client_id
+		# Moves all enemies at once with NumPy, for levels crowded with them.
+		self.enemy_batch = EnemyBatch() if batched_physics else None
+		# Updates the enemies far from every player less often, for large maps.
+		self.ai_scheduler = AIScheduler() if enemy_lod else None
+
+		self.assets = {
+			"enemy/idle": Animation(load_frame_placeholders("entities/enemy/idle"), image_duration=6),
+			"enemy/run": Animation(load_frame_placeholders("entities/enemy/run"), image_duration=4),
+
+			"player/idle": Animation(load_frame_placeholders("entities/player/idle"), image_duration=6),
+			"player/run": Animation(load_frame_placeholders("entities/player/run"), image_duration=4),
+			"player/jump": Animation(load_frame_placeholders("entities/player/jump")),
+			"player/slide": Animation(load_frame_placeholders("entities/player/slide")),
+			"player/wall_slide": Animation(load_frame_placeholders("entities/player/wall_slide")),
+
+			"particle/leaf": Animation(load_frame_placeholders("particles/leaf"), image_duration=20, loop=False),
+			"particle/dust": Animation(load_frame_placeholders("particles/dust"), image_duration=6, loop=False)
+		}
+
+		self.sounds = {
+			"dash": SilentSound(),
+			"hit": SilentSound(),
+			"jump": SilentSound(),
+			"shoot": SilentSound()
+		}
+
+		self.tilemap = Tilemap(self, 16)
+
+		self.players = PlayerRegistry(self)
+		self.enemy_store = EntityStore()
+		self.enemies = self.enemy_store.items
+
+		self.particles = []
+		self.projectiles = ProjectilePool()
+		self.sparks = []
+		self.enemy_pool = EntityPool(Enemy)
+		self.spark_pool = EntityPool(Spark)
+		self.particle_pool = EntityPool(Particle)
+
+		self.screenshake = 0
+		self.dead = 0
+		self.transition = 0
+
+		self.level_id = 0
+		self.max_level = len(os.listdir("assets/maps")) - 1
+		self.spawn_pos = (50, 50)
+		self.running = False
+
+
+	def get_player(self, player_id):
+		# Players get registered by their first update, the server doesn't track nicknames in the world.
+		index = self.players.index_of(player_id)
+		if index not in range(MAX_CLIENT_COUNT):
+			return None
+		player = self.players.get(index)
+		if player is None:
+			player = self.players.register(index, f"unnamed_player_{index + 1}", "", player_id)
+		return player
+
+
+	def load_level(self, id):
+		self.tilemap.load(f"assets/maps/{id}.json")
+		self.clear_enemies()
+
+		self.clear_effects()
+		self.transition = -30
+
+		enemy_count = 1
+		for spawner in self.tilemap.extract([("spawners", 0), ("spawners", 1)]):
+			if spawner.variant == 0:
+				self.spawn_pos = tuple(spawner.pos)
+				for player in self.players:
+					player.respawn(self.spawn_pos)
+			else:
+				self.spawn_enemy(self.enemy_pool.acquire(self, spawner.pos, (8, 15), id=f"enemy_{enemy_count}", client_id=self.client_id))
+				enemy_count += 1
+
+		if self.enemy_batch is not None:
+			self.enemy_batch.attach(self.enemies, self.tilemap)
+
+
+	def start_game(self):
+		self.level_id = 0
+		self.load_level(self.level_id)
+		self.running = True
+
+
+	def stop_game(self):
+		self.running = False
+		self.clear_enemies()
+		self.projectiles.clear()
+
+
+	def apply_player_update(self, infos):
+		# [player_ID, last_movement[0], last_movement[1], pos[0], pos[1], dashing, jump, is_dead]
+		player = self.get_player(infos[0])
+		if player is not None:
+			player.last_movement = tuple(map(int, infos[1:3]))
+			player.pos = list(map(float, infos[3:5]))
+			player.dashing = int(infos[5])
+			player.jumped = infos[6] == "True"
+			player.died = infos[7] == "True"
+
+
+	def update_transition(self):
+		# Handle level transitions, in step with the displayed games.
+		if not len(self.enemies) and self.level_id < self.max_level:
+			self.transition += 1
+			if self.transition > 30:
+				self.level_id = min(self.level_id + 1, self.max_level)
+				self.load_level(self.level_id)
+		if self.transition < 0:
+			self.transition += 1
+
+
+	def tick(self):
+		self.update_transition()
+		# Players only move as their updates arrive, index them once for the whole tick.
+		self.players.index_positions()
+
+		if self.ai_scheduler is not None:
+			enemies = self.ai_scheduler.schedule(self.enemies, self.players)
+		else:
+			enemies = self.enemies.copy()
+
+		if self.enemy_batch is not None:
+			dead_enemies = self.enemy_batch.update(enemies, self.tilemap)
+		else:
+			dead_enemies = {enemy.id for enemy in enemies if enemy.update(self.tilemap, movement=(0, 0))}
+		if dead_enemies:
+			self.despawn_enemies(dead_enemies)
+
+		# Whether a player dies is up to their own client, only stop the projectiles here.
+		self.projectiles.advance(self.tilemap)
+		self.projectiles.hits(self.players, lambda player: not player.died and abs(player.dashing) < 50)
+
+		# Visual effects are spawned by the entities, but never rendered here.
+		self.spark_pool.release_all(self.sparks)
+		self.sparks.clear()
+		self.particle_pool.release_all(self.particles)
+		self.particles.clear()
+		self.screenshake = 0
+
+
+class HeadlessClientGame(SessionMixin, HeadlessGame):
+	""" The client side of a session without any display, driven by scripted inputs instead of a player.
+		Enemies are updated by its GameClient as the state arrives, just like in GameForClient. """
+	def __init__(self):
+		super().__init__(client_id="client_unverified")
+		self.client = None
+		self.connected = False
+		self.player_index = -1
+
+
+	def load_level(self, id):
+		self.client_id = self.client.client_id
+		super().load_level(id)
+
+
+	def start_game(self):
+		super().start_game()
+		self.client.game_started = True
+
+
+	def disconnect_from_server(self):
+		self.running = False
+		self.connected = False
+		self.client.disconnect()
+		self.players.clear()
+		self.stop_game()
+
+
+	def step(self, movement=(0, 0)):
+		self.process_network()
+		if not self.running:
+			return
+
+		self.update_transition()
+
+		main_player = self.get_main_player()
+		if self.dead:
+			self.dead += 1
+			if self.dead > 60:
+				main_player.respawn(self.spawn_pos)
+				self.dead = 0
+		else:
+			main_player.update(self.tilemap, movement=movement)
+
+		self.projectiles.advance(self.tilemap)
+		if not self.dead:
+			# Only this client's own player, the others are shot on their own machines.
+			if abs(main_player.dashing) < 50 and self.projectiles.hits_rect(main_player.rect()):
+				main_player.died = True
+				self.dead += 1
+
+		self.spark_pool.release_all(self.sparks)
+		self.sparks.clear()
+		self.particle_pool.release_all(self.particles)
+		self.particles.clear()
+		self.screenshake = 0
+		self.client.publish_state()
@@ -0,0 +1,149 @@
+PROJECTILE_LIFETIME = 360  # Frames before a projectile that hit nothing disappears.
+
+
+class ProjectilePool:
+	""" Every projectile of a level, kept in columns indexed by slot instead of one object each.
+		Slots of retired projectiles go to a free list and get reused by the next ones fired, so heavy fire allocates nothing.
+		Projectiles fly along a row, each step is swept against the tiles and the players in its way,
+		so that no speed can make them pass through a wall or a player between two frames. """
+	def __init__(self, capacity=64):
+		self.xs = [0.0] * capacity
+		self.ys = [0.0] * capacity
+		self.previous_xs = [0.0] * capacity  # Where the projectile started its last step.
+		self.directions = [0.0] * capacity  # Pixels per frame, negative to the left.
+		self.alive_times = [0] * capacity
+		self.active = []  # Slots in flight, by order of firing.
+		self.free = list(range(capacity - 1, -1, -1))
+
+
+	def __len__(self):
+		return len(self.active)
+
+
+	def __iter__(self):
+		""" (x, y, direction) of every projectile in flight. """
+		for slot in self.active:
+			yield self.xs[slot], self.ys[slot], self.directions[slot]
+
+
+	def clear(self):
+		self.free.extend(self.active)
+		self.active.clear()
+
+
+	def fire(self, pos, direction):
+		if not self.free:
+			# Double the columns, the new slots are handed out lowest first.
+			capacity = len(self.xs)
+			for column in (self.xs, self.ys, self.previous_xs, self.directions):
+				column.extend([0.0] * capacity)
+			self.alive_times.extend([0] * capacity)
+			self.free.extend(range(capacity * 2 - 1, capacity - 1, -1))
+
+		slot = self.free.pop()
+		self.xs[slot] = self.previous_xs[slot] = pos[0]
+		self.ys[slot] = pos[1]
+		self.directions[slot] = direction
+		self.alive_times[slot] = 0
+		self.active.append(slot)
+		return slot
+
+
+	def retire(self, slots):
+		# Many at once, the order of the others is kept.
+		if slots:
+			self.active = [slot for slot in self.active if slot not in slots]
+			self.free.extend(slots)
+
+
+	def advance(self, tilemap):
+		""" Moves every projectile one frame ahead and retires the ones that hit a wall or lived too long.
+			Returns where each of them hit a wall, as (x, y, direction). """
+		xs = self.xs
+		previous_xs = self.previous_xs
+		directions = self.directions
+		alive_times = self.alive_times
+		tile_size = tilemap.tile_size
+		is_solid_cell = tilemap.is_solid_cell
+
+		walls = []
+		retired = set()
+		for slot in self.active:
+			start = xs[slot]
+			end = start + directions[slot]
+			previous_xs[slot] = start
+			xs[slot] = end
+			alive_times[slot] += 1
+
+			# Every cell entered during the step, the one it started in was checked by the previous one.
+			# Only the first step checks where it ends up without leaving its cell, as it was never checked before.
+			row = int(self.ys[slot] // tile_size)
+			start_cell = int(start // tile_size)
+			end_cell = int(end // tile_size)
+			step = 1 if end_cell >= start_cell else -1
+			if end_cell != start_cell:
+				cells = range(start_cell + step, end_cell + step, step)
+			else:
+				cells = (end_cell,) if alive_times[slot] == 1 else ()
+
+			for cell in cells:
+				if is_solid_cell(cell, row):
+					if cell != end_cell:
+						# Stopped at the face of the wall rather than somewhere past it.
+						xs[slot] = cell * tile_size if step > 0 else (cell + 1) * tile_size
+					walls.append((xs[slot], self.ys[slot], directions[slot]))
+					retired.add(slot)
+					break
+			else:
+				if alive_times[slot] > PROJECTILE_LIFETIME:
+					retired.add(slot)
+
+		self.retire(retired)
+		return walls
+
+
+	def hits(self, players, can_be_hit):
+		""" Retires the projectiles that went through a player during their last step, 'players' being anything with
+			SpatialHash.in_box(). Returns the player each of them hit, the first one in its way that 'can_be_hit'. """
+		hit_players = []
+		retired = set()
+		for slot in self.active:
+			start = int(self.previous_xs[slot])
+			end = int(self.xs[slot])
+			top = int(self.ys[slot])
+			candidates = [player for player in players.in_box(min(start, end), top, max(start, end) + 1, top + 1) if can_be_hit(player)]
+			if candidates:
+				# The closest to where the projectile came from, the first one listed among equals.
+				if self.directions[slot] > 0:
+					hit_players.append(min(candidates, key=lambda player: int(player.pos[0])))
+				else:
+					hit_players.append(max(candidates, key=lambda player: int(player.pos[0])))
+				retired.add(slot)
+
+		self.retire(retired)
+		return hit_players
+
+
+	def hits_rect(self, rect):
+		""" Retires the projectiles that went through 'rect' during their last step, hits() for a lone target
+			that needs no spatial hash. Returns how many did. """
+		left, top = int(rect[0]), int(rect[1])
+		right, bottom = left + int(rect[2]), top + int(rect[3])
+		retired = set()
+		for slot in self.active:
+			y = int(self.ys[slot])
+			if top <= y < bottom:
+				start = int(self.previous_xs[slot])
+				end = int(self.xs[slot])
+				if min(start, end) < right and left <= max(start, end):
+					retired.add(slot)
+
+		self.retire(retired)
+		return len(retired)
+
+
+	def render(self, surface, image, offset=(0, 0)):
+		half_width = image.get_width() / 2
+		half_height = image.get_height() / 2
+		for x, y, _ in self:
+			surface.blit(image, (x - half_width - offset[0], y - half_height - offset[1]))
@@ -0,0 +1,7 @@
+# The world is split into square regions, what a player sees and what the enemies around them do are both told by these.
+REGION_SIZE = 256  # In pixels, 16 tiles of 16 pixels each.
+VIEW_RADIUS = 1  # Regions around the player's own, enough to cover the 320x240 display wherever the player stands.
+
+
+def region_of(pos):
+	return (int(pos[0] // REGION_SIZE), int(pos[1] // REGION_SIZE))
@@ -0,0 +1,52 @@
+class SessionMixin:
+	""" The bookkeeping of a multiplayer session, shared by the displayed games and the headless clients.
+		Needs no display, the class it's mixed in holds the players, the GameClient and the world. """
+	client = None  # Set once connecting, the menus may poll the network before that.
+
+	def process_network(self):
+		# Applies what the network threads received since the last frame, on the main thread.
+		if self.client is not None:
+			self.client.process_inbox()
+
+
+	def get_main_player(self):
+		return self.players[self.player_index]
+
+
+	def ready_for_launch(self):
+		for player in self.players:
+			player.ready = True
+
+
+	""" Initialize the all previously connected clients' players if the connection is made the frist time.
+		Or if the server forces re-initialization.
+		Otherwise, initialize just the newly connected client."""
+	def on_connection_made(self, player_index, nicknames, client_ids, re_initialized=False):
+		if not self.connected or re_initialized:
+			self.player_index = player_index
+			self.players.truncate(len(nicknames))
+			for i in range(len(nicknames)):
+				player_id = "main_player" if i == self.player_index else f"player_{i + 1}"
+				self.players.register(i, nicknames[i], client_ids[i], player_id, re_initialized=re_initialized)
+			self.connected = True
+		else:
+			self.players.register(player_index, nicknames[player_index], client_ids[player_index], f"player_{player_index + 1}")
+		
+		print(self.players, end="\n\n")
+
+
+	def on_player_left(self, player_index):
+		# The server sorts the remaining clients up, so does the registry.
+		self.players.unregister(player_index)
+		if self.player_index > player_index:
+			self.player_index -= 1
+
+
+	def resync(self, level_id):
+		# A client coming back may have missed the start of the session, or a level transition.
+		if not self.running:
+			self.level_id = level_id
+			self.start_game()
+		if level_id != self.level_id:
+			self.level_id = level_id
+			self.load_level(level_id)
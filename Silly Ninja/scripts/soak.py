@@ -0,0 +1,222 @@
+import math
+import random
+import threading
+import time
+
+from scripts.headless import HeadlessClientGame
+from scripts.socket.client import GameClient, MAX_CLIENT_COUNT
+from scripts.socket.dedicated_server import DedicatedServer, TICK_RATE
+from scripts.socket.impairment import NetworkConditions
+
+
+def percentile(values, fraction):
+	if not values:
+		return 0.0
+	ordered = sorted(values)
+	return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class SoakServer(DedicatedServer):
+	def __init__(self, ip, port, **kwargs):
+		super().__init__(ip, port, **kwargs)
+		self.tick_sent_times = {}
+
+
+	def send_snapshots(self):
+		self.tick_sent_times[self.tick] = time.perf_counter()
+		super().send_snapshots()
+
+
+class SoakClient(GameClient):
+	""" A GameClient that reports the arrival time of every server tick. """
+	def __init__(self, game, on_tick, **kwargs):
+		super().__init__(game, "client_unverified", **kwargs)
+		self.on_tick = on_tick
+
+
+	def handle_message(self, message):
+		last_tick = self.server_tick
+		super().handle_message(message)
+		if self.server_tick != last_tick:
+			# When the receive thread got it, the wait for the game loop is reported on its own.
+			self.on_tick(self.server_tick, self.last_received_at)
+
+
+class ScriptedInput:
+	""" Random but human-like inputs: walk for a while, sometimes jump or dash. """
+	def __init__(self):
+		self.movement = (0, 0)
+		self.hold = 0
+
+
+	def next(self, player):
+		self.hold -= 1
+		if self.hold <= 0:
+			self.movement = (random.choice((-1, 0, 1)), 0)
+			self.hold = random.randint(30, 90)
+
+		if random.random() < 0.02:
+			player.jump()
+		if random.random() < 0.005:
+			player.dash()
+		return self.movement
+
+
+class SoakTest:
+	""" Runs a dedicated server and a number of headless clients on localhost through an impaired network,
+		then reports how the session held up. """
+	def __init__(self, bot_count=3, duration=30, port=5055, transport="tcp", conditions=None, tick_rate=TICK_RATE, capture=None):
+		self.bot_count = min(bot_count, MAX_CLIENT_COUNT)
+		self.duration = duration
+		self.port = port
+		self.transport = transport
+		self.conditions = NetworkConditions() if conditions is None else conditions
+		self.tick_rate = tick_rate
+		self.capture = capture  # A TrafficRecorder for the server's side of the session.
+
+		self.server = None
+		self.bots = []
+		self.tick_latencies = []
+		self.enemy_desyncs = []
+		self.player_desyncs = []
+
+
+	def on_tick(self, tick, arrival_time):
+		sent_time = self.server.tick_sent_times.get(tick)
+		if sent_time is not None:
+			self.tick_latencies.append(arrival_time - sent_time)
+
+
+	def start_bots(self):
+		for i in range(self.bot_count):
+			game = HeadlessClientGame()
+			game.client = SoakClient(game, self.on_tick, ip="127.0.0.1", port=self.port, nickname=f"bot_{i + 1}",
+									transport=self.transport, wrap_socket=self.conditions.wrap)
+			game.client.connect()
+
+			deadline = time.perf_counter() + 10
+			while not game.connected and time.perf_counter() < deadline:
+				game.process_network()
+				for joined_game, _ in self.bots:
+					joined_game.process_network()
+				time.sleep(0.01)
+			if not game.connected:
+				raise TimeoutError(f"bot_{i + 1} could not join the server.")
+
+			game.client.send_manually("*[PLAYER READY]")
+			self.bots.append((game, ScriptedInput()))
+
+		# The first bot leads the lobby.
+		self.bots[0][0].client.send_manually("*[START GAME]")
+		deadline = time.perf_counter() + 10
+		while not all(game.running for game, _ in self.bots) and time.perf_counter() < deadline:
+			for game, _ in self.bots:
+				game.process_network()
+			time.sleep(0.01)
+
+
+	def sample_desync(self):
+		world = self.server.world
+		server_enemies = {enemy.id: enemy.pos for enemy in world.enemies}
+
+		for game, _ in self.bots:
+			if game.level_id != world.level_id:
+				continue
+			for enemy in game.enemies:
+				if enemy.id in server_enemies:
+					self.enemy_desyncs.append(math.dist(enemy.pos, server_enemies[enemy.id]))
+
+			# Other players, as this bot sees them.
+			for player in game.players:
+				server_player = world.players.by_id(player.id) if player.id != "main_player" else None
+				if server_player is not None:
+					self.player_desyncs.append(math.dist(player.pos, server_player.pos))
+
+
+	def queueing_delay(self):
+		# How long the bots' messages waited to be handled by their game, or to be written by their send thread.
+		delays = [game.client.queueing_delay() for game, _ in self.bots]
+		return {name: {"mean": sum(delay[name]["mean"] for delay in delays) / len(delays),
+						"max": max(delay[name]["max"] for delay in delays)}
+				for name in ("inbox", "outbox")}
+
+
+	def run(self):
+		self.server = SoakServer("127.0.0.1", self.port, tick_rate=self.tick_rate,
+								transport=self.transport, wrap_socket=self.conditions.wrap, capture=self.capture)
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+		if not self.server.bound.wait(5) or not self.server.running:
+			raise RuntimeError(f"The server could not listen on port {self.port}.")
+
+		self.start_bots()
+		print(f"[SOAKING]: {self.bot_count} bots for {self.duration}s over {self.transport.upper()}, {self.conditions}")
+
+		start_cpu = time.process_time()
+		start_time = time.perf_counter()
+		start_sent = self.conditions.bytes_sent()
+		start_received = self.conditions.bytes_received()
+
+		tick_interval = 1 / self.tick_rate
+		next_tick = start_time
+		ticks = 0
+		while time.perf_counter() - start_time < self.duration:
+			for game, inputs in self.bots:
+				if game.running:
+					game.step(inputs.next(game.get_main_player()))
+				else:
+					game.process_network()
+
+			ticks += 1
+			if ticks % (self.tick_rate // 4) == 0:
+				self.sample_desync()
+
+			next_tick += tick_interval
+			time.sleep(max(0.0, next_tick - time.perf_counter()))
+
+		elapsed = time.perf_counter() - start_time
+		report = {
+			"bots": self.bot_count,
+			"duration": elapsed,
+			"server_ticks": self.server.tick,
+			"tick_latency_ms": {
+				"p50": percentile(self.tick_latencies, 0.5) * 1000,
+				"p90": percentile(self.tick_latencies, 0.9) * 1000,
+				"p99": percentile(self.tick_latencies, 0.99) * 1000,
+				"max": max(self.tick_latencies, default=0.0) * 1000
+			},
+			"bytes_per_second": {
+				"sent": (self.conditions.bytes_sent() - start_sent) / elapsed,
+				"received": (self.conditions.bytes_received() - start_received) / elapsed
+			},
+			"enemy_desync_px": {
+				"mean": sum(self.enemy_desyncs) / len(self.enemy_desyncs) if self.enemy_desyncs else 0.0,
+				"p95": percentile(self.enemy_desyncs, 0.95),
+				"max": max(self.enemy_desyncs, default=0.0)
+			},
+			"player_desync_px": {
+				"mean": sum(self.player_desyncs) / len(self.player_desyncs) if self.player_desyncs else 0.0,
+				"p95": percentile(self.player_desyncs, 0.95),
+				"max": max(self.player_desyncs, default=0.0)
+			},
+			"queueing_delay_ms": self.queueing_delay(),
+			"cpu_percent": (time.process_time() - start_cpu) / elapsed * 100
+		}
+
+		for game, _ in self.bots:
+			game.disconnect_from_server()
+		self.server.shutdown()
+		return report
+
+
+def print_report(report):
+	print(f"[REPORT]: {report['bots']} bots, {report['duration']:.1f}s, {report['server_ticks']} server ticks.")
+	latency = report["tick_latency_ms"]
+	print(f"  Tick latency (ms): p50={latency['p50']:.1f}  p90={latency['p90']:.1f}  p99={latency['p99']:.1f}  max={latency['max']:.1f}")
+	traffic = report["bytes_per_second"]
+	print(f"  Traffic (bytes/s): sent={traffic['sent']:.0f}  received={traffic['received']:.0f}")
+	for name in ("enemy", "player"):
+		desync = report[f"{name}_desync_px"]
+		print(f"  {name.capitalize()} desync (px): mean={desync['mean']:.1f}  p95={desync['p95']:.1f}  max={desync['max']:.1f}")
+	for name, delay in report["queueing_delay_ms"].items():
+		print(f"  {name.capitalize()} queueing delay (ms): mean={delay['mean']:.2f}  max={delay['max']:.2f}")
+	print(f"  CPU usage: {report['cpu_percent']:.0f}%")
@@ -0,0 +1,242 @@
+import asyncio
+import argparse
+import random
+import time
+
+from scripts.socket.client import DISCONNECT_MESSAGE
+from scripts.socket.transport import FORMAT, DELIMITER, frame, is_state_message, state_message
+
+
+class BotStats:
+	def __init__(self):
+		self.joined = 0
+		self.rejected = 0
+		self.failed = 0
+		self.reinitialized = 0
+		self.messages_sent = 0
+		self.messages_received = 0
+		self.bytes_sent = 0
+		self.bytes_received = 0
+		self.join_times = []
+
+
+	def __repr__(self):
+		join_time = sum(self.join_times) / len(self.join_times) * 1000 if self.join_times else 0.0
+		return (f"BotStats: [Joined={self.joined}, Rejected={self.rejected}, Failed={self.failed}, " +
+				f"Re-initialized={self.reinitialized}, Avg. Join Time={join_time:.1f}ms, " +
+				f"Sent={self.messages_sent} ({self.bytes_sent} bytes), Received={self.messages_received} ({self.bytes_received} bytes)]")
+
+
+class BotClient:
+	""" A headless client speaking the same protocol as GameClient, without a game or a display.
+		Its player walks around by a script of (movement, ticks) steps, or randomly if none is given.
+		Many of them can share one thread on an asyncio event loop. """
+	def __init__(self, nickname, ip, port, stats, script=None, tick_rate=60, room=""):
+		self.nickname = nickname
+		self.ip = ip
+		self.port = port
+		self.stats = stats
+		self.script = script
+		self.tick_rate = tick_rate
+		self.room = room
+
+		self.reader = None
+		self.writer = None
+		self.client_id = "client_unverified"
+		self.client_index = -1
+		self.joined = asyncio.Event()
+		self.game_started = False
+		self.running = False
+
+		self.pos = [0.0, 0.0]
+		self.movement = 0
+		self.dashing = 0
+		self.jumped = False
+
+
+	async def send(self, message):
+		data = frame(message).encode(FORMAT)
+		self.writer.write(data)
+		await self.writer.drain()
+		self.stats.messages_sent += 1
+		self.stats.bytes_sent += len(data)
+
+
+	async def handle_message(self, message):
+		if message == DISCONNECT_MESSAGE:
+			self.running = False
+		elif message == "[NICKNAME]":
+			await self.send(self.nickname)
+		elif message == "[CLIENT ID]":
+			await self.send(self.client_id)
+		elif message == "[ROOM]":
+			await self.send(self.room)
+		elif message == "[SESSION TOKEN]":
+			# Bots never come back, every connection joins anew.
+			await self.send("")
+		elif message.startswith("[PING]"):
+			await self.send(f"[PONG]:{message.split(':', 1)[1]}")
+		elif message == "[START GAME]":
+			self.game_started = True
+		elif message.startswith("[JOIN FAILED]"):
+			self.stats.rejected += 1
+			self.running = False
+
+		elif message.startswith("NEW PLAYERS JOINED") and self.client_index == -1:
+			# [str(index), str(client_id), str(nicknames), str(client_ids)]
+			infos = message.split(":")[1].split(";")
+			self.client_index = int(infos[0])
+			self.client_id = infos[1]
+			self.joined.set()
+
+		elif message.startswith("RE_INITIALIZE"):
+			infos = message.split(":")[1].split(";")
+			self.client_index = int(infos[0])
+			self.client_id = infos[1]
+			self.stats.reinitialized += 1
+
+		# Bots joining a session in progress never see the start, but its state traffic.
+		elif is_state_message(message):
+			self.game_started = True
+
+
+	async def receive(self):
+		try:
+			while self.running:
+				data = await self.reader.readuntil(DELIMITER.encode(FORMAT))
+				self.stats.messages_received += 1
+				self.stats.bytes_received += len(data)
+				await self.handle_message(data[:-1].decode(FORMAT))
+		except (asyncio.IncompleteReadError, ConnectionError):
+			pass
+		finally:
+			self.running = False
+			self.joined.set()
+
+
+	def next_movement(self, steps):
+		if self.script is not None:
+			return next(steps)
+
+		self.jumped = random.random() < 0.02
+		if random.random() < 0.005:
+			self.dashing = 60 if self.movement >= 0 else -60
+		return random.choice((-1, 0, 1)), random.randint(30, 90)
+
+
+	async def play(self):
+		def script_steps():
+			while True:
+				yield from self.script
+
+		steps = script_steps() if self.script is not None else None
+		hold = 0
+		tick_interval = 1 / self.tick_rate
+		try:
+			while self.running:
+				if self.game_started:
+					hold -= 1
+					if hold <= 0:
+						self.movement, hold = self.next_movement(steps)
+					self.pos[0] += self.movement
+					self.dashing = max(self.dashing - 1, 0)
+
+					# [client_ID, player_ID, last_movement[0], last_movement[1], pos[0], pos[1], dashing, jump, is_dead]
+					await self.send(state_message(self.client_id, [f"player_{self.client_index + 1},{self.movement},0," +
+									f"{self.pos[0]:.1f},{self.pos[1]:.1f},{self.dashing},{self.jumped},False"]))
+				await asyncio.sleep(tick_interval)
+		except ConnectionError:
+			self.running = False
+
+
+	async def start_game(self, delay):
+		await asyncio.sleep(delay)
+		if self.running:
+			try:
+				await self.send("*[START GAME]")
+			except ConnectionError:
+				pass
+
+
+	async def run(self, lifetime=None, start_after=None):
+		start_time = time.perf_counter()
+		try:
+			self.reader, self.writer = await asyncio.open_connection(self.ip, self.port)
+		except OSError:
+			self.stats.failed += 1
+			return
+
+		self.running = True
+		receiver = asyncio.create_task(self.receive())
+		await self.joined.wait()
+
+		if self.client_index != -1:
+			self.stats.joined += 1
+			self.stats.join_times.append(time.perf_counter() - start_time)
+			tasks = [asyncio.create_task(self.play())]
+			if start_after is not None:
+				tasks.append(asyncio.create_task(self.start_game(start_after)))
+			try:
+				await self.send("*[PLAYER READY]")
+				await asyncio.wait_for(asyncio.shield(receiver), timeout=lifetime)
+			except (asyncio.TimeoutError, ConnectionError):
+				pass
+			for task in tasks:
+				task.cancel()
+
+		await self.disconnect()
+		receiver.cancel()
+
+
+	async def disconnect(self):
+		if self.running:
+			self.running = False
+			try:
+				await self.send(DISCONNECT_MESSAGE)
+			except ConnectionError:
+				pass
+		self.writer.close()
+
+
+async def run_bots(count, ip, port, duration, churn=None, join_interval=0.05, script=None, rooms=1):
+	""" Keeps 'count' bots in the session for 'duration' seconds.
+		With churn, each bot leaves after a random lifetime averaging that many seconds and a new one takes its place.
+		On a room server, the bots are spread evenly over 'rooms' rooms. """
+	stats = BotStats()
+	deadline = time.perf_counter() + duration
+	serial = 0
+
+	async def bot_slot(slot):
+		nonlocal serial
+		# The first bot of each room leads its lobby and launches once everyone had a chance to join.
+		start_after = count * join_interval + 1 if slot < rooms else None
+		while time.perf_counter() < deadline:
+			serial += 1
+			remaining = deadline - time.perf_counter()
+			lifetime = remaining if churn is None else min(remaining, random.expovariate(1 / churn))
+			bot = BotClient(f"bot_{serial}", ip, port, stats, script=script, room=f"room_{slot % rooms + 1}")
+			await bot.run(lifetime=lifetime, start_after=start_after)
+			start_after = None
+			if bot.client_index == -1:
+				await asyncio.sleep(0.5)
+
+	tasks = []
+	for slot in range(count):
+		tasks.append(asyncio.create_task(bot_slot(slot)))
+		await asyncio.sleep(join_interval)
+
+	await asyncio.gather(*tasks)
+	return stats
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Load test a Silly Ninja server with headless bots.")
+	parser.add_argument("--ip", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=5050)
+	parser.add_argument("--bots", type=int, default=16, help="Number of bots to keep connected.")
+	parser.add_argument("--duration", type=float, default=30, help="Length of the test, in seconds.")
+	parser.add_argument("--churn", type=float, default=None, help="Average lifetime of a bot before it leaves and gets replaced, in seconds.")
+	parser.add_argument("--rooms", type=int, default=1, help="Number of rooms to spread the bots over, on a room server.")
+	args = parser.parse_args()
+
+	print(asyncio.run(run_bots(args.bots, args.ip, args.port, args.duration, churn=args.churn, rooms=args.rooms)))
@@ -0,0 +1,248 @@
+import collections
+import gzip
+import statistics
+import threading
+import time
+
+from scripts.socket.transport import DELIMITER, is_state_message, split_state_message
+from scripts.socket.client import GameClient, DISCONNECT_MESSAGE
+
+
+CAPTURE_HEADER = "# silly_ninja capture v1"
+# Answered by the receive thread during the handshake, they never reach the game.
+HANDSHAKE_PROMPTS = ("[NICKNAME]", "[CLIENT ID]", "[ROOM]", "[SESSION TOKEN]", "[TOKEN]")
+
+# time is in seconds since the capture started, direction is "in" or "out", peer who was on the other end.
+Frame = collections.namedtuple("Frame", ["time", "direction", "peer", "message"])
+
+
+def open_capture(path, mode):
+	# Captures ending in ".gz" are compressed, a long session shrinks about tenfold.
+	if path.endswith(".gz"):
+		return gzip.open(path, mode + "t", encoding="utf-8")
+	return open(path, mode, encoding="utf-8")
+
+
+class TrafficRecorder:
+	""" Writes every message a GameClient or GameServer sends or receives to a capture file, one line each:
+		"time	direction	peer	message". Shared by all the threads of its owner. """
+	def __init__(self, path, side):
+		self.path = path
+		self.side = side  # "client" or "server", tells the replay which direction a client received.
+		self.file = open_capture(path, "w")
+		self.file.write(f"{CAPTURE_HEADER} side={side}\n")
+		self.lock = threading.Lock()
+		self.start_time = time.perf_counter()
+		self.frames = 0
+
+
+	def record(self, direction, peer, message):
+		# Servers know their clients by address, which stays the same for the whole connection.
+		if isinstance(peer, tuple):
+			peer = f"{peer[0]}:{peer[1]}"
+		if message.endswith(DELIMITER):
+			message = message[:-1]
+		line = f"{time.perf_counter() - self.start_time:.6f}\t{direction}\t{peer}\t{message.replace(chr(10), ' ')}\n"
+		with self.lock:
+			if not self.file.closed:
+				self.file.write(line)
+				self.frames += 1
+
+
+	def close(self):
+		with self.lock:
+			self.file.close()
+		print(f"[CAPTURED]: {self.frames} messages written to \"{self.path}\".")
+
+
+def read_capture(path):
+	""" Returns the side a capture was recorded on and its frames, in order. """
+	frames = []
+	side = "client"
+	with open_capture(path, "r") as f:
+		for line in f:
+			line = line.rstrip("\n")
+			if line.startswith("#"):
+				if "side=" in line:
+					side = line.split("side=", 1)[1].strip()
+				continue
+
+			fields = line.split("\t", 3)
+			if len(fields) == 4:
+				frames.append(Frame(float(fields[0]), fields[1], fields[2], fields[3]))
+	return side, frames
+
+
+def message_kind(message):
+	# "state" for per-tick updates, otherwise the keyword of the control message, e.g. "[START GAME]" or "PLAYER LEFT".
+	if is_state_message(message):
+		return "state"
+	if message.startswith("@"):
+		return "routed"
+	message = message.lstrip("*")
+	if message.startswith("["):
+		return message[:message.find("]") + 1] or message
+	if ":" in message:
+		return message.split(":", 1)[0]
+	# Answers to the handshake prompts, chat,...
+	return message if message == DISCONNECT_MESSAGE else "other"
+
+
+def entity_kind(entity_id):
+	if entity_id.startswith("player_"):
+		return "player"
+	if entity_id.startswith("enemy_"):
+		return "enemy"
+	return "other"
+
+
+def analyze_capture(path):
+	""" Sums up a capture: what kind of messages make up the traffic, what each entity costs,
+		how regularly the state arrives and how much of it repeats what was already sent. """
+	side, frames = read_capture(path)
+	duration = frames[-1].time - frames[0].time if len(frames) > 1 else 0.0
+
+	kinds = {}  # {direction: {kind: [count, bytes]}}
+	entity_bytes = collections.Counter()  # {entity_kind: bytes}
+	entity_ids = collections.defaultdict(set)  # {entity_kind: {entity_ID,...}}
+	arrivals = collections.defaultdict(list)  # {(direction, peer): [time,...]} of the state messages.
+	last_records = {}  # {(direction, peer, entity_ID): record}
+	records = 0
+	redundant = 0
+	redundant_bytes = 0
+
+	for frame in frames:
+		kind = message_kind(frame.message)
+		counters = kinds.setdefault(frame.direction, {}).setdefault(kind, [0, 0])
+		counters[0] += 1
+		counters[1] += len(frame.message) + 1
+		if kind != "state":
+			continue
+
+		arrivals[(frame.direction, frame.peer)].append(frame.time)
+		# [sender, record;record;...], every record costs its own bytes and a separator.
+		for segment in split_state_message(frame.message)[1]:
+			entity_id = segment.split(",", 1)[0].lstrip("+-")
+			if entity_id == "tick":
+				continue
+
+			size = len(segment) + 1
+			entity = entity_kind(entity_id)
+			entity_bytes[entity] += size
+			entity_ids[entity].add(entity_id)
+
+			# Spawn and despawn markers change the meaning, an unchanged record without them is pure repetition.
+			records += 1
+			key = (frame.direction, frame.peer, entity_id)
+			if last_records.get(key) == segment:
+				redundant += 1
+				redundant_bytes += size
+			last_records[key] = segment
+
+	intervals = []
+	deviations = []
+	for times in arrivals.values():
+		stream = [later - earlier for earlier, later in zip(times, times[1:])]
+		if len(stream) > 1:
+			mean = statistics.fmean(stream)
+			intervals.append(mean)
+			deviations.extend(abs(interval - mean) for interval in stream)
+	deviations.sort()
+
+	return {
+		"side": side,
+		"frames": len(frames),
+		"duration": duration,
+		"kinds": {direction: dict(sorted(counters.items(), key=lambda item: -item[1][1])) for direction, counters in kinds.items()},
+		"bytes_per_entity_per_second": {
+			entity: entity_bytes[entity] / len(entity_ids[entity]) / duration if duration else 0.0 for entity in entity_bytes
+		},
+		"state_interval_ms": statistics.fmean(intervals) * 1000 if intervals else 0.0,
+		"jitter_ms": {
+			"mean": statistics.fmean(deviations) * 1000 if deviations else 0.0,
+			"p99": deviations[min(len(deviations) - 1, int(0.99 * len(deviations)))] * 1000 if deviations else 0.0
+		},
+		"redundant_records": {
+			"count": redundant,
+			"percent": redundant / records * 100 if records else 0.0,
+			"bytes_per_second": redundant_bytes / duration if duration else 0.0
+		}
+	}
+
+
+def print_analysis(analysis):
+	print(f"[CAPTURE]: {analysis['frames']} messages over {analysis['duration']:.1f}s, recorded by the {analysis['side']}.")
+	for direction, counters in analysis["kinds"].items():
+		print(f"  {direction.capitalize()}:")
+		for kind, (count, size) in counters.items():
+			print(f"    {kind:<24} {count:>8} msg  {size:>10} bytes")
+	for entity, rate in analysis["bytes_per_entity_per_second"].items():
+		print(f"  {entity.capitalize()} records (bytes/entity/s): {rate:.1f}")
+	jitter = analysis["jitter_ms"]
+	print(f"  State interval (ms): {analysis['state_interval_ms']:.2f}  jitter mean={jitter['mean']:.2f}  p99={jitter['p99']:.2f}")
+	redundant = analysis["redundant_records"]
+	print(f"  Unchanged records: {redundant['count']} ({redundant['percent']:.1f}%), {redundant['bytes_per_second']:.0f} bytes/s")
+
+
+def replay_capture(path, peer=None, speed=0.0, tick_rate=60):
+	""" Feeds what a client received into a headless client, one game step per tick of capture time.
+		A server's capture replays what it sent to 'peer', the first client it talked to by default.
+		With a 'speed' of 0 it runs as fast as it can, 1 is real time. """
+	# Imported here so that recording doesn't need the game's assets.
+	from scripts.headless import HeadlessClientGame
+
+	side, frames = read_capture(path)
+	direction = "in" if side == "client" else "out"
+	stream = [frame for frame in frames if frame.direction == direction]
+	if peer is None and stream:
+		peer = stream[0].peer
+	stream = [frame for frame in stream if frame.peer == peer and not frame.message.startswith(HANDSHAKE_PROMPTS)]
+
+	game = HeadlessClientGame()
+	# Never connected, whatever the game would send just piles up unsent.
+	game.client = GameClient(game, "client_unverified", nickname="replay")
+
+	step_interval = 1 / tick_rate
+	start_time = time.perf_counter()
+	capture_time = stream[0].time if stream else 0.0
+	next_frame = 0
+	steps = 0
+	step_times = []
+	while next_frame < len(stream):
+		while next_frame < len(stream) and stream[next_frame].time <= capture_time:
+			game.client.inbox.put((time.perf_counter(), stream[next_frame].message))
+			next_frame += 1
+
+		step_start = time.perf_counter()
+		if game.running:
+			game.step()
+		else:
+			game.process_network()
+		step_times.append(time.perf_counter() - step_start)
+		steps += 1
+
+		capture_time += step_interval
+		if speed > 0:
+			time.sleep(max(0.0, start_time + (capture_time - stream[0].time) / speed - time.perf_counter()))
+
+	step_times.sort()
+	return {
+		"peer": peer,
+		"messages": len(stream),
+		"steps": steps,
+		"wall_time": time.perf_counter() - start_time,
+		"step_ms": {
+			"mean": statistics.fmean(step_times) * 1000 if step_times else 0.0,
+			"max": step_times[-1] * 1000 if step_times else 0.0
+		},
+		"level_id": game.level_id,
+		"enemies": len(game.enemies),
+		"players": len(game.players),
+		"server_tick": game.client.server_tick
+	}
+
+
+def print_replay(replay):
+	print(f"[REPLAY]: {replay['messages']} messages to {replay['peer']} in {replay['steps']} steps, {replay['wall_time']:.2f}s.")
+	print(f"  Step time (ms): mean={replay['step_ms']['mean']:.3f}  max={replay['step_ms']['max']:.3f}")
+	print(f"  Final state: level {replay['level_id']}, {replay['enemies']} enemies, {replay['players']} players, server tick {replay['server_tick']}")
@@ -1,14 +1,21 @@
 import socket
 import threading
+import collections
+import queue
 import traceback
 import time
 import os
-import pygame
 
+from scripts.socket.transport import open_connection, frame, state_message, is_state_message, split_state_message
+from scripts.socket.interest import resync_message
 
 FORMAT = "utf-8"
 DISCONNECT_MESSAGE = "!leave"
-MAX_CLIENT_COUNT = 4
+MAX_CLIENT_COUNT = 32
+SLOT_GRACE_PERIOD = 10  # Seconds a dropped client's slot is kept by the server, for it to reconnect with its token.
+RECONNECT_INTERVAL = 0.1  # Seconds between two reconnection attempts.
+SEND_RATE = 60  # State messages sent per second.
+DELAY_SAMPLES = 1000  # How many of the latest queueing delays are kept around.
 os.system("")  # Enable ANSI escape characters in terminal.
 
 
@@ -110,28 +117,70 @@ class ChatClient:
 
 
 class GameClient(ChatClient):
-	def __init__(self, game, client_id, ip="", port=5050, nickname="Default_Client"):
+	def __init__(self, game, client_id, ip="", port=5050, nickname="Default_Client", transport="tcp", wrap_socket=None, room="",
+				send_rate=SEND_RATE, flush_control=True, capture=None):
 		super().__init__(ip=ip, port=port, nickname=nickname)
+		# The connection is opened by connect(), over the chosen transport.
+		self.client_socket.close()
+		self.client_socket = None
+		self.running = False  # Until connected.
+		self.transport = transport
+		self.wrap_socket = wrap_socket
+		self.room = room  # Only asked for by a room server, an empty name picks its default room.
+
 		self.game = game
-		self.entities = game.entities  # A list of entities to update.
 		self.tilemap = game.tilemap
 
-		self.fps = 60
-		self.clock = pygame.time.Clock()
+		# The send thread writes the state at 'send_rate', control messages are batched into a single write,
+		# either right away ('flush_control') or along with the next state.
+		self.send_rate = send_rate
+		self.flush_control = flush_control
+		self.control_outbox = collections.deque()  # [(queued_at, message)]
+		self.send_wakeup = threading.Event()
+		self.urgent_control = False  # Some queued control message can't wait for the next state, even without 'flush_control'.
 
 		self.client_id = client_id  # Host, Client1, Client2,...
 		self.client_index = -1
+		self.server_tick = 0
 		self.game_started = False
 
+		# Received messages wait here until the game loop handles them, so the entities are only ever touched by its thread.
+		self.inbox = queue.SimpleQueue()  # [(received_at, message)]
+		self.last_received_at = 0.0  # Arrival time of the message being handled.
+		# The state to send next, published by the game loop as a whole once per frame: (frame, message).
+		self.outbound = None
+		self.published_frames = 0
+
+		# Time spent by messages waiting in the inbox and in the control outbox, in seconds.
+		self.inbox_delays = collections.deque(maxlen=DELAY_SAMPLES)
+		self.outbox_delays = collections.deque(maxlen=DELAY_SAMPLES)
+
+		# An opt-in TrafficRecorder, every message sent or received is written to its capture.
+		self.capture = capture
+
+		# Readiness of the handshake, waited on by the menus instead of sleeping.
+		self.handshake_done = threading.Event()  # Set once the server took this client in or turned it down, or the connection dropped.
+		self.session_started = threading.Event()
+		self.join_error = ""
+		self.ping = None  # Round trip of opening the connection, in seconds.
+
+		# Issued by the server at join, it gets this client its slot back if the connection drops.
+		self.session_token = ""
+		self.dropped_at = None  # When the connection dropped, until the session is caught up again.
+		self.reconnect_times = []  # From the drop to the resync, in seconds.
+
 
 	def disconnect(self):
+		self.handshake_done.set()
 		if self.running:
 			try:
 				print(f"[DISCONNECTING]: You have disconnected from the server.")
 				self.running = False
 				self.game_started = False
+				self.outbound = None
+				self.send_wakeup.set()
 				time.sleep(0.1)
-				self.client_socket.send(DISCONNECT_MESSAGE.encode(FORMAT))
+				self.client_socket.send(DISCONNECT_MESSAGE)
 				self.client_socket.close()
 			except (ConnectionError, ConnectionAbortedError, ConnectionRefusedError, ConnectionResetError):
 				print("[CLOSED]: Server has shutdown.")
@@ -140,149 +189,378 @@ class GameClient(ChatClient):
 
 
 	def update_entity(self, sender_id, infos):
+		""" Applies a single state record, returns the ID of the enemy it removed if any. """
 		# Only update other clients' players and enemies.
-		for entity in self.entities.copy():
-			if entity.id == infos[0]:
+		if infos[0].startswith("player_"):
+			# The main player is registered as "main_player", so it's never found here.
+			player = self.game.players.by_id(infos[0])
+			if player is not None:
 				# [player_ID, last_movement[0], last_movement[1], pos[0], pos[1], dashing, jump, is_dead]
-				if entity.type == "player":
-					#print(f"{self.client_id} updating player: {entity.id}")
-					entity.dashing = int(infos[5])
-					entity.died = infos[7] == "True"
-					entity.update(self.tilemap, movement=tuple(map(int, infos[1:3])), override_pos=tuple(map(float, infos[3:5])))
-					if infos[6] == "True":
-						entity.jump()
-				
-				elif entity.type == "enemy" and sender_id == "host":
-					# [enemy_ID, walking, facing_left]
-					dead = entity.update(self.tilemap, walking=int(infos[1]), facing_left=infos[2] == "True")
-					if dead:
-						self.entities.remove(entity)
-				return
+				player.dashing = int(infos[5])
+				player.died = infos[7] == "True"
+				player.update(self.tilemap, movement=tuple(map(int, infos[1:3])), override_pos=tuple(map(float, infos[3:5])))
+				if infos[6] == "True":
+					player.jump()
+			return None
+
+		# Enemies are simulated by the host, or by a dedicated server.
+		if sender_id not in ("host", "server"):
+			return None
+
+		# A dedicated server marks enemies entering this client's view with "+", and leaving it with "-".
+		marker = infos[0][0] if infos[0][0] in "+-" else ""
+		enemy_id = infos[0][len(marker):]
+		enemy = self.game.enemy_store.find(enemy_id)
+		if enemy is None:
+			return None
+
+		if marker == "-":
+			# [-enemy_ID] or [-enemy_ID, dead]
+			if len(infos) > 1:
+				return enemy_id
+			enemy.in_view = False
+			return None
+
+		if marker == "+":
+			enemy.in_view = True
+
+		if len(infos) > 3:
+			# [enemy_ID, walking, facing_left, pos[0], pos[1]], the server's state after its own step.
+			enemy.walking = int(infos[1])
+			enemy.facing_left = infos[2] == "True"
+			# In place, the position may be a view onto an EnemyBatch.
+			enemy.pos[0], enemy.pos[1] = float(infos[3]), float(infos[4])
+		# [enemy_ID, walking, facing_left]
+		elif enemy.update(self.tilemap, walking=int(infos[1]), facing_left=infos[2] == "True"):
+			return enemy_id
+		return None
+
+
+	def apply_snapshot(self, sender_id, segments):
+		""" Applies every record of a state message in one pass, the enemies it removed are despawned together at the end. """
+		removed = set()
+		# The main player moves on its own between messages, so the players' hash is out of date when one arrives,
+		# and again after each player record. It's rebuilt lazily, before the enemy records that check dashes against it.
+		index_stale = True
+		for segment in segments:
+			infos = segment.split(",")
+			if infos[0] == "tick":
+				self.server_tick = int(infos[1])
+			elif infos[0].startswith("player_"):
+				self.update_entity(sender_id, infos)
+				index_stale = True
+			else:
+				if index_stale:
+					self.game.players.index_positions()
+					index_stale = False
+				enemy_id = self.update_entity(sender_id, infos)
+				if enemy_id is not None:
+					removed.add(enemy_id)
+
+		if removed:
+			self.game.despawn_enemies(removed)
+
+
+	def resync(self, message):
+		""" Catches up with the session after reconnecting, from the full state sent by the host or the server. """
+		# [level_ID, enemy_ID, walking, facing_left, pos[0], pos[1]; ...]
+		records = message.split(":", 1)[1].split(";")
+		self.game.resync(int(records[0]))
+		self.session_started.set()
+
+		alive = set()
+		for record in records[1:]:
+			infos = record.split(",")
+			alive.add(infos[0])
+			self.update_entity("server", infos)
+		# Whatever died while this client was away.
+		self.game.despawn_enemies({enemy.id for enemy in self.game.enemies if enemy.id not in alive})
+
+		if self.dropped_at is not None:
+			self.reconnect_times.append(time.perf_counter() - self.dropped_at)
+			print(f"[RESUMED]: Back in the session after {self.reconnect_times[-1] * 1000:.0f} ms.")
+			self.dropped_at = None
+
+
+	def handle_message(self, message):
+		if message == DISCONNECT_MESSAGE:
+			raise ClientDisconnectException()
+		elif message.startswith("RESYNC:"):
+			self.resync(message)
+		elif message.startswith("[RESYNC REQUEST]"):
+			# Only ever sent to the host, the answer goes to the reconnected client alone.
+			if self.game_started:
+				self.send_manually(f"@{message.split(':')[1]} {resync_message(self.game)}")
+		elif message == "[START GAME]":
+			self.game.start_game()
+			self.session_started.set()
+		elif message.startswith("[JOIN FAILED]"):
+			self.join_error = message.split(": ", 1)[-1]
+			self.handshake_done.set()
+		elif "PLAYER READY" in message:
+			self.game.ready_for_launch()
+		
+		elif "NEW PLAYERS JOINED" in message:
+			# [str(index), str(client_id), str(nicknames), str(client_ids)]
+			player_infos = message.split(":")[1].split(";")
+			index = int(player_infos[0])
+
+			if self.client_index == -1:
+				self.client_index = index
+				self.client_id = player_infos[1]
+
+			# [int(index), str(client_id), list(nicknames), list(client_ids)]
+			self.game.on_connection_made(index, player_infos[2].split(","), player_infos[3].split(","))
+			self.handshake_done.set()
+			
+		elif "PLAYER LEFT" in message:
+			player_index = int(message.split(":")[1])
+			if self.client_index > player_index:
+				self.client_index -= 1
+			self.game.on_player_left(player_index)
+
+		elif "RE_INITIALIZE" in message:
+			# [str(index), str(client_id), str(nicknames), str(client_ids)]
+			infos = message.split(":")[1].split(";")
+			index = int(infos[0])
+			self.client_index = index
+			self.client_id = infos[1]
+			self.game.on_connection_made(index, infos[2].split(","), infos[3].split(","), re_initialized=True)
+		
+		elif self.game_started and is_state_message(message):
+			self.apply_snapshot(*split_state_message(message))
 
 
-	def receive(self):
-		while self.running:
+	def process_inbox(self):
+		""" Handles every message received since the last call, on the calling thread, usually the game loop's once per frame. """
+		while True:
 			try:
-				message = self.client_socket.recv(1024).decode(FORMAT)
-				#print(f"RECEIVED: {message}")
-				message = message.split("|")[0]
+				self.last_received_at, message = self.inbox.get_nowait()
+			except queue.Empty:
+				return
 
-				if message == DISCONNECT_MESSAGE:
-					raise ClientDisconnectException()
-				elif message == "[NICKNAME]":
-					self.client_socket.send(self.nickname.encode(FORMAT))
-				elif message == "[CLIENT ID]":
-					self.client_socket.send(self.client_id.encode(FORMAT))
-				elif message == "[START GAME]":
-					self.game.start_game()
-				elif "PLAYER READY" in message:
-					self.game.ready_for_launch()
-				
-				elif "NEW PLAYERS JOINED" in message:
-					# [str(index), str(client_id), str(nicknames), str(client_ids)]
-					player_infos = message.split(":")[1].split(";")
-					index = int(player_infos[0])
-
-					if self.client_index == -1:
-						self.client_index = index
-						self.client_id = player_infos[1]
-
-					# [int(index), str(client_id), list(nicknames), list(client_ids)]
-					self.game.on_connection_made(index, player_infos[2].split(","), player_infos[3].split(","))
-					
-				elif "PLAYER LEFT" in message:
-					player_index = int(message.split(":")[1])
-					self.entities[player_index].unregister_client(player_index)
-
-				elif "RE_INITIALIZE" in message:
-					# [str(index), str(client_id), str(nicknames), str(client_ids)]
-					infos = message.split(":")[1].split(";")
-					index = int(infos[0])
-					self.client_index = index
-					self.client_id = infos[1]
-					self.game.on_connection_made(index, infos[2].split(","), infos[3].split(","), re_initialized=True)
-				
-				elif self.game_started:
-					message_segments = message.split(";")
-					sender_id = message_segments[0]
-					for segment in message_segments[1:]:
-						infos = segment.split(",")
-						self.update_entity(sender_id, infos)
-
-				self.clock.tick(self.fps)
-		
+			self.inbox_delays.append(time.perf_counter() - self.last_received_at)
+			try:
+				self.handle_message(message)
 			except ClientDisconnectException:
 				self.game.disconnect_from_server()
+				return
+			except Exception:
+				print(f"[ERROR]: An unexpected error occurred!\n{traceback.format_exc()}")
+				self.game.disconnect_from_server()
+				return
+
+
+	def publish_state(self):
+		""" Freezes this frame's state into the message the send thread sends next, called by the game loop once its frame is updated. """
+		if not self.game_started:
+			return
+
+		message = [self.client_id]
+
+		# Send info of both entity types if this is the host.
+		# Otherwise only send info of the corresponding client's player.
+		# [player_ID, last_movement[0], last_movement[1], pos[0], pos[1], dashing, jump, is_dead]
+		main_player = self.game.get_main_player()
+		message.append(f"player_{self.client_index + 1}," +
+						f"{main_player.last_movement[0]},{main_player.last_movement[1]}," +
+						f"{main_player.pos[0]:.1f},{main_player.pos[1]:.1f}," +
+						f"{main_player.dashing}," +
+						f"{main_player.jumped}," +
+						f"{main_player.died}")
+
+		if self.client_id == "host":
+			dead_enemies = set()
+			for enemy in self.game.enemies:
+				# [enemy_ID, walking, facing_left]
+				message.append(f"{enemy.id},{enemy.walking},{enemy.facing_left}")
+				if enemy.is_dead:
+					dead_enemies.add(enemy.id)
+			# Dead enemies are sent one last time, so that the clients remove them too.
+			if dead_enemies:
+				self.game.despawn_enemies(dead_enemies)
+
+		# Add a delimeter between each message to avoid duplication.
+		self.published_frames += 1
+		self.outbound = (self.published_frames, f"{state_message(message[0], message[1:])}|")
+
+
+	def receive(self):
+		# Blocks until something arrives, then queues everything that's available at once.
+		while self.running:
+			try:
+				messages = self.client_socket.receive()
+				received_at = time.perf_counter()
+				for message in messages:
+					if self.capture is not None:
+						self.capture.record("in", "server", message)
+					# The handshake is answered right away, it only concerns the connection itself.
+					if message == "[NICKNAME]":
+						self.transmit(self.nickname)
+					elif message == "[CLIENT ID]":
+						self.transmit(self.client_id)
+					elif message == "[ROOM]":
+						self.transmit(self.room)
+					elif message == "[SESSION TOKEN]":
+						self.transmit(self.session_token)
+					elif message.startswith("[TOKEN]"):
+						self.session_token = message.split(":", 1)[1]
+					elif message.startswith("[PING]"):
+						# Echoed right away, so that the server measures the network rather than the frame rate.
+						self.send_manually(f"[PONG]:{message.split(':', 1)[1]}", urgent=True)
+					else:
+						if message == DISCONNECT_MESSAGE:
+							# The server closed the session on purpose, there's no slot to come back to.
+							self.session_token = ""
+						self.inbox.put((received_at, message))
 			
 			except (ConnectionError, ConnectionAbortedError, ConnectionRefusedError, ConnectionResetError):
-				print("[INTERRUPTED]: Connection has been interrupted. Disconnecting...")
-				self.game.disconnect_from_server()
+				if self.reconnect():
+					continue
+				if self.running:
+					print("[INTERRUPTED]: Connection has been interrupted. Disconnecting...")
+					self.inbox.put((time.perf_counter(), DISCONNECT_MESSAGE))
+				return
 
 			except Exception:
 				print(f"[ERROR]: An unexpected error occurred!\n{traceback.format_exc()}")
-				self.game.disconnect_from_server()
+				self.inbox.put((time.perf_counter(), DISCONNECT_MESSAGE))
+				return
+
+
+	def reconnect(self):
+		""" Opens a new connection after the current one dropped, for as long as the server keeps the slot.
+			The server then answers the token with the slot's players and the state of the session. """
+		if not self.running or not self.session_token:
+			return False
+
+		self.dropped_at = time.perf_counter()
+		print("[INTERRUPTED]: Connection has been interrupted. Reconnecting...")
+		deadline = self.dropped_at + SLOT_GRACE_PERIOD
+		while self.running and time.perf_counter() < deadline:
+			try:
+				self.client_socket = open_connection((self.server_ip, self.port), transport=self.transport, wrap_socket=self.wrap_socket)
+				print("[RECONNECTED]: Resuming the session...")
+				self.send_wakeup.set()
+				return True
+			except OSError:
+				time.sleep(RECONNECT_INTERVAL)
+
+		print("[TIMED OUT]: The server didn't take this client back in time.")
+		self.session_token = ""
+		self.dropped_at = None
+		return False
+
+
+	def transmit(self, message, reliable=True):
+		if self.capture is not None:
+			self.capture.record("out", "server", message)
+		self.client_socket.send(message, reliable=reliable)
+
+
+	def flush_control_messages(self):
+		# Everything queued so far goes out in a single write, each message keeps its own delimiter.
+		batch = []
+		now = time.perf_counter()
+		while self.control_outbox:
+			queued_at, message = self.control_outbox.popleft()
+			self.outbox_delays.append(now - queued_at)
+			batch.append(frame(message))
+			if self.capture is not None:
+				self.capture.record("out", "server", message)
+		if batch:
+			self.client_socket.send("".join(batch))
 
 
 	def send(self):
+		send_interval = 1 / self.send_rate
+		next_send = time.perf_counter()
+		last_frame = 0
 		while self.running:
 			try:
-				if self.game_started:
-					message = [self.client_id]
-					
-					# Send info of both entity types if this is the host.
-					# Otherwise only send info of the corresponding client's player.
-					# [player_ID, last_movement[0], last_movement[1], pos[0], pos[1], dashing, jump, is_dead]
-					main_player = self.game.get_main_player()
-					message.append(f"player_{self.client_index + 1}," +
-									f"{main_player.last_movement[0]},{main_player.last_movement[1]}," +
-									f"{main_player.pos[0]:.1f},{main_player.pos[1]:.1f}," +
-									f"{main_player.dashing}," +
-									f"{main_player.jumped}," +
-									f"{main_player.died}")
-
-					if self.client_id == "host":
-						for entity in self.entities[4:]:
-							# [enemy_ID, walking, facing_left]
-							message.append(f"{entity.id},{entity.walking},{entity.facing_left}")
-							if entity.is_dead:
-								self.entities.remove(entity)
-
-					# Add a delimeter between each message to avoid duplication.
-					message = f"{';'.join(message)}|"
-					#print(f"SENT: {message}")
-					self.client_socket.send(message.encode(FORMAT))
-
-				self.clock.tick(self.fps)
+				# Sleeps until the next state is due, unless a control message needs to go out now.
+				self.send_wakeup.wait(max(0.0, next_send - time.perf_counter()))
+				self.send_wakeup.clear()
+
+				now = time.perf_counter()
+				state_due = now >= next_send
+				if self.flush_control or state_due or self.urgent_control:
+					# Cleared first, a message queued during the flush wakes the next round.
+					self.urgent_control = False
+					self.flush_control_messages()
+
+				if state_due:
+					# Only the latest published state is sent, a frame that was superseded before its turn is skipped.
+					outbound = self.outbound
+					if self.game_started and outbound is not None and outbound[0] != last_frame:
+						last_frame, message = outbound
+						self.transmit(message, reliable=False)
+					# After a stall, carry on from now instead of catching up with a burst.
+					next_send = max(next_send + send_interval, now)
 
 			except (ConnectionError, ConnectionAbortedError, ConnectionRefusedError, ConnectionResetError, AttributeError):
-				print("[INTERRUPTED]: Connection has been interrupted. Disconnecting...")
-				self.game.disconnect_from_server()
+				# The receive thread is getting the connection back, carry on with the new one.
+				if self.running and self.session_token:
+					time.sleep(RECONNECT_INTERVAL)
+					continue
+				if self.running:
+					print("[INTERRUPTED]: Connection has been interrupted. Disconnecting...")
+					self.inbox.put((time.perf_counter(), DISCONNECT_MESSAGE))
+				return
 
 			except Exception:
 				print(f"[ERROR]: An unexpected error occurred!\n{traceback.format_exc()}")
-				self.game.disconnect_from_server()
+				self.inbox.put((time.perf_counter(), DISCONNECT_MESSAGE))
+				return
+
+
+	def queueing_delay(self):
+		""" Average and worst time the latest messages waited in the inbox and the control outbox, in milliseconds. """
+		delays = {}
+		for name, samples in (("inbox", list(self.inbox_delays)), ("outbox", list(self.outbox_delays))):
+			delays[name] = {
+				"mean": sum(samples) / len(samples) * 1000 if samples else 0.0,
+				"max": max(samples, default=0.0) * 1000
+			}
+		return delays
+
+
+	def send_manually(self, message, urgent=False):
+		# Control messages are handed to the send thread, which is the only one writing once connected.
+		# Urgent ones go out as soon as it wakes, the others may wait for the next state.
+		self.control_outbox.append((time.perf_counter(), str(message)))
+		if urgent:
+			self.urgent_control = True
+		if self.flush_control or urgent:
+			self.send_wakeup.set()
 
 
 	def connect(self):
 		try:
 			print(f"[CONNECTING]: Attempting to connect to Server ({self.server_ip} - port {self.port})...")
-			self.client_socket.connect((self.server_ip, self.port))
+			start_time = time.perf_counter()
+			self.client_socket = open_connection((self.server_ip, self.port), transport=self.transport, wrap_socket=self.wrap_socket)
+			self.ping = time.perf_counter() - start_time
+			self.running = True
 
 			threading.Thread(target=self.receive).start()
 			threading.Thread(target=self.send).start()
 
 			return True
 		
-		except (ConnectionRefusedError, TimeoutError):
-			print("[ERROR]: Connect failed, please check the server's IP and Port, then try again.")
-			print(traceback.format_exc())
-			self.game.disconnect_from_server()
-		
 		except (ConnectionResetError, ConnectionAbortedError):
 			print("[ERROR]: Connection disrupted, possibly due to a forcibly closed session from the server side or network error.")
 			print(traceback.format_exc())
 			self.game.disconnect_from_server()
 
+		# Refused, timed out, unreachable,...
+		except OSError:
+			print("[ERROR]: Connect failed, please check the server's IP and Port, then try again.")
+			print(traceback.format_exc())
+			self.game.disconnect_from_server()
+
+		return False
+
 
 if __name__ == "__main__":
 	ChatClient().connect()
\ No newline at end of file
@@ -0,0 +1,121 @@
+import threading
+import time
+
+from scripts.headless import HeadlessGame
+from scripts.socket.server import GameServer
+from scripts.socket.interest import InterestManager, resync_message
+from scripts.socket.transport import is_state_message, split_state_message
+
+
+TICK_RATE = 60
+
+
+class DedicatedServer(GameServer):
+	""" An authoritative server that simulates the game world itself at a fixed tick, without any display.
+		Every player, including the one who launches the session, joins as a normal client. """
+	def __init__(self, ip, port, tick_rate=TICK_RATE, transport="tcp", wrap_socket=None, capture=None, metrics=None,
+				batched_physics=False, enemy_lod=False):
+		super().__init__(ip, port, transport=transport, wrap_socket=wrap_socket, capture=capture, metrics=metrics)
+		self.world = HeadlessGame(client_id="server", batched_physics=batched_physics, enemy_lod=enemy_lod)
+		self.batched_physics = batched_physics
+		self.enemy_lod = enemy_lod
+		self.interest = InterestManager(self.world)
+		self.tick_rate = tick_rate
+		self.tick = 0
+		self.start_requested = False
+
+
+	def shutdown(self):
+		super().shutdown()
+		self.world.stop_game()
+
+
+	def session_name(self):
+		return "Dedicated server"
+
+
+	def remove_client(self, address, removed_id, removed_index):
+		super().remove_client(address, removed_id, removed_index)
+
+		# The world's players move up a slot along with their clients.
+		self.world.players.unregister(removed_index)
+		self.interest.reset()
+
+		if not self.client_count():
+			print("[IDLE]: All players have left, stopping the session.")
+			self.world.stop_game()
+
+
+	def resync_client(self, client, client_id, client_index):
+		# The world is right here, the client gets it at once and everything in view is announced again.
+		if self.world.running:
+			self.send_to(client, resync_message(self.world))
+			self.interest.visible.pop(client_index, None)
+
+
+	def handle_message(self, client_id, message):
+		if message == "*[START GAME]":
+			self.start_requested = True
+		elif is_state_message(message):
+			# [client_ID, player_ID, last_movement[0], last_movement[1], pos[0], pos[1], dashing, jump, is_dead]
+			for segment in split_state_message(message)[1]:
+				infos = segment.split(",")
+				if infos[0].startswith("player_"):
+					self.world.apply_player_update(infos)
+
+			# Players reach each other through the next snapshot, rather than every update being relayed to everyone.
+			return
+
+		self.broadcast(client_id, message)
+
+
+	def step(self):
+		if self.start_requested:
+			self.start_requested = False
+			self.tick = 0
+			self.world.start_game()
+			self.interest.reset()
+			print(f"[SESSION STARTED]: Simulating level {self.world.level_id} at {self.tick_rate} ticks per second.")
+
+		if self.world.running:
+			if self.world.ai_scheduler is not None:
+				# A client whose player the world doesn't know yet is sent every enemy step by step.
+				self.world.ai_scheduler.wake_all = any(self.world.players.get(index) is None for index in range(len(self.recipients)))
+			self.world.tick()
+			self.tick += 1
+			self.send_snapshots()
+
+
+	def send_snapshots(self):
+		# Each client gets its own snapshot, built around its player.
+		start_time = time.perf_counter()
+		self.interest.update(self.tick)
+		for index, (_, client) in enumerate(self.recipients):
+			self.send_to(client, self.interest.snapshot_message(index, self.tick), reliable=False)
+		self.metrics.fanouts["snapshot"].observe(time.perf_counter() - start_time)
+
+
+	def run_simulation(self):
+		tick_interval = 1 / self.tick_rate
+		next_tick = time.perf_counter()
+
+		while self.running:
+			start_time = time.perf_counter()
+			self.step()
+			self.metrics.add_busy_time("simulation", time.perf_counter() - start_time)
+
+			# Sleep until the next tick, skip ahead instead of spiraling if we fell behind.
+			next_tick += tick_interval
+			delay = next_tick - time.perf_counter()
+			if delay > 0:
+				time.sleep(delay)
+			else:
+				next_tick = time.perf_counter()
+
+
+	def serve_forever(self):
+		threading.Thread(target=self.start_server, daemon=True).start()
+		try:
+			self.run_simulation()
+		except KeyboardInterrupt:
+			self.shutdown()
@@ -0,0 +1,158 @@
+import collections
+import socket
+import threading
+import time
+import uuid
+
+
+DISCOVERY_PORT = 5049
+PROBE_HEADER = "SILLY_NINJA_DISCOVER:"
+ANSWER_HEADER = "SILLY_NINJA_SESSION:"
+# Broadcast reaches the LAN, loopback a server running on this very machine.
+PROBE_TARGETS = ("255.255.255.255", "127.0.0.1")
+LISTEN_TIME = 0.5  # Seconds to wait for answers after probing.
+REFRESH_INTERVAL = 2  # Seconds between two searches of a SessionBrowser.
+
+# ip and port are where to connect, ping is the round trip of the probe in seconds.
+SessionInfo = collections.namedtuple("SessionInfo", ["server_id", "name", "players", "max_players", "ip", "port", "transport", "ping"])
+
+
+def clean_field(text):
+	# Fields are separated by ";", and a nickname may contain anything.
+	return str(text).replace(";", ",").replace("|", "/")
+
+
+class DiscoveryResponder:
+	""" Answers the probes sent by the JoinMenus on the LAN with what the server is hosting. """
+	def __init__(self, server, port=DISCOVERY_PORT):
+		self.server = server
+		self.port = port
+		self.server_id = uuid.uuid4().hex[:8]
+		self.socket = None
+		self.running = False
+
+
+	def start(self):
+		self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		# Several servers on one machine all get the broadcast probes.
+		self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		try:
+			self.socket.bind(("", self.port))
+		except OSError as error:
+			print(f"[DISCOVERY]: Could not listen for probes on port {self.port}, the server can only be joined by IP. {error}")
+			self.socket.close()
+			return False
+
+		# Wakes up now and then to notice it was closed.
+		self.socket.settimeout(0.5)
+		self.running = True
+		threading.Thread(target=self.serve, daemon=True).start()
+		return True
+
+
+	def answer(self, probe_id):
+		server = self.server
+		# [probe_ID, server_ID, name, players, max_players, ip, port, transport]
+		return (f"{ANSWER_HEADER}{probe_id};{self.server_id};{clean_field(server.session_name())};" +
+				f"{server.client_count()};{server.max_client_count()};{server.ip};{server.port};{server.transport}")
+
+
+	def serve(self):
+		while self.running:
+			try:
+				data, address = self.socket.recvfrom(1024)
+				message = data.decode("utf-8", errors="replace")
+				if message.startswith(PROBE_HEADER):
+					self.socket.sendto(self.answer(message[len(PROBE_HEADER):]).encode("utf-8"), address)
+			except socket.timeout:
+				continue
+			except OSError:
+				break
+
+
+	def close(self):
+		self.running = False
+		if self.socket is not None:
+			self.socket.close()
+
+
+def parse_answer(message, sender_ip, probe_id, ping):
+	if not message.startswith(ANSWER_HEADER):
+		return None
+	infos = message[len(ANSWER_HEADER):].split(";")
+	if len(infos) != 8 or infos[0] != probe_id:
+		return None
+
+	# A server listening on every interface is reached through the address it answered from.
+	ip = infos[5] if infos[5] not in ("", "0.0.0.0") else sender_ip
+	try:
+		return SessionInfo(infos[1], infos[2], int(infos[3]), int(infos[4]), ip, int(infos[6]), infos[7], ping)
+	except ValueError:
+		return None
+
+
+def discover_sessions(listen_time=LISTEN_TIME, port=DISCOVERY_PORT, targets=PROBE_TARGETS):
+	""" Probes the LAN for servers and returns what they host, the closest first. """
+	probe_id = uuid.uuid4().hex[:8]
+	sessions = {}
+	with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+		sent_time = time.perf_counter()
+		for target in targets:
+			try:
+				sock.sendto(f"{PROBE_HEADER}{probe_id}".encode("utf-8"), (target, port))
+			except OSError:
+				# No route for broadcasts, e.g. while offline.
+				pass
+
+		deadline = sent_time + listen_time
+		while True:
+			remaining = deadline - time.perf_counter()
+			if remaining <= 0:
+				break
+			sock.settimeout(remaining)
+			try:
+				data, address = sock.recvfrom(1024)
+			except (socket.timeout, OSError):
+				break
+
+			session = parse_answer(data.decode("utf-8", errors="replace"), address[0], probe_id, time.perf_counter() - sent_time)
+			# The same server may answer both the broadcast and the loopback probe.
+			if session is not None and session.server_id not in sessions:
+				sessions[session.server_id] = session
+
+	return sorted(sessions.values(), key=lambda session: session.ping)
+
+
+class SessionBrowser:
+	""" Keeps searching for sessions on a thread of its own, so that a menu can list them without ever waiting. """
+	def __init__(self, port=DISCOVERY_PORT, targets=PROBE_TARGETS, refresh_interval=REFRESH_INTERVAL):
+		self.port = port
+		self.targets = targets
+		self.refresh_interval = refresh_interval
+		self.sessions = ()  # Replaced as a whole after every search, the closest first.
+		self.searches = 0
+		self.running = False
+		self.wakeup = threading.Event()
+		self.thread = None
+
+
+	def start(self):
+		self.running = True
+		# A search still finishing after stop() just carries on.
+		if self.thread is None or not self.thread.is_alive():
+			self.thread = threading.Thread(target=self.search, daemon=True)
+			self.thread.start()
+
+
+	def search(self):
+		while self.running:
+			self.sessions = tuple(discover_sessions(port=self.port, targets=self.targets))
+			self.searches += 1
+			self.wakeup.wait(self.refresh_interval)
+			self.wakeup.clear()
+
+
+	def stop(self):
+		self.running = False
+		self.wakeup.set()
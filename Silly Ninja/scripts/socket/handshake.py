@@ -0,0 +1,39 @@
+import time
+
+
+HANDSHAKE_TIMEOUT = 5  # Seconds each step may take before giving up, on the client and on the server alike.
+
+
+class Handshake:
+	""" The steps of getting into a lobby or a session, shown one after the other in the menu's status text.
+		Each step waits for the event that tells it's done, so it takes as long as the round trips it needs and no more,
+		or fails once its timeout runs out. """
+	def __init__(self, status_text, timeout=HANDSHAKE_TIMEOUT):
+		self.status_text = status_text
+		self.timeout = timeout
+		self.state = "IDLE"
+		self.start_time = time.perf_counter()
+
+
+	def enter(self, state, text):
+		self.state = state
+		self.status_text.set_text(f"[{state}]: {text}")
+
+
+	def wait(self, event, timeout=None):
+		return event.wait(self.timeout if timeout is None else timeout)
+
+
+	def fail(self, state, text):
+		self.enter(state, text)
+		return False
+
+
+	def elapsed_ms(self):
+		return (time.perf_counter() - self.start_time) * 1000
+
+
+def format_latency(client, handshake):
+	# e.g. "ping 3 ms, joined in 12 ms"
+	ping = f"ping {client.ping * 1000:.0f} ms, " if client.ping is not None else ""
+	return f"{ping}joined in {handshake.elapsed_ms():.0f} ms"
@@ -0,0 +1,160 @@
+import heapq
+import random
+import socket
+import threading
+import time
+
+
+class NetworkConditions:
+	""" Describes a bad network link: delays are in seconds, probabilities in [0, 1], bandwidth in bytes per second.
+		Pass wrap() as the 'wrap_socket' of a GameServer or GameClient to send everything through such a link. """
+	def __init__(self, latency=0.0, jitter=0.0, loss=0.0, reorder=0.0, bandwidth=None, retransmit_timeout=0.2):
+		self.latency = latency
+		self.jitter = jitter
+		self.loss = loss
+		self.reorder = reorder
+		self.bandwidth = bandwidth
+		# A stream can't lose data, a lost segment stalls it until the sender resends instead.
+		self.retransmit_timeout = retransmit_timeout
+		self.sockets = []
+
+
+	def __repr__(self):
+		bandwidth = "unlimited" if self.bandwidth is None else f"{self.bandwidth / 1024:.0f} KiB/s"
+		return (f"NetworkConditions: [Latency={self.latency * 1000:.0f}ms, Jitter={self.jitter * 1000:.0f}ms, " +
+				f"Loss={self.loss:.0%}, Reorder={self.reorder:.0%}, Bandwidth={bandwidth}]")
+
+
+	def wrap(self, sock):
+		impaired = ImpairedSocket(sock, self)
+		self.sockets.append(impaired)
+		return impaired
+
+
+	def bytes_sent(self):
+		return sum(sock.bytes_sent for sock in self.sockets)
+
+
+	def bytes_received(self):
+		return sum(sock.bytes_received for sock in self.sockets)
+
+
+class ImpairedSocket:
+	""" Wraps a stream or datagram socket and delays, drops or reorders what it sends according to the conditions.
+		Everything else is forwarded to the real socket. """
+	def __init__(self, sock, conditions):
+		self.socket = sock
+		self.conditions = conditions
+		self.is_stream = sock.type == socket.SOCK_STREAM
+
+		self.bytes_sent = 0
+		self.bytes_received = 0
+
+		self.queue = []  # [(delivery_time, order, data, address)]
+		self.condition = threading.Condition()
+		self.order = 0
+		self.link_free_time = 0.0
+		self.last_delivery_time = 0.0
+		self.error = None
+		self.closing = False
+		threading.Thread(target=self.deliver, daemon=True).start()
+
+
+	def __getattr__(self, name):
+		return getattr(self.socket, name)
+
+
+	def delivery_time(self, size):
+		conditions = self.conditions
+		now = time.perf_counter()
+
+		# Packets queue up behind each other on a capped link.
+		departure = max(now, self.link_free_time)
+		if conditions.bandwidth:
+			departure += size / conditions.bandwidth
+		self.link_free_time = departure
+
+		delay = max(0.0, conditions.latency + random.uniform(-conditions.jitter, conditions.jitter))
+		if random.random() < conditions.loss:
+			if not self.is_stream:
+				return None
+			delay += conditions.retransmit_timeout
+		elif not self.is_stream and random.random() < conditions.reorder:
+			# Hold the packet back long enough for the next ones to overtake it.
+			delay += conditions.latency + conditions.jitter + 0.005
+
+		delivery = departure + delay
+		if self.is_stream:
+			# A stream never reorders, late data holds back everything behind it.
+			delivery = max(delivery, self.last_delivery_time)
+			self.last_delivery_time = delivery
+		return delivery
+
+
+	def enqueue(self, data, address=None):
+		if self.error is not None:
+			raise self.error
+
+		with self.condition:
+			self.bytes_sent += len(data)
+			delivery = self.delivery_time(len(data))
+			if delivery is not None:
+				self.order += 1
+				heapq.heappush(self.queue, (delivery, self.order, bytes(data), address))
+				self.condition.notify()
+		return len(data)
+
+
+	def send(self, data):
+		return self.enqueue(data)
+
+
+	def sendall(self, data):
+		self.enqueue(data)
+
+
+	def sendto(self, data, address):
+		return self.enqueue(data, address)
+
+
+	def recv(self, size):
+		data = self.socket.recv(size)
+		self.bytes_received += len(data)
+		return data
+
+
+	def recvfrom(self, size):
+		data, address = self.socket.recvfrom(size)
+		self.bytes_received += len(data)
+		return data, address
+
+
+	def deliver(self):
+		while True:
+			with self.condition:
+				while not self.queue or self.queue[0][0] > time.perf_counter():
+					if self.closing and not self.queue:
+						self.socket.close()
+						return
+					self.condition.wait(None if not self.queue else self.queue[0][0] - time.perf_counter())
+				_, _, data, address = heapq.heappop(self.queue)
+
+			try:
+				if self.is_stream:
+					self.socket.sendall(data)
+				else:
+					self.socket.sendto(data, address)
+			except OSError as error:
+				self.error = error
+				if self.is_stream:
+					return
+
+
+	def close(self):
+		if self.is_stream:
+			# Let the data in flight arrive before closing, like the kernel would.
+			with self.condition:
+				self.closing = True
+				self.condition.notify()
+		else:
+			self.socket.close()
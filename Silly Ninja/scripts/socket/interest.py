@@ -0,0 +1,128 @@
+from scripts.regions import VIEW_RADIUS, region_of
+from scripts.socket.transport import state_message
+
+
+REDUCED_RATE = 10  # Entities out of view are only sent every that many ticks.
+REMOVAL_TICKS = 30  # How long a removal keeps being repeated, in case some snapshots get lost.
+
+
+def player_record(player):
+	# [player_ID, last_movement[0], last_movement[1], pos[0], pos[1], dashing, jump, is_dead]
+	return (f"{player.id},{player.last_movement[0]},{player.last_movement[1]}," +
+			f"{player.pos[0]:.1f},{player.pos[1]:.1f},{player.dashing},{player.jumped},{player.died}")
+
+
+def enemy_record(enemy, with_pos=False, prefix=""):
+	# [enemy_ID, walking, facing_left] to step the enemy, or [enemy_ID, walking, facing_left, pos[0], pos[1]] to put it in place.
+	if with_pos:
+		return f"{prefix}{enemy.id},{enemy.walking},{enemy.facing_left},{enemy.pos[0]:.1f},{enemy.pos[1]:.1f}"
+	return f"{prefix}{enemy.id},{enemy.walking},{enemy.facing_left}"
+
+
+def resync_message(world):
+	# [level_ID, enemy records with their positions...], everything a reconnecting client needs to catch up.
+	records = [str(world.level_id)] + [enemy_record(enemy, with_pos=True) for enemy in list(world.enemies)]
+	return f"RESYNC:{';'.join(records)}|"
+
+
+class InterestManager:
+	""" Builds a snapshot of the world for each client: what's in the regions around its player is sent every tick,
+		the rest only at a reduced rate, with its position so that it stays in place in between.
+		An enemy entering a client's view is announced by a spawn record ("+enemy_ID,..."), leaving it by a despawn one ("-enemy_ID"),
+		and one removed from the world by "-enemy_ID,dead". """
+	def __init__(self, world, view_radius=VIEW_RADIUS, reduced_rate=REDUCED_RATE):
+		self.world = world
+		self.view_radius = view_radius
+		self.reduced_rate = reduced_rate
+
+		self.regions = {}  # {(region_x, region_y): [entity,...]}
+		self.visible = {}  # {client_index: {enemy_ID,...}}
+		self.enemy_ids = set()
+		self.removed = {}  # {enemy_ID: tick}
+		self.level_id = -1
+
+
+	def reset(self):
+		# Clients got new indices or a new level, everyone starts over from an empty view.
+		self.visible = {}
+
+
+	def update(self, tick):
+		""" Buckets the entities by region, once per tick before building the snapshots. """
+		world = self.world
+		if world.level_id != self.level_id:
+			self.level_id = world.level_id
+			self.enemy_ids = set()
+			self.removed.clear()
+			self.reset()
+
+		regions = {}
+		enemy_ids = set()
+		for enemy in world.enemies:
+			enemy_ids.add(enemy.id)
+			regions.setdefault(region_of(enemy.pos), []).append(enemy)
+		for player in world.players:
+			regions.setdefault(region_of(player.pos), []).append(player)
+		self.regions = regions
+
+		for enemy_id in self.enemy_ids - enemy_ids:
+			self.removed[enemy_id] = tick
+		self.enemy_ids = enemy_ids
+		for enemy_id, removed_tick in list(self.removed.items()):
+			if tick - removed_tick > REMOVAL_TICKS:
+				del self.removed[enemy_id]
+
+
+	def nearby(self, player):
+		# Everything is in view until the server knows where the player is.
+		if player is None:
+			return list(self.world.players) + self.world.enemies
+
+		center_x, center_y = region_of(player.pos)
+		entities = []
+		for x in range(center_x - self.view_radius, center_x + self.view_radius + 1):
+			for y in range(center_y - self.view_radius, center_y + self.view_radius + 1):
+				entities.extend(self.regions.get((x, y), ()))
+		return entities
+
+
+	def snapshot_message(self, client_index, tick):
+		world = self.world
+		main_player = world.players.get(client_index)
+		visible = self.visible.get(client_index, set())
+		# Clients get their reduced rate records on different ticks, to spread the load.
+		reduced_tick = (tick + client_index) % self.reduced_rate == 0
+
+		# [server, tick, records...]
+		message = ["server", f"tick,{tick}"]
+		enemies_in_view = set()
+		players_in_view = set()
+		for entity in self.nearby(main_player):
+			if entity.type == "enemy":
+				enemies_in_view.add(entity.id)
+				if entity.id not in visible:
+					message.append(enemy_record(entity, with_pos=True, prefix="+"))
+				else:
+					# The position now and then keeps clients from drifting, should a step get lost.
+					message.append(enemy_record(entity, with_pos=reduced_tick))
+			elif entity is not main_player:
+				players_in_view.add(entity.id)
+				message.append(player_record(entity))
+
+		for enemy_id in visible - enemies_in_view:
+			if enemy_id in self.enemy_ids:
+				message.append(f"-{enemy_id}")
+
+		if reduced_tick:
+			for enemy in world.enemies:
+				if enemy.id not in enemies_in_view:
+					message.append(enemy_record(enemy, with_pos=True))
+			for player in world.players:
+				if player is not main_player and player.id not in players_in_view:
+					message.append(player_record(player))
+
+		for enemy_id in self.removed:
+			message.append(f"-{enemy_id},dead")
+
+		self.visible[client_index] = enemies_in_view
+		return f"{state_message(message[0], message[1:])}|"
@@ -0,0 +1,267 @@
+import bisect
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+PING_INTERVAL = 1  # Seconds between two pings of every client, to measure their round trip.
+# Upper bounds of the latency histogram buckets, in milliseconds. The last one catches everything slower.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, float("inf"))
+
+
+class LatencyHistogram:
+	""" Counts durations in fixed buckets, cheap enough to be fed on every broadcast. """
+	def __init__(self, buckets=LATENCY_BUCKETS):
+		self.buckets = buckets
+		self.counts = [0] * len(buckets)
+		self.count = 0
+		self.total = 0.0
+
+
+	def observe(self, seconds):
+		milliseconds = seconds * 1000
+		self.counts[bisect.bisect_left(self.buckets, milliseconds)] += 1
+		self.count += 1
+		self.total += milliseconds
+
+
+	def percentile(self, fraction):
+		# The upper bound of the bucket the percentile falls in.
+		target = fraction * self.count
+		seen = 0
+		for bound, count in zip(self.buckets, self.counts):
+			seen += count
+			if seen >= target and count:
+				return bound
+		return 0.0
+
+
+	def snapshot(self):
+		return {
+			"count": self.count,
+			"mean_ms": self.total / self.count if self.count else 0.0,
+			"p50_ms": self.percentile(0.5),
+			"p99_ms": self.percentile(0.99),
+			"buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)}  # {upper_bound_ms: count}
+		}
+
+
+class ClientMetrics:
+	def __init__(self, client_id, room=""):
+		self.client_id = client_id  # Kept up to date by the server, as clients move up a slot.
+		self.room = room
+		self.held = False  # Dropped, waiting for the client to come back.
+		self.messages_in = 0
+		self.bytes_in = 0
+		self.messages_out = 0
+		self.bytes_out = 0
+		self.rtt = None  # Seconds, from the latest answered ping.
+
+
+class ServerMetrics:
+	""" What a GameServer has been doing: traffic and round trip per client, how long its fan-outs take
+		and how busy its threads are. Counters are only ever incremented, rates are worked out between two snapshots. """
+	def __init__(self):
+		self.clients = {}  # {client_socket: ClientMetrics}
+		self.fanouts = {"broadcast": LatencyHistogram(), "snapshot": LatencyHistogram()}
+		self.busy_time = {}  # {thread_name: seconds spent working rather than waiting}
+		self.start_time = time.perf_counter()
+		self.last_snapshot = (self.start_time, time.process_time(), {}, {})
+		self.lock = threading.Lock()
+
+
+	def add_client(self, client, client_id, room=""):
+		with self.lock:
+			self.clients[client] = ClientMetrics(client_id, room)
+
+
+	def remove_client(self, client):
+		with self.lock:
+			self.clients.pop(client, None)
+
+
+	def on_received(self, client, message):
+		metrics = self.clients.get(client)
+		if metrics is not None:
+			metrics.messages_in += 1
+			metrics.bytes_in += len(message) + 1
+
+
+	def on_sent(self, client, message):
+		metrics = self.clients.get(client)
+		if metrics is not None:
+			metrics.messages_out += 1
+			metrics.bytes_out += len(message) + 1
+
+
+	def rename_clients(self, clients):
+		# {client_ID: client_socket} of a server, after clients joined, left or came back.
+		for client_id, client in clients.items():
+			metrics = self.clients.get(client)
+			if metrics is not None:
+				metrics.client_id = client_id
+
+
+	def set_held(self, client, held):
+		metrics = self.clients.get(client)
+		if metrics is not None:
+			metrics.held = held
+
+
+	def on_pong(self, client, sent_time):
+		metrics = self.clients.get(client)
+		if metrics is not None:
+			metrics.rtt = time.perf_counter() - sent_time
+
+
+	def add_busy_time(self, thread_name, seconds):
+		# Many client threads add to the same total.
+		with self.lock:
+			self.busy_time[thread_name] = self.busy_time.get(thread_name, 0.0) + seconds
+
+
+	def snapshot(self):
+		""" Everything at once, with the rates since the previous snapshot. """
+		now = time.perf_counter()
+		cpu = time.process_time()
+		last_time, last_cpu, last_counters, last_busy = self.last_snapshot
+		elapsed = max(now - last_time, 1e-9)
+
+		with self.lock:
+			clients = list(self.clients.items())
+			busy_time = dict(self.busy_time)
+
+		counters = {}
+		report = []
+		for client, metrics in clients:
+			counters[client] = (metrics.messages_in, metrics.bytes_in, metrics.messages_out, metrics.bytes_out)
+			rates = [(new - old) / elapsed for new, old in zip(counters[client], last_counters.get(client, (0, 0, 0, 0)))]
+			report.append({
+				"client_id": metrics.client_id,
+				"room": metrics.room,
+				"address": str(client.address),
+				"rtt_ms": metrics.rtt * 1000 if metrics.rtt is not None else None,
+				# Bytes over TCP, unacknowledged reliable messages over UDP.
+				"send_queue": client.send_queue_depth(),
+				"held": metrics.held,
+				"messages_in": metrics.messages_in,
+				"bytes_in": metrics.bytes_in,
+				"messages_out": metrics.messages_out,
+				"bytes_out": metrics.bytes_out,
+				"messages_in_per_second": rates[0],
+				"bytes_in_per_second": rates[1],
+				"messages_out_per_second": rates[2],
+				"bytes_out_per_second": rates[3]
+			})
+
+		self.last_snapshot = (now, cpu, counters, busy_time)
+		return {
+			"time": time.time(),
+			"uptime": now - self.start_time,
+			"clients": report,
+			"fanout_ms": {name: histogram.snapshot() for name, histogram in self.fanouts.items()},
+			# Share of the time each thread spent working since the previous snapshot.
+			"utilization": {name: (busy - last_busy.get(name, 0.0)) / elapsed for name, busy in busy_time.items()},
+			"cpu_percent": (cpu - last_cpu) / elapsed * 100
+		}
+
+
+def format_metrics(snapshot):
+	""" One "name{labels} value" line per metric, readable by people and by most scrapers. """
+	lines = [f"silly_ninja_uptime_seconds {snapshot['uptime']:.1f}",
+			f"silly_ninja_cpu_percent {snapshot['cpu_percent']:.1f}",
+			f"silly_ninja_clients {len(snapshot['clients'])}"]
+	for client in snapshot["clients"]:
+		room = f"room=\"{client['room']}\"," if client["room"] else ""
+		labels = f"{{{room}client=\"{client['client_id']}\"}}"
+		for name in ("rtt_ms", "send_queue", "messages_in", "bytes_in", "messages_out", "bytes_out",
+					"messages_in_per_second", "bytes_in_per_second", "messages_out_per_second", "bytes_out_per_second"):
+			if client[name] is not None:
+				lines.append(f"silly_ninja_client_{name}{labels} {client[name]:.6g}")
+	for fanout, histogram in snapshot["fanout_ms"].items():
+		labels = f"{{fanout=\"{fanout}\"}}"
+		for name in ("count", "mean_ms", "p50_ms", "p99_ms"):
+			lines.append(f"silly_ninja_fanout_{name}{labels} {histogram[name]:.6g}")
+		for bucket, count in histogram["buckets"].items():
+			lines.append(f"silly_ninja_fanout_bucket{{fanout=\"{fanout}\",le=\"{bucket}\"}} {count}")
+	for thread, utilization in snapshot["utilization"].items():
+		lines.append(f"silly_ninja_utilization{{thread=\"{thread}\"}} {utilization:.4f}")
+	return "\n".join(lines) + "\n"
+
+
+class MetricsEndpoint:
+	""" Serves the metrics of a GameServer over HTTP on a thread of its own:
+		"/metrics" as text, "/metrics.json" as JSON. Each request takes a fresh snapshot. """
+	def __init__(self, metrics, port, ip="127.0.0.1"):
+		self.metrics = metrics
+		self.address = (ip, port)
+		self.http_server = None
+
+
+	def start(self):
+		metrics = self.metrics
+
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path == "/metrics.json":
+					body = json.dumps(metrics.snapshot()).encode("utf-8")
+					content_type = "application/json"
+				elif self.path in ("/", "/metrics"):
+					body = format_metrics(metrics.snapshot()).encode("utf-8")
+					content_type = "text/plain; charset=utf-8"
+				else:
+					self.send_error(404)
+					return
+
+				self.send_response(200)
+				self.send_header("Content-Type", content_type)
+				self.send_header("Content-Length", str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+
+			def log_message(self, format, *args):
+				# Scrapers would flood the server's own log.
+				pass
+
+		try:
+			self.http_server = ThreadingHTTPServer(self.address, Handler)
+		except OSError as error:
+			print(f"[METRICS]: Could not serve metrics on {self.address[0]} - port: {self.address[1]}, {error}")
+			return False
+
+		threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+		print(f"[METRICS]: Serving metrics on http://{self.address[0]}:{self.address[1]}/metrics")
+		return True
+
+
+	def close(self):
+		if self.http_server is not None:
+			self.http_server.shutdown()
+			self.http_server.server_close()
+
+
+class MetricsLog:
+	""" Appends a JSON snapshot of the server's metrics to a file every 'interval' seconds, one per line. """
+	def __init__(self, metrics, path, interval=10):
+		self.metrics = metrics
+		self.path = path
+		self.interval = interval
+		self.stopped = threading.Event()
+
+
+	def start(self):
+		threading.Thread(target=self.write, daemon=True).start()
+
+
+	def write(self):
+		with open(self.path, "a", encoding="utf-8") as f:
+			while not self.stopped.wait(self.interval):
+				f.write(json.dumps(self.metrics.snapshot()) + "\n")
+				f.flush()
+
+
+	def close(self):
+		self.stopped.set()
@@ -0,0 +1,170 @@
+import threading
+import time
+
+from scripts.socket.dedicated_server import DedicatedServer, TICK_RATE
+from scripts.socket.client import MAX_CLIENT_COUNT
+from scripts.socket.handshake import HANDSHAKE_TIMEOUT
+
+
+DEFAULT_ROOM = "lobby"
+MAX_ROOM_NAME_LENGTH = 24
+ROOM_IDLE_TIMEOUT = 30  # Seconds a room may stay empty before it's closed.
+STATS_INTERVAL = 10  # Seconds between two throughput reports.
+
+
+def format_rates(rates):
+	# [messages_in, bytes_in, messages_out, bytes_out], per second.
+	return (f"in: {rates[0]:.0f} msg/s ({rates[1] / 1024:.1f} KiB/s), " +
+			f"out: {rates[2]:.0f} msg/s ({rates[3] / 1024:.1f} KiB/s)")
+
+
+class Room(DedicatedServer):
+	""" One lobby and session of a RoomServer, with its own clients, world and tick.
+		Connections are accepted by the RoomServer, then handed over once the client picked this room. """
+	def __init__(self, name, tick_rate=TICK_RATE, transport="tcp", capture=None, metrics=None, batched_physics=False, enemy_lod=False):
+		super().__init__("", 0, tick_rate=tick_rate, transport=transport, capture=capture, metrics=metrics, batched_physics=batched_physics,
+						enemy_lod=enemy_lod)
+		# Rooms share the listener of their RoomServer.
+		self.server.close()
+		self.server = None
+
+		self.name = name
+		self.empty_since = time.perf_counter()
+
+		self.messages_in = 0
+		self.bytes_in = 0
+		self.messages_out = 0
+		self.bytes_out = 0
+		self.reported_counters = (0, 0, 0, 0)
+
+
+	def remove_client(self, address, removed_id, removed_index):
+		super().remove_client(address, removed_id, removed_index)
+		if not self.client_count():
+			self.empty_since = time.perf_counter()
+
+
+	def reserve(self):
+		# Someone is joining, keep the room open while they go through the handshake.
+		self.empty_since = time.perf_counter()
+
+
+	def is_idle(self, now, timeout):
+		return not self.client_count() and now - self.empty_since > timeout
+
+
+	def handle_message(self, client_id, message):
+		self.messages_in += 1
+		self.bytes_in += len(message)
+		super().handle_message(client_id, message)
+
+
+	def send_to(self, client, message, reliable=True):
+		self.messages_out += 1
+		self.bytes_out += len(message)
+		return super().send_to(client, message, reliable=reliable)
+
+
+	def throughput(self, elapsed):
+		# Rates since the previous call.
+		counters = (self.messages_in, self.bytes_in, self.messages_out, self.bytes_out)
+		rates = [(new - old) / elapsed for new, old in zip(counters, self.reported_counters)]
+		self.reported_counters = counters
+		return rates
+
+
+class RoomServer(DedicatedServer):
+	""" A dedicated server hosting many independent rooms on a single port.
+		Clients name the room they want during the handshake, it's created if nobody is in there yet.
+		Its own world stays empty, every room simulates its own. """
+	def __init__(self, ip, port, tick_rate=TICK_RATE, transport="tcp", wrap_socket=None, capture=None,
+				idle_timeout=ROOM_IDLE_TIMEOUT, stats_interval=STATS_INTERVAL, batched_physics=False, enemy_lod=False):
+		super().__init__(ip, port, tick_rate=tick_rate, transport=transport, wrap_socket=wrap_socket, capture=capture,
+						batched_physics=batched_physics, enemy_lod=enemy_lod)
+		self.rooms = {}
+		# Rooms are created on the joining threads and closed on the simulation one.
+		self.rooms_lock = threading.Lock()
+		self.idle_timeout = idle_timeout
+		self.stats_interval = stats_interval
+		self.last_report = time.perf_counter()
+
+
+	def shutdown(self):
+		with self.rooms_lock:
+			for room in self.rooms.values():
+				room.shutdown()
+			self.rooms.clear()
+		super().shutdown()
+
+
+	def client_count(self):
+		return sum(room.client_count() for room in list(self.rooms.values()))
+
+
+	def max_client_count(self):
+		# Rooms are created on demand, only each of them is capped.
+		return MAX_CLIENT_COUNT * max(len(self.rooms), 1)
+
+
+	def session_name(self):
+		return f"Dedicated server, {len(self.rooms)} room(s)"
+
+
+	def accept_client(self, client, address, time):
+		client.send("[ROOM]")
+		name = client.receive_message(HANDSHAKE_TIMEOUT).strip()[:MAX_ROOM_NAME_LENGTH] or DEFAULT_ROOM
+
+		with self.rooms_lock:
+			room = self.rooms.get(name)
+			if room is None:
+				# Every room writes to the server's capture and metrics, their clients' addresses and room names tell them apart.
+				room = Room(name, tick_rate=self.tick_rate, transport=self.transport, capture=self.capture, metrics=self.metrics,
+							batched_physics=self.batched_physics, enemy_lod=self.enemy_lod)
+				self.rooms[name] = room
+				print(f"[ROOM CREATED]: \"{name}\", {len(self.rooms)} room(s) open.")
+			room.reserve()
+
+		# Full rooms turn the client down on their own.
+		room.accept_client(client, address, time)
+
+
+	def ping_clients(self):
+		for room in list(self.rooms.values()):
+			room.ping_clients()
+
+
+	def close_idle_rooms(self, now):
+		with self.rooms_lock:
+			for name, room in list(self.rooms.items()):
+				if room.is_idle(now, self.idle_timeout):
+					del self.rooms[name]
+					room.shutdown()
+					print(f"[ROOM CLOSED]: \"{name}\" has been empty for {self.idle_timeout}s, {len(self.rooms)} room(s) open.")
+
+
+	def report(self, now):
+		""" Prints and returns the throughput of every room since the last report, along with their total. """
+		elapsed = now - self.last_report
+		self.last_report = now
+
+		rooms = list(self.rooms.values())
+		throughput = {"rooms": {}, "total": [0.0, 0.0, 0.0, 0.0]}
+		for room in rooms:
+			rates = room.throughput(elapsed)
+			throughput["rooms"][room.name] = rates
+			throughput["total"] = [total + rate for total, rate in zip(throughput["total"], rates)]
+
+		print(f"[ROOMS]: {len(rooms)} room(s), {self.client_count()} client(s), {format_rates(throughput['total'])}")
+		for room in rooms:
+			print(f"  \"{room.name}\": {room.client_count()} client(s), tick {room.tick}, {format_rates(throughput['rooms'][room.name])}")
+		return throughput
+
+
+	def step(self):
+		for room in list(self.rooms.values()):
+			room.step()
+
+		now = time.perf_counter()
+		self.close_idle_rooms(now)
+		if now - self.last_report >= self.stats_interval:
+			self.report(now)
@@ -1,9 +1,14 @@
 import threading
 import socket
+import secrets
 import time
 
 from datetime import datetime
-from scripts.socket.client import ClientDisconnectException, MAX_CLIENT_COUNT
+from scripts.socket.client import ClientDisconnectException, MAX_CLIENT_COUNT, SLOT_GRACE_PERIOD
+from scripts.socket.transport import create_listener, is_state_message
+from scripts.socket.discovery import DiscoveryResponder
+from scripts.socket.handshake import HANDSHAKE_TIMEOUT
+from scripts.socket.metrics import ServerMetrics, PING_INTERVAL
 
 FORMAT = "utf-8"
 DISCONNECT_MESSAGE = "!leave"
@@ -112,33 +117,93 @@ class SocketServer:
 
 
 class GameServer(SocketServer):
-	def __init__(self, ip, port):
+	def __init__(self, ip, port, transport="tcp", wrap_socket=None, capture=None, metrics=None):
 		super().__init__(ip, port)
+		# Replace the plain chat socket with a message-oriented listener.
+		self.server.close()
+		self.transport = transport
+		self.server = create_listener(transport, wrap_socket=wrap_socket)
+		self.bound = threading.Event()  # Set once the server is listening, or failed to.
+		self.discovery = DiscoveryResponder(self)
+
 		self.clients = {}
 		self.client_ids = []
 		self.client_sockets = []
+		self.client_indices = {}  # {client_socket: index}
+		self.recipients = ()  # [(client_id, client_socket)], replaced as a whole whenever a client joins or leaves.
+		# Clients may join and leave from different threads at once.
+		self.clients_lock = threading.RLock()
+
+		# Clients that dropped without saying goodbye keep their slot for a while, and get it back with their token.
+		self.tokens = {}  # {session_token: client_socket}
+		self.held_slots = {}  # {client_socket: dropped_time}
+		self.session_running = False
+
+		# An opt-in TrafficRecorder, every message exchanged with the clients is written to its capture.
+		self.capture = capture
+		# Always collected, only served when asked for (see MetricsEndpoint).
+		self.metrics = ServerMetrics() if metrics is None else metrics
+		self.name = ""  # A room's name, labels the metrics of its clients.
 
 
 	def client_count(self):
 		return len(self.clients)
 
 
+	def max_client_count(self):
+		return MAX_CLIENT_COUNT
+
+
+	def session_name(self):
+		# Shown to the players looking for a session on the LAN.
+		return f"{self.nicknames[0]}'s session" if self.nicknames else "New session"
+
+
+	def refresh_clients(self):
+		self.client_ids = list(self.clients.keys())
+		self.client_sockets = list(self.clients.values())
+		self.client_indices = {client: index for index, client in enumerate(self.client_sockets)}
+		self.recipients = tuple(self.clients.items())
+		self.tokens = {token: client for token, client in self.tokens.items() if client in self.client_indices}
+		self.metrics.rename_clients(self.clients)
+
+
 	def shutdown(self):
 		print(f"[SHUTTING DOWN]: Server is about to shut down, disconnect all clients.")
 		self.running = False
-		self.is_shutdown = True
-		
-		# Close all connections to clients.
-		for client_id in self.clients:
-			self.clients[client_id].send(DISCONNECT_MESSAGE.encode(FORMAT))
-			self.clients[client_id].close()
-
-		self.clients.clear()
-		self.nicknames.clear()
-		self.server.close()
 
+		# Clients leaving right now must not see the lists half cleared.
+		with self.clients_lock:
+			self.is_shutdown = True
 
-	def broadcast(self, sender_id, message):
+			# Close all connections to clients.
+			for client_id in self.clients:
+				try:
+					self.clients[client_id].send(DISCONNECT_MESSAGE)
+				except OSError:
+					pass
+				self.clients[client_id].close()
+
+			self.clients.clear()
+			self.nicknames.clear()
+		self.discovery.close()
+		if self.server is not None:
+			self.server.close()
+
+
+	def send_to(self, client, message, reliable=True):
+		if self.capture is not None:
+			self.capture.record("out", client.address, message)
+		self.metrics.on_sent(client, message)
+		try:
+			client.send(message, reliable=reliable)
+			return True
+		except OSError:
+			# The client dropped, its own thread takes care of removing it.
+			return False
+
+
+	def broadcast(self, sender_id, message, reliable=True):
 		# Broadcast the message to all connected clients, except the sender.
 		# Send to all clients if the message starts with an asterisk.
 		sendall = False
@@ -146,81 +211,204 @@ class GameServer(SocketServer):
 			sendall = True
 			message = message[1:]
 
-		for client_id in self.clients:
+		sent = 0
+		start_time = time.perf_counter()
+		for client_id, client in self.recipients:
 			if client_id != sender_id or sendall:
-				self.clients[client_id].send(message.encode(FORMAT))
+				sent += self.send_to(client, message, reliable=reliable)
+		self.metrics.fanouts["broadcast"].observe(time.perf_counter() - start_time)
+		return sent
 
 
 	def remove_client(self, address, removed_id, removed_index):
-		self.clients.pop(removed_id)
+		self.metrics.remove_client(self.clients.pop(removed_id))
 		
 		nickname = self.nicknames[removed_index]
 		print(f"[LEAVING]: {address} a.k.a \"{nickname}\" has left the game.")
-		self.nicknames.remove(nickname)
+		del self.nicknames[removed_index]
 		print(self.nicknames)
 		
 		self.broadcast(removed_id, f"PLAYER LEFT:{removed_index}|")
 		
-		""" Sort other clients up only if the removed the client is not the host
-		or the most recently connected one. """
-		if removed_index in range(1, MAX_CLIENT_COUNT - 1):
-			for i in range(removed_index, MAX_CLIENT_COUNT):
-				next_id = f"client_{i + 1}"
-				if next_id in self.clients:
-					next = self.clients.pop(next_id, None)
-					if next is not None:
-						self.clients[f"client_{i}"] = next
-
-			self.client_ids = list(self.clients.keys())
-			self.client_sockets = list(self.clients.values())
+		""" Sort other clients up only if the removed the client is not the most recently connected one.
+		The host never gets here, the server shuts down along with it. """
+		sort_up = removed_index < self.client_count()
+		if sort_up:
+			# IDs follow the join order, so every client after the removed one takes the ID of its new index.
+			self.clients = {(client_id if client_id == "host" else f"client_{index}"): client
+							for index, (client_id, client) in enumerate(self.clients.items())}
 
+		self.refresh_clients()
+
+		if sort_up:
 			index = 0
 			names = ','.join(self.nicknames)
 			ids = ','.join(self.client_ids)
-			for client_id in self.clients:
-				self.clients[client_id].send(f"RE_INITIALIZE:{index};{client_id};{names};{ids}|".encode(FORMAT))
+			for client_id, client in self.recipients:
+				try:
+					client.send(f"RE_INITIALIZE:{index};{client_id};{names};{ids}|")
+				except OSError:
+					# That one dropped too, its own thread removes it next.
+					pass
 				index += 1
 
 
+	def handle_message(self, client_id, message):
+		if message == "*[START GAME]":
+			self.session_running = True
+		elif message.startswith("@"):
+			# "@client_ID message" is only meant for that client, e.g. the host's answer to a resync request.
+			target_id, message = message[1:].split(" ", 1)
+			target = self.clients.get(target_id)
+			if target is not None:
+				self.send_to(target, message)
+			return
+
+		# Per-tick state can be dropped, it will be superseded by the next one anyway.
+		self.broadcast(client_id, message, reliable=not is_state_message(message))
+
+
 	def handle_client(self, client, address):
 		while self.running:
 			try:
-				message = client.recv(1024).decode(FORMAT)
-				client_index = self.client_sockets.index(client)
-				client_id = self.client_ids[client_index]
-
-				if message == DISCONNECT_MESSAGE:
-					raise ClientDisconnectException("Client disconnected.")
-				else:
-					self.broadcast(client_id, message)
-			except Exception:
-				if not self.is_shutdown:
-					self.remove_client(address, client_id, client_index)
+				for message in client.receive():
+					client_id = self.client_ids[self.client_indices[client]]
+					if self.capture is not None:
+						self.capture.record("in", client.address, message)
+					self.metrics.on_received(client, message)
+
+					if message == DISCONNECT_MESSAGE:
+						raise ClientDisconnectException("Client disconnected.")
+					elif message.startswith("[PONG]"):
+						self.metrics.on_pong(client, float(message.split(":")[1]))
+					else:
+						start_time = time.perf_counter()
+						self.handle_message(client_id, message)
+						self.metrics.add_busy_time("clients", time.perf_counter() - start_time)
+			except Exception as error:
+				with self.clients_lock:
+					if not self.is_shutdown and client in self.client_indices:
+						if isinstance(error, ClientDisconnectException):
+							client_index = self.client_indices[client]
+							self.remove_client(address, self.client_ids[client_index], client_index)
+						else:
+							self.hold_slot(client, address)
+				client.close()
 				break
 
 
+	def ping_clients(self):
+		# Clients echo the time back as "[PONG]:time", the difference is their round trip.
+		for _, client in self.recipients:
+			self.send_to(client, f"[PING]:{time.perf_counter():.6f}")
+
+
+	def run_pings(self):
+		while self.running:
+			time.sleep(PING_INTERVAL)
+			self.ping_clients()
+
+
+	def hold_slot(self, client, address):
+		# The connection dropped, keep the slot in case the client comes back with its token.
+		self.held_slots[client] = time.perf_counter()
+		self.metrics.set_held(client, True)
+		print(f"[DROPPED]: {address} lost its connection, holding its slot for {SLOT_GRACE_PERIOD}s.")
+		timer = threading.Timer(SLOT_GRACE_PERIOD, self.release_slot, args=(client, address))
+		timer.daemon = True
+		timer.start()
+
+
+	def release_slot(self, client, address):
+		with self.clients_lock:
+			if self.held_slots.pop(client, None) is not None and not self.is_shutdown and client in self.client_indices:
+				client_index = self.client_indices[client]
+				self.remove_client(address, self.client_ids[client_index], client_index)
+
+
+	def resume_client(self, client, address, token):
+		""" Puts a reconnecting client back in the slot its token was issued for, returns whether there was one. """
+		with self.clients_lock:
+			old_client = self.tokens.get(token)
+			if old_client is None or old_client not in self.client_indices:
+				return False
+
+			# The old connection may not even have noticed it's gone, it's dropped either way.
+			client_index = self.client_indices[old_client]
+			client_id = self.client_ids[client_index]
+			self.clients[client_id] = client
+			self.tokens[token] = client
+			self.held_slots.pop(old_client, None)
+			self.metrics.remove_client(old_client)
+			self.metrics.add_client(client, client_id, room=self.name)
+			self.refresh_clients()
+			names = ','.join(self.nicknames)
+			ids = ','.join(self.client_ids)
+		old_client.close()
+
+		print(f"[RESUMED]: {address} is back in the game as \"{self.nicknames[client_index]}\".")
+		client.send(f"RE_INITIALIZE:{client_index};{client_id};{names};{ids}|")
+		self.resync_client(client, client_id, client_index)
+
+		threading.Thread(target=self.handle_client, args=(client, address)).start()
+		return True
+
+
+	def resync_client(self, client, client_id, client_index):
+		# Only the host knows where the session is at, it answers the client directly with a RESYNC message.
+		host = self.clients.get("host")
+		if self.session_running and host is not None:
+			self.send_to(host, f"[RESYNC REQUEST]:{client_id}")
+
+
+	def reject_client(self, client):
+		client.send("[JOIN FAILED]: Connected successfully but the maximum number of clients has been reached. " +
+					"Hence CAN NOT join the game.")
+		time.sleep(1)
+		client.send(DISCONNECT_MESSAGE)
+		client.close()
+
+
 	def accept_client(self, client, address, time):
 		print(f"[NEW CONNECTION INBOUND - {time: %B %d, %Y - %H:%M:%S}]: {address} connected.")
 
 		# Send a keyword that asks the client to send their nickname and id.
-		client.send("[NICKNAME]".encode(FORMAT))
-		nickname = client.recv(1024).decode(FORMAT)
-		self.nicknames.append(nickname)
-		print(self.nicknames)
-
-		client.send("[CLIENT ID]".encode(FORMAT))
-		client_id = client.recv(1024).decode(FORMAT)
+		client.send("[NICKNAME]")
+		nickname = client.receive_message(HANDSHAKE_TIMEOUT)
+
+		client.send("[CLIENT ID]")
+		client_id = client.receive_message(HANDSHAKE_TIMEOUT)
+
+		# Clients coming back from a dropped connection answer with the token they were given, new ones with nothing.
+		client.send("[SESSION TOKEN]")
+		token = client.receive_message(HANDSHAKE_TIMEOUT).strip()
+		if token and self.resume_client(client, address, token):
+			return
+
+		token = secrets.token_hex(8)
+		with self.clients_lock:
+			# Handshakes run side by side, the count is only checked once no one else can take the last slot.
+			is_full = self.client_count() >= MAX_CLIENT_COUNT
+			if not is_full:
+				# Nicknames may repeat, the index in the join order is what identifies a client.
+				client_index = self.client_count()
+				if client_id == "client_unverified":
+					client_id = f"client_{client_index}"
 
-		if client_id == "client_unverified":
-			client_id = f"client_{self.nicknames.index(nickname)}"
+				self.nicknames.append(nickname)
+				self.clients[client_id] = client
+				self.tokens[token] = client
+				self.metrics.add_client(client, client_id, room=self.name)
+				self.refresh_clients()
 
-		self.clients[client_id] = client
-		self.client_ids = list(self.clients.keys())
-		self.client_sockets = list(self.clients.values())
+		if is_full:
+			self.reject_client(client)
+			return
 
+		client.send(f"[TOKEN]:{token}")
+		print(self.nicknames)
 		print(f"[JOINED]: {address} joined the game as \"{nickname}\".")
 		
-		client_index = self.client_count() - 1
 		print(f"Client Count: {self.client_count()}")
 		print(f"Index for {nickname}: {client_index}")
 		self.broadcast(client_id, f"*NEW PLAYERS JOINED:{client_index};{client_id};" +
@@ -230,29 +418,39 @@ class GameServer(SocketServer):
 		threading.Thread(target=self.handle_client, args=(client, address)).start()
 
 
+	def join_client(self, client, address, time):
+		# Runs on its own thread, so a slow or silent client only holds up its own join.
+		try:
+			self.accept_client(client, address, time)
+		except OSError as error:
+			# Timeouts and dropped connections alike.
+			print(f"[JOIN FAILED]: {address} dropped out of the handshake: {error}")
+			client.close()
+
+
 	def start_server(self):
 		print("[GREETING]: Welcome to Socket with Python, stranger.")
 		print("[STARTING]: Server is starting...")
 
-		self.server.bind((self.ip, self.port))
+		try:
+			self.server.bind((self.ip, self.port))
+			self.server.listen()
+		except OSError as error:
+			print(f"[ERROR]: Could not listen on {self.ip} - port: {self.port}, {error}")
+			self.running = False
+			self.bound.set()
+			return
+
 		print(f"[LISTENING]: Server is listening for connections on {self.ip} - port: {self.port}")
-		self.server.listen()
-		
 		self.running = True
 		self.is_shutdown = False
+		self.discovery.start()
+		threading.Thread(target=self.run_pings, daemon=True).start()
+		self.bound.set()
 		while self.running:
 			try:
 				client, address = self.server.accept()
-				now = datetime.now()
-
-				if self.client_count() < MAX_CLIENT_COUNT:
-					self.accept_client(client, address, now)
-				else:
-					client.send(("[JOIN FAILED]: Connected successfully but the maximum number of clients has been reached. " +
-								"Hence CAN NOT join the game.").encode(FORMAT))
-					time.sleep(1)
-					client.send(DISCONNECT_MESSAGE.encode(FORMAT))
-					client.close()
+				threading.Thread(target=self.join_client, args=(client, address, datetime.now()), daemon=True).start()
 			except Exception:
 				print("[SHUTDOWN]: Server shutdown successfully.")
 
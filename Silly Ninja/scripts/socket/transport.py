@@ -0,0 +1,478 @@
+import abc
+import collections
+import socket
+import struct
+import threading
+import time
+import queue
+
+try:
+	# Tells how much a TCP socket still has to send, not available on Windows.
+	import fcntl
+	import termios
+except ImportError:
+	fcntl = None
+
+
+FORMAT = "utf-8"
+DELIMITER = "|"
+
+# UDP packet kinds.
+HELLO = 0
+RELIABLE = 1
+UNRELIABLE = 2
+ACK = 3
+CLOSE = 4
+
+HEADER = struct.Struct("!BI")  # [kind, sequence]
+MAX_DATAGRAM_SIZE = 65507
+RECEIVE_BUFFER_SIZE = 65536  # Large enough for a single read to take everything a stream has buffered.
+RESEND_INTERVAL = 0.01
+MIN_RESEND_TIMEOUT = 0.05
+KEEPALIVE_INTERVAL = 1
+CONNECTION_TIMEOUT = 10
+CONNECT_TIMEOUT = 5
+
+
+# Per-tick state updates are tagged: "#sender_id;segment;segment...", everything else is a control message.
+STATE_TAG = "#"
+
+
+def state_message(sender_id, segments):
+	return STATE_TAG + ";".join([sender_id, *segments])
+
+
+def is_state_message(message):
+	return message.startswith(STATE_TAG)
+
+
+def split_state_message(message):
+	""" The sender's ID and the segments of a state message. """
+	sender_id, *segments = message[len(STATE_TAG):].split(";")
+	return sender_id, segments
+
+
+def frame(message):
+	return message if message.endswith(DELIMITER) else message + DELIMITER
+
+
+class Connection(abc.ABC):
+	""" A message-oriented connection to a single peer.
+		Messages are strings without the delimiter, reliable ones are delivered in order. """
+	def __init__(self, address):
+		self.address = address
+		self.pending = collections.deque()
+
+
+	@abc.abstractmethod
+	def send(self, message, reliable=True):
+		pass
+
+
+	# Block until at least one message arrives, then return everything available.
+	def receive(self):
+		if not self.pending:
+			self.pending.extend(self.read())
+
+		messages = list(self.pending)
+		self.pending.clear()
+		return messages
+
+
+	# Raises TimeoutError if a timeout is given and nothing arrives in time.
+	def receive_message(self, timeout=None):
+		while not self.pending:
+			self.pending.extend(self.read(timeout))
+
+		return self.pending.popleft()
+
+
+	@abc.abstractmethod
+	def read(self, timeout=None):
+		pass
+
+
+	def send_queue_depth(self):
+		# What's been sent but not yet taken by the peer, None where it can't be told.
+		return None
+
+
+	@abc.abstractmethod
+	def close(self):
+		pass
+
+
+class TCPConnection(Connection):
+	def __init__(self, sock, address=None):
+		super().__init__(address)
+		self.socket = sock
+		self.buffer = b""
+		self.send_lock = threading.Lock()
+
+
+	def send(self, message, reliable=True):
+		# A stream is always reliable, the flag only matters for datagrams.
+		with self.send_lock:
+			self.socket.sendall(frame(message).encode(FORMAT))
+
+
+	def read(self, timeout=None):
+		if timeout is not None:
+			self.socket.settimeout(timeout)
+		try:
+			while DELIMITER.encode(FORMAT) not in self.buffer:
+				data = self.socket.recv(RECEIVE_BUFFER_SIZE)
+				if not data:
+					raise ConnectionResetError("Connection closed by the peer.")
+				self.buffer += data
+		finally:
+			if timeout is not None:
+				self.socket.settimeout(None)
+
+		*messages, self.buffer = self.buffer.split(DELIMITER.encode(FORMAT))
+		return [message.decode(FORMAT) for message in messages]
+
+
+	def send_queue_depth(self):
+		# Bytes still in the kernel's send buffer, unsent or unacknowledged.
+		if fcntl is None:
+			return None
+		try:
+			return struct.unpack("i", fcntl.ioctl(self.socket.fileno(), termios.TIOCOUTQ, b"\0" * 4))[0]
+		except (OSError, ValueError):
+			return None
+
+
+	def close(self):
+		self.socket.close()
+
+
+class TCPListener:
+	def __init__(self, wrap_socket=None):
+		self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		# Allow restarting a server right away, while the old connections linger in TIME_WAIT.
+		self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.wrap_socket = wrap_socket
+
+
+	def bind(self, address):
+		self.socket.bind(address)
+
+
+	def listen(self):
+		self.socket.listen()
+
+
+	def accept(self):
+		sock, address = self.socket.accept()
+		sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		if self.wrap_socket is not None:
+			sock = self.wrap_socket(sock)
+		return TCPConnection(sock, address), address
+
+
+	def close(self):
+		self.socket.close()
+
+
+class UDPConnection(Connection):
+	""" A virtual connection over a shared UDP socket.
+		Reliable messages are numbered, acknowledged cumulatively and resent until acknowledged.
+		Unreliable messages are sequenced, so stale ones are dropped instead of overriding newer state. """
+	def __init__(self, endpoint, address):
+		super().__init__(address)
+		self.endpoint = endpoint
+		self.inbox = queue.Queue()
+		self.lock = threading.Lock()
+		self.closed = False
+
+		# Outgoing state.
+		self.next_reliable_seq = 0
+		self.next_unreliable_seq = 1
+		self.unacked = collections.OrderedDict()  # seq -> [packet, last_sent_time, send_count]
+		self.last_sent_time = time.perf_counter()
+		self.smoothed_rtt = None
+
+		# Incoming state.
+		self.expected_seq = 0
+		self.out_of_order = {}
+		self.last_unreliable_seq = 0
+		self.last_received_time = time.perf_counter()
+
+
+	def resend_timeout(self):
+		if self.smoothed_rtt is None:
+			return MIN_RESEND_TIMEOUT * 2
+		return max(MIN_RESEND_TIMEOUT, self.smoothed_rtt * 2)
+
+
+	def send(self, message, reliable=True):
+		if self.closed:
+			raise ConnectionResetError("Connection is closed.")
+
+		payload = frame(message).encode(FORMAT)
+		with self.lock:
+			if reliable:
+				packet = HEADER.pack(RELIABLE, self.next_reliable_seq) + payload
+				self.unacked[self.next_reliable_seq] = [packet, time.perf_counter(), 1]
+				self.next_reliable_seq += 1
+			else:
+				packet = HEADER.pack(UNRELIABLE, self.next_unreliable_seq) + payload
+				self.next_unreliable_seq += 1
+			self.last_sent_time = time.perf_counter()
+
+		self.endpoint.sendto(packet, self.address)
+
+
+	def read(self, timeout=None):
+		messages = []
+		try:
+			data = self.inbox.get(timeout=timeout)
+		except queue.Empty:
+			raise TimeoutError("Nothing received in time.")
+		while data is not None:
+			messages.extend(data.decode(FORMAT).split(DELIMITER)[:-1])
+			if self.inbox.empty():
+				return messages
+			data = self.inbox.get_nowait()
+
+		# Hand out what arrived before the connection closed, fail on the next read.
+		if messages:
+			self.inbox.put(None)
+			return messages
+		raise ConnectionResetError("Connection closed by the peer.")
+
+
+	def send_queue_depth(self):
+		# Reliable messages still waiting to be acknowledged.
+		return len(self.unacked)
+
+
+	def on_packet(self, kind, seq, payload):
+		self.last_received_time = time.perf_counter()
+
+		if kind == RELIABLE:
+			with self.lock:
+				if seq == self.expected_seq:
+					self.inbox.put(payload)
+					self.expected_seq += 1
+					while self.expected_seq in self.out_of_order:
+						self.inbox.put(self.out_of_order.pop(self.expected_seq))
+						self.expected_seq += 1
+				elif seq > self.expected_seq:
+					self.out_of_order[seq] = payload
+				ack = self.expected_seq
+			self.endpoint.sendto(HEADER.pack(ACK, ack), self.address)
+
+		elif kind == UNRELIABLE:
+			if seq > self.last_unreliable_seq:
+				self.last_unreliable_seq = seq
+				self.inbox.put(payload)
+
+		elif kind == ACK:
+			now = time.perf_counter()
+			with self.lock:
+				for acked_seq in [s for s in self.unacked if s < seq]:
+					_, sent_time, send_count = self.unacked.pop(acked_seq)
+					# Only sample packets sent once, resent ones make the RTT ambiguous.
+					if send_count == 1:
+						sample = now - sent_time
+						self.smoothed_rtt = sample if self.smoothed_rtt is None else self.smoothed_rtt * 0.875 + sample * 0.125
+
+		elif kind == CLOSE:
+			self.on_closed()
+
+
+	def on_closed(self):
+		if not self.closed:
+			self.closed = True
+			self.inbox.put(None)
+
+
+	# Called periodically by the endpoint to resend lost packets and keep the connection alive.
+	def service(self, now):
+		if now - self.last_received_time > CONNECTION_TIMEOUT:
+			self.on_closed()
+			return
+
+		resend = []
+		with self.lock:
+			timeout = self.resend_timeout()
+			for entry in self.unacked.values():
+				if now - entry[1] > timeout:
+					entry[1] = now
+					entry[2] += 1
+					resend.append(entry[0])
+
+			if not resend and now - self.last_sent_time > KEEPALIVE_INTERVAL:
+				resend.append(HEADER.pack(ACK, self.expected_seq))
+			if resend:
+				self.last_sent_time = now
+
+		for packet in resend:
+			self.endpoint.sendto(packet, self.address)
+
+
+	def close(self):
+		if not self.closed:
+			# Flush what's still unacknowledged (e.g. the disconnect message) before leaving.
+			deadline = time.perf_counter() + self.resend_timeout() * 4
+			while self.unacked and time.perf_counter() < deadline:
+				time.sleep(RESEND_INTERVAL)
+
+			self.endpoint.sendto(HEADER.pack(CLOSE, 0), self.address)
+			self.on_closed()
+		self.endpoint.remove(self)
+
+
+class UDPEndpoint:
+	""" Owns a UDP socket and dispatches incoming packets to a connection per peer address. """
+	def __init__(self, sock, on_new_peer=None):
+		self.socket = sock
+		self.on_new_peer = on_new_peer
+		self.connections = {}
+		self.running = True
+
+
+	def start(self):
+		threading.Thread(target=self.receive_loop, daemon=True).start()
+		threading.Thread(target=self.service_loop, daemon=True).start()
+
+
+	def sendto(self, packet, address):
+		try:
+			self.socket.sendto(packet, address)
+		except OSError:
+			pass
+
+
+	def remove(self, connection):
+		self.connections.pop(connection.address, None)
+		if self.on_new_peer is None:
+			self.close()
+
+
+	def receive_loop(self):
+		while self.running:
+			try:
+				data, address = self.socket.recvfrom(MAX_DATAGRAM_SIZE)
+			except OSError:
+				break
+			if len(data) < HEADER.size:
+				continue
+
+			kind, seq = HEADER.unpack_from(data)
+			connection = self.connections.get(address)
+			if connection is None:
+				if kind == HELLO and self.on_new_peer is not None:
+					connection = UDPConnection(self, address)
+					self.connections[address] = connection
+					self.on_new_peer(connection)
+				else:
+					continue
+
+			if kind == HELLO:
+				connection.last_received_time = time.perf_counter()
+				self.sendto(HEADER.pack(HELLO, 0), address)
+			else:
+				connection.on_packet(kind, seq, data[HEADER.size:])
+
+		for connection in list(self.connections.values()):
+			connection.on_closed()
+
+
+	def service_loop(self):
+		while self.running:
+			now = time.perf_counter()
+			for connection in list(self.connections.values()):
+				connection.service(now)
+			time.sleep(RESEND_INTERVAL)
+
+
+	def close(self):
+		self.running = False
+		self.socket.close()
+
+
+class UDPListener:
+	def __init__(self, wrap_socket=None):
+		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.endpoint = UDPEndpoint(sock if wrap_socket is None else wrap_socket(sock), on_new_peer=self.on_new_peer)
+		self.new_connections = queue.Queue()
+
+
+	def bind(self, address):
+		self.endpoint.socket.bind(address)
+
+
+	def listen(self):
+		self.endpoint.start()
+
+
+	def on_new_peer(self, connection):
+		self.new_connections.put(connection)
+
+
+	def accept(self):
+		connection = self.new_connections.get()
+		if connection is None:
+			raise OSError("Listener has been closed.")
+		return connection, connection.address
+
+
+	def close(self):
+		self.endpoint.close()
+		self.new_connections.put(None)
+
+
+def connect_udp(address, wrap_socket=None, timeout=CONNECT_TIMEOUT):
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	sock.bind(("", 0))
+	sock.settimeout(0.1)
+	link = sock if wrap_socket is None else wrap_socket(sock)
+
+	# Say hello until the server answers with anything.
+	deadline = time.perf_counter() + timeout
+	while True:
+		if time.perf_counter() > deadline:
+			sock.close()
+			raise TimeoutError(f"No answer from {address[0]}:{address[1]}.")
+		link.sendto(HEADER.pack(HELLO, 0), address)
+		try:
+			data, server_address = sock.recvfrom(MAX_DATAGRAM_SIZE)
+			if server_address == address:
+				break
+		except (socket.timeout, ConnectionResetError):
+			pass
+
+	sock.settimeout(None)
+	endpoint = UDPEndpoint(link)
+	connection = UDPConnection(endpoint, address)
+	endpoint.connections[address] = connection
+
+	# Whatever the server sent along with its answer is the start of the session.
+	if len(data) >= HEADER.size and HEADER.unpack_from(data)[0] != HELLO:
+		connection.on_packet(*HEADER.unpack_from(data), data[HEADER.size:])
+
+	endpoint.start()
+	return connection
+
+
+def connect_tcp(address, wrap_socket=None, timeout=CONNECT_TIMEOUT):
+	sock = socket.create_connection(address, timeout=timeout)
+	sock.settimeout(None)
+	# Messages are small and latency matters more than packet count, don't let them wait to be coalesced.
+	sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+	return TCPConnection(sock if wrap_socket is None else wrap_socket(sock), address)
+
+
+def create_listener(transport="tcp", wrap_socket=None):
+	if transport == "udp":
+		return UDPListener(wrap_socket=wrap_socket)
+	return TCPListener(wrap_socket=wrap_socket)
+
+
+def open_connection(address, transport="tcp", wrap_socket=None):
+	if transport == "udp":
+		return connect_udp(address, wrap_socket=wrap_socket)
+	return connect_tcp(address, wrap_socket=wrap_socket)
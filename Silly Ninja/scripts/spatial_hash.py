@@ -0,0 +1,97 @@
+CELL_SIZE = 32  # Pixels, a few times the size of an entity so that most of them sit in one or two cells.
+
+
+class SpatialHash:
+	""" A uniform grid of entity bounding boxes, rebuilt every frame, that answers which of them overlap a point or a rect
+		by looking at the few cells around it instead of every entity.
+		Boxes are whole pixels and tested the same way as pygame.Rect.collidepoint() and colliderect(), so the answers match theirs.
+		Results come in the order the items were inserted. """
+	def __init__(self, cell_size=CELL_SIZE):
+		self.cell_size = cell_size
+		self.cells = {}  # {(cell_x, cell_y): [order,...]}
+		self.items = []  # [(item, left, top, right, bottom),...] by order of insertion.
+		# Cells spanned by the items, queries reaching past them stop at these.
+		self.bounds = (0, 0, -1, -1)
+
+
+	def __len__(self):
+		return len(self.items)
+
+
+	def insert(self, item, rect):
+		""" Adds 'item' with its bounding box, anything with x, y, w, h like a pygame.Rect. """
+		left, top = int(rect[0]), int(rect[1])
+		right, bottom = left + int(rect[2]), top + int(rect[3])
+		order = len(self.items)
+		self.items.append((item, left, top, right, bottom))
+
+		cell_size = self.cell_size
+		x_start, y_start = left // cell_size, top // cell_size
+		x_end, y_end = (right - 1) // cell_size, (bottom - 1) // cell_size
+		cells = self.cells
+		for cell_x in range(x_start, x_end + 1):
+			for cell_y in range(y_start, y_end + 1):
+				orders = cells.get((cell_x, cell_y))
+				if orders is None:
+					cells[(cell_x, cell_y)] = [order]
+				else:
+					orders.append(order)
+
+		if order:
+			min_x, min_y, max_x, max_y = self.bounds
+			self.bounds = (min(min_x, x_start), min(min_y, y_start), max(max_x, x_end), max(max_y, y_end))
+		else:
+			self.bounds = (x_start, y_start, x_end, y_end)
+
+
+	def candidates(self, x_start, y_start, x_end, y_end):
+		# Orders of the items in the cells of that range, each once and sorted.
+		min_x, min_y, max_x, max_y = self.bounds
+		x_start, y_start = max(x_start, min_x), max(y_start, min_y)
+		x_end, y_end = min(x_end, max_x), min(y_end, max_y)
+		if x_start == x_end and y_start == y_end:
+			return self.cells.get((x_start, y_start), ())
+
+		found = set()
+		cells = self.cells
+		for cell_x in range(x_start, x_end + 1):
+			for cell_y in range(y_start, y_end + 1):
+				orders = cells.get((cell_x, cell_y))
+				if orders:
+					found.update(orders)
+		return sorted(found)
+
+
+	def at_point(self, pos):
+		""" The items whose box contains 'pos', like Rect.collidepoint(). """
+		x, y = int(pos[0]), int(pos[1])
+		items = self.items
+		found = []
+		for order in self.cells.get((x // self.cell_size, y // self.cell_size), ()):
+			item, left, top, right, bottom = items[order]
+			if left <= x < right and top <= y < bottom:
+				found.append(item)
+		return found
+
+
+	def overlapping(self, rect):
+		""" The items whose box overlaps 'rect', like Rect.colliderect(). """
+		return self.in_box(rect[0], rect[1], rect[0] + rect[2], rect[1] + rect[3])
+
+
+	def in_box(self, left, top, right, bottom):
+		""" The items whose box overlaps the one between these edges, which may be infinite to reach as far as the items go. """
+		cell_size = self.cell_size
+		min_x, min_y, max_x, max_y = self.bounds
+		x_start = int(left // cell_size) if left > min_x * cell_size else min_x
+		y_start = int(top // cell_size) if top > min_y * cell_size else min_y
+		x_end = int((right - 1) // cell_size) if right <= (max_x + 1) * cell_size else max_x
+		y_end = int((bottom - 1) // cell_size) if bottom <= (max_y + 1) * cell_size else max_y
+
+		items = self.items
+		found = []
+		for order in self.candidates(x_start, y_start, x_end, y_end):
+			item, item_left, item_top, item_right, item_bottom = items[order]
+			if item_left < right and left < item_right and item_top < bottom and top < item_bottom:
+				found.append(item)
+		return found
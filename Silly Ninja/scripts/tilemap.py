@@ -1,12 +1,17 @@
-import pygame
+import sys
+import math
 import json
 
 
 class Tile:
+	""" Maps hold thousands of these, so they're kept small: no __dict__, a tuple for the position,
+		and type names interned so that all the tiles of a kind share the same string. """
+	__slots__ = ("type", "variant", "pos")
+
 	def __init__(self, t_type, variant, pos):
-		self.type = t_type
+		self.type = sys.intern(t_type)
 		self.variant = variant
-		self.pos = pos
+		self.pos = tuple(pos)
 
 	def __repr__(self):
 		return "Tile[Pos = {0}, Type = {1}, Variant = {2}]".format(self.pos, self.type, self.variant)
@@ -22,7 +27,29 @@ class Tile:
 		return Tile(self.type, self.variant, self.pos)
 
 
+class WalkableSpan:
+	""" A run of physics tiles side by side in a row with nothing solid above them, the ground an entity can walk along.
+		Both ends are either a ledge, with nothing to stand on past them, or a wall standing on the next tile. """
+	__slots__ = ("row", "start", "end", "left", "top", "right", "bottom", "wall_left", "wall_right")
+
+	def __init__(self, row, start, end, tile_size, wall_left, wall_right):
+		self.row = row
+		self.start = start  # First and past the last cell of the run.
+		self.end = end
+		self.left = start * tile_size  # Its edges in pixels.
+		self.top = row * tile_size
+		self.right = end * tile_size
+		self.bottom = self.top + tile_size
+		self.wall_left = wall_left
+		self.wall_right = wall_right
+
+	def __repr__(self):
+		return "WalkableSpan[Row = {0}, Cells = {1}..{2}, Walls = {3}, {4}]".format(self.row, self.start, self.end - 1, self.wall_left, self.wall_right)
+
+
 PHYSICS_TILES = {"grass", "stone"}
+# The cells around an entity's own, in the order collisions have always been resolved.
+NEIGHBOR_OFFSETS = tuple((x, y) for x in range(-1, 2) for y in range(-1, 2))
 RULETILE_TYPES = {"grass", "stone"}
 RULETILE_MAP = {
 	tuple(sorted([(1, 0), (0, 1)])): 0,
@@ -44,6 +71,16 @@ class Tilemap:
 		self.map = {}  # Tiles which the player can physically collide with.
 		self.offgrid_tiles = []  # Background tiles, decorations.
 
+		# Whether each cell of the map's bounding box holds a physics tile, row by row, rebuilt whenever a map is loaded.
+		self.solid_grid = bytearray()
+		self.grid_x = 0  # Cell at the top left corner of the grid.
+		self.grid_y = 0
+		self.grid_width = 0
+		self.grid_height = 0
+		# The ground of the map in walkable spans, and the one each cell of the grid belongs to (-1 for none), built along with the grid.
+		self.spans = []
+		self.span_grid = []
+
 
 	def save(self, path):
 		f = open(path, 'w')
@@ -74,6 +111,71 @@ class Tilemap:
 		for offgrid_tile in map_data["offgrid_tiles"]:
 			self.offgrid_tiles.append(Tile(offgrid_tile["type"], offgrid_tile["variant"], offgrid_tile["pos"]))
 
+		self.rebuild_solidity()
+
+
+	def rebuild_solidity(self):
+		""" Bakes the physics tiles into a flat grid, so that collisions are checked by cell without building any key or rect. """
+		cells = [tile.pos for tile in self.map.values() if tile.type in PHYSICS_TILES]
+		if not cells:
+			self.solid_grid = bytearray()
+			self.grid_x = self.grid_y = self.grid_width = self.grid_height = 0
+			self.spans = []
+			self.span_grid = []
+			return
+
+		self.grid_x = min(int(cell[0]) for cell in cells)
+		self.grid_y = min(int(cell[1]) for cell in cells)
+		self.grid_width = max(int(cell[0]) for cell in cells) - self.grid_x + 1
+		self.grid_height = max(int(cell[1]) for cell in cells) - self.grid_y + 1
+		self.solid_grid = bytearray(self.grid_width * self.grid_height)
+		for cell in cells:
+			self.solid_grid[(int(cell[1]) - self.grid_y) * self.grid_width + int(cell[0]) - self.grid_x] = 1
+		self.build_spans()
+
+
+	def build_spans(self):
+		""" Splits the solid cells with an open top into walkable spans, row by row, once per map. """
+		width = self.grid_width
+		grid = self.solid_grid
+		self.spans = []
+		self.span_grid = [-1] * len(grid)
+
+		for y in range(self.grid_height):
+			row = y * width
+			x = 0
+			while x < width:
+				# The top row of the grid is always open, nothing solid is above the map's bounding box.
+				if not grid[row + x] or (y and grid[row - width + x]):
+					x += 1
+					continue
+
+				start = x
+				while x < width and grid[row + x] and not (y and grid[row - width + x]):
+					self.span_grid[row + x] = len(self.spans)
+					x += 1
+
+				# A solid cell right past an end can only be a wall, as it has something solid above it.
+				self.spans.append(WalkableSpan(y + self.grid_y, start + self.grid_x, x + self.grid_x, self.tile_size,
+											start > 0 and grid[row + start - 1] == 1, x < width and grid[row + x] == 1))
+
+
+	def span_at(self, pos):
+		""" The walkable span of the cell holding 'pos' in pixels, None if it's not the top of the ground. """
+		x = int(pos[0] // self.tile_size) - self.grid_x
+		y = int(pos[1] // self.tile_size) - self.grid_y
+		if 0 <= x < self.grid_width and 0 <= y < self.grid_height:
+			index = self.span_grid[y * self.grid_width + x]
+			if index >= 0:
+				return self.spans[index]
+		return None
+
+
+	def is_solid_cell(self, x, y):
+		x -= self.grid_x
+		y -= self.grid_y
+		return 0 <= x < self.grid_width and 0 <= y < self.grid_height and self.solid_grid[y * self.grid_width + x] == 1
+
 
 	def extract(self, id_pairs, keep=False):
 		matches = []
@@ -86,10 +188,8 @@ class Tilemap:
 		for tile_loc in self.map:
 			tile = self.map[tile_loc]
 			if (tile.type, tile.variant) in id_pairs:
-				matches.append(tile.copy())
-				matches[-1].pos = matches[-1].pos.copy()
-				mathces[-1].pos[0] *= self.tile_size
-				mathces[-1].pos[1] *= self.tile_size
+				# Positions are immutable, the match gets its own in pixels.
+				matches.append(Tile(tile.type, tile.variant, (tile.pos[0] * self.tile_size, tile.pos[1] * self.tile_size)))
 				if not keep:
 					del self.map[tile_loc]
 
@@ -97,33 +197,42 @@ class Tilemap:
 
 
 	def solid_check(self, pos):
-		tile_loc = "{0};{1}".format(int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
-		return tile_loc in self.map and self.map[tile_loc].type in PHYSICS_TILES
-
-
-	def neighbor_tiles(self, pos):
-		# Convert back to grid position.
-		tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
-		neighbors = []
-
-		for x in range(-1, 2):
-			for y in range(-1, 2):
-				check_loc = "{0};{1}".format(tile_loc[0] + x, tile_loc[1] + y)
-				if check_loc in self.map:
-					neighbors.append(self.map[check_loc])
-
-		return neighbors
-
-
-	def physics_neighbor_rects(self, pos):
-		rects = []
-		for tile in self.neighbor_tiles(pos):
-			if tile.type in PHYSICS_TILES:
-				rect = pygame.Rect(tile.pos[0] * self.tile_size, tile.pos[1] * self.tile_size,
-									self.tile_size, self.tile_size)
-				rects.append(rect)
-
-		return rects
+		return self.is_solid_cell(int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+
+
+	def raycast(self, start, end):
+		""" The first solid cell the segment between two points in pixels goes through, None if there's none.
+			Walks the grid one cell border at a time (DDA), the closest border crossed being the next one. """
+		size = self.tile_size
+		x, y = int(start[0] // size), int(start[1] // size)
+		end_x, end_y = int(end[0] // size), int(end[1] // size)
+		delta_x, delta_y = end[0] - start[0], end[1] - start[1]
+		step_x = 1 if delta_x > 0 else -1
+		step_y = 1 if delta_y > 0 else -1
+
+		# How far along the segment, from 0 to 1, the next vertical and horizontal borders are, and how far apart they are.
+		if delta_x:
+			next_x = ((x + (step_x > 0)) * size - start[0]) / delta_x
+			span_x = size / abs(delta_x)
+		else:
+			next_x = span_x = math.inf
+		if delta_y:
+			next_y = ((y + (step_y > 0)) * size - start[1]) / delta_y
+			span_y = size / abs(delta_y)
+		else:
+			next_y = span_y = math.inf
+
+		# One border per step, so it can't go on past the end cell whatever rounding does.
+		for _ in range(abs(end_x - x) + abs(end_y - y) + 1):
+			if self.is_solid_cell(x, y):
+				return (x, y)
+			if next_x < next_y:
+				x += step_x
+				next_x += span_x
+			else:
+				y += step_y
+				next_y += span_y
+		return None
 
 
 	# Rule tiles algorithm
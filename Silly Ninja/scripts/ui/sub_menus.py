@@ -9,6 +9,7 @@ from scripts.utils import load_image, show_running_threads
 from scripts.ui.ui_elements import Text, Button, InputField, Border
 from scripts.socket.server import GameServer
 from scripts.socket.client import MAX_CLIENT_COUNT
+from scripts.socket.discovery import SessionBrowser
 
 
 WHITE = (255, 255, 255)
@@ -23,6 +24,8 @@ WIDTH, HEIGHT = 640, 480
 CENTER = WIDTH / 2
 IP_REGEX = r"^((25[0-5]|(2[0-4]|1\d|[1-9]|)\d)\.?\b){4}$"
 PORT_REGEX = r"^[1-9][0-9]{3,4}$"
+ROOM_REGEX = r"^[A-Za-z0-9_-]{0,24}$"
+SLOTS_PER_PAGE = 4
 
 
 class MenuBase:
@@ -121,6 +124,8 @@ class HostMenu(SubMenuBase):
 		while self.running:
 			MenuBase.screen.blit(self.background, (0, 0))
 
+			# Messages that arrived before the lobby opens, like the handshake's outcome, are handled here.
+			self.game.process_network()
 			if "[JOINED]" in self.status_text.text:
 				self.enter_lobby()
 			if self.game.running:
@@ -227,15 +232,26 @@ class JoinMenu(SubMenuBase):
 		self.game = GameForClient(MenuBase.clock, MenuBase.screen, MenuBase.outline_display, MenuBase.normal_display)
 		self.lobby = None
 
+		# Sessions found on the LAN, the closest first.
+		self.session_browser = SessionBrowser()
+		self.session_index = 0
+		self.selected_session = None
+
 		# UI elements.
 		self.title = Text("JOIN GAME", "retro gaming", (CENTER, 10), size=70, bold=True)
 		self.sub_title = Text("----- Local Area Network (LAN) Only -----", "retro gaming", (CENTER, 90), size=16)
 
+		self.session_button = Button("", "retro gaming", (CENTER, 112), (400, 22), on_click=self.select_session, text_offset=-8, fade_out=False)
+		self.previous_session_button = Button("<", "gamer", (CENTER - 225, 112), (30, 22), on_click=self.browse_sessions, args=(-1,), fade_out=False)
+		self.next_session_button = Button(">", "gamer", (CENTER + 225, 112), (30, 22), on_click=self.browse_sessions, args=(1,), fade_out=False)
 		self.default_ip_text = Text("Ask the server's host for their local IP", "retro gaming", (CENTER, 140), size=12)
 		self.server_ip_field = InputField("gamer", (CENTER, 160), (400, 50), placeholder_text="Enter Server IP...")
 		
-		self.default_port_text = Text(f"Default Port: {self.default_port}", "retro gaming", (CENTER, 220), size=12)
-		self.port_field = InputField("gamer", (CENTER, 240), (400, 50), placeholder_text="Enter Port Number...")
+		# The room is only for dedicated servers hosting several of them, others ignore it.
+		self.default_port_text = Text(f"Default Port: {self.default_port}", "retro gaming", (CENTER - 105, 220), size=12)
+		self.port_field = InputField("gamer", (CENTER - 105, 240), (190, 50), placeholder_text="Port...")
+		self.room_text = Text("Room (Optional)", "retro gaming", (CENTER + 105, 220), size=12)
+		self.room_field = InputField("gamer", (CENTER + 105, 240), (190, 50), placeholder_text="Room...")
 
 		self.nickname_field = InputField("gamer", (CENTER, 300), (400, 50), placeholder_text="Choose a Nickname...")
 
@@ -252,10 +268,12 @@ class JoinMenu(SubMenuBase):
 		while self.running:
 			MenuBase.screen.blit(self.background, (0, 0))
 
+			self.game.process_network()
 			if "[JOINED]" in self.status_text.text:
 				self.enter_lobby()
 			if self.game.running:
 				self.game.run()
+			self.session_browser.start()
 
 			mx, my = pygame.mouse.get_pos()
 
@@ -263,16 +281,29 @@ class JoinMenu(SubMenuBase):
 			self.title.render(MenuBase.screen)
 			self.sub_title.render(MenuBase.screen)
 
+			# Render the sessions found on the LAN, if any.
+			sessions = self.session_browser.sessions
+			self.update_session_list(sessions)
+			if sessions:
+				buttons = (self.session_button, self.previous_session_button, self.next_session_button) if len(sessions) > 1 else (self.session_button,)
+				for button in buttons:
+					button.update(MenuBase.screen, 0, mx, my, self.click)
+					button.render(MenuBase.screen)
+
 			# Render the server ip input field.
 			self.default_ip_text.render(MenuBase.screen)
 			self.server_ip_field.update(mx, my, self.click)
 			self.server_ip_field.render(MenuBase.screen)
 
-			# Render the port number input field.
+			# Render the port number and room input fields.
 			self.default_port_text.render(MenuBase.screen)
 			self.port_field.update(mx, my, self.click)
 			self.port_field.render(MenuBase.screen)
 
+			self.room_text.render(MenuBase.screen)
+			self.room_field.update(mx, my, self.click)
+			self.room_field.render(MenuBase.screen)
+
 			# Render the nickname input field.
 			self.nickname_field.update(mx, my, self.click)
 			self.nickname_field.render(MenuBase.screen)
@@ -300,19 +331,54 @@ class JoinMenu(SubMenuBase):
 			MenuBase.clock.tick(60)
 
 
+	def update_session_list(self, sessions):
+		if not sessions:
+			searching = "Searching the LAN for sessions..." if self.session_browser.searches == 0 else "No sessions found on the LAN"
+			self.default_ip_text.set_text(f"{searching}, or ask the host for their local IP")
+			return
+
+		self.session_index = min(self.session_index, len(sessions) - 1)
+		session = sessions[self.session_index]
+		self.session_button.display_text.set_text(f"{session.name} - {session.players}/{session.max_players} players - " +
+													f"{session.ping * 1000:.0f} ms")
+		self.default_ip_text.set_text(f"Session {self.session_index + 1}/{len(sessions)} found, click it to fill in its address")
+
+
+	def browse_sessions(self, step):
+		sessions = self.session_browser.sessions
+		if sessions:
+			self.session_index = (self.session_index + step) % len(sessions)
+
+
+	def select_session(self):
+		sessions = self.session_browser.sessions
+		if sessions:
+			self.selected_session = sessions[min(self.session_index, len(sessions) - 1)]
+			self.server_ip_field.set_text(self.selected_session.ip)
+			self.port_field.set_text(self.selected_session.port)
+
+
 	def try_joining(self):
 		ip = self.server_ip_field.get_submitted_text()
 		port = self.port_field.get_submitted_text()
 		nickname = self.nickname_field.get_submitted_text()
+		room = self.room_field.get_submitted_text()
+
+		# Sessions picked from the list may run over UDP, anything typed in is assumed to be TCP.
+		session = self.selected_session
+		transport = session.transport if session is not None and (session.ip, str(session.port)) == (ip, port) else "tcp"
 
 		if len(nickname) not in range(3, 16):
 			self.status_text.set_text("[ERROR]: Nickname must be from 3 to 15 characters.")
 
+		elif not re.match(ROOM_REGEX, room):
+			self.status_text.set_text("[ERROR]: Room names may only contain letters, digits, \"-\" and \"_\".")
+
 		elif re.match(IP_REGEX, ip) and re.match(PORT_REGEX, port):
 			self.status_text.set_text("")
 			try:
-				print(ip, int(port), nickname)
-				self.game.initialize(ip, int(port), nickname)
+				print(ip, int(port), nickname, room)
+				self.game.initialize(ip, int(port), nickname, transport=transport, room=room)
 				
 				threading.Thread(target=self.game.join_lobby, args=(self.status_text, self.set_buttons_interactable)).start()
 
@@ -326,6 +392,8 @@ class JoinMenu(SubMenuBase):
 		self.status_text.set_text("")
 		del self.lobby
 		self.lobby = Lobby(self.game, server=None, is_host=False)
+		# No need to search while playing, the list is refreshed once back in here.
+		self.session_browser.stop()
 		self.lobby.run()
 
 
@@ -339,13 +407,16 @@ class JoinMenu(SubMenuBase):
 		super().handle_events(event)
 		self.server_ip_field.handle_key_pressed(event)
 		self.port_field.handle_key_pressed(event)
+		self.room_field.handle_key_pressed(event)
 		self.nickname_field.handle_key_pressed(event)
 
 
 	def back_out(self):
 		super().back_out()
+		self.session_browser.stop()
 		self.server_ip_field.clear_text()
 		self.port_field.clear_text()
+		self.room_field.clear_text()
 		self.status_text.set_text("")
 
 
@@ -355,14 +426,19 @@ class Lobby(SubMenuBase):
 
 		self.server = server
 		self.is_host = is_host
+		self.can_launch = None  # Set by update_launch_rights(), the leader of the lobby may change while it's open.
 
 		self.game_instance = game_instance
-		self.game_players = game_instance.entities
+		self.game_players = game_instance.players
 		self.connected_players = 0
+		self.page = 0
 
 		# UI Elements.
 		self.title = Text("LOBBY", "retro gaming", (CENTER, 10), size=70, bold=True)
-		self.sub_title = Text("----- Current Players: 1/4 -----", "retro gaming", (CENTER, 90), size=16)
+		self.sub_title = Text(f"----- Current Players: 1/{MAX_CLIENT_COUNT} -----", "retro gaming", (CENTER, 90), size=16)
+		self.page_text = Text("Page 1/1", "retro gaming", (CENTER, 108), size=12, color=DARK_SLATE_GRAY)
+		self.previous_page_button = Button("<", "gamer", (60, 215), (40, 50), on_click=self.turn_page, args=(-1,), fade_out=False)
+		self.next_page_button = Button(">", "gamer", (580, 215), (40, 50), on_click=self.turn_page, args=(1,), fade_out=False)
 
 		self.borders = [
 			Border((CENTER, 125), (400, 55), color=AZURE4, line_width=2),
@@ -385,13 +461,12 @@ class Lobby(SubMenuBase):
 			Text("--- Disconnected ---", "retro gaming", (CENTER, 340), size=14, color=DARK_SLATE_GRAY)
 		]
 
-		self.status_text = Text("", "retro gaming", (CENTER, 365), size=13, color=pygame.Color("crimson"))
+		# Starts out with how long joining took.
+		join_summary = f"[CONNECTED]: {game_instance.join_summary}" if game_instance.join_summary else ""
+		self.status_text = Text(join_summary, "retro gaming", (CENTER, 365), size=13, color=pygame.Color("crimson"))
 
-		if self.is_host:
-			self.launch_button = Button("Launch", "gamer", (420, 390), (150, 60), on_click=self.launch, fade_out=False)
-		else:
-			self.back_button.pos = (CENTER, 390)
-			self.back_button.display_text.pos = (CENTER, 390)
+		self.launch_button = Button("Launch", "gamer", (420, 390), (150, 60), on_click=self.launch, fade_out=False)
+		self.update_launch_rights()
 
 
 	def run(self):
@@ -399,7 +474,9 @@ class Lobby(SubMenuBase):
 		print("Lobby running...")
 
 		while self.running:
+			self.game_instance.process_network()
 			self.running = self.game_instance.connected and not self.game_instance.running
+			self.update_launch_rights()
 
 			MenuBase.screen.blit(self.background, (0, 0))
 
@@ -407,21 +484,29 @@ class Lobby(SubMenuBase):
 
 			# Render title.
 			self.title.render(MenuBase.screen)
+			self.connected_players = len(self.game_players)
 			self.sub_title.set_text(f"----- Current Players: {self.connected_players}/{MAX_CLIENT_COUNT} -----")
 			self.sub_title.render(MenuBase.screen)
 
-			# Update and Render player slots.
+			# Update and Render player slots of the current page.
 			self.update_player_slots()
-			for i in range(MAX_CLIENT_COUNT):
+			for i in range(SLOTS_PER_PAGE):
 				self.borders[i].render(MenuBase.screen)
 				self.player_names[i].render(MenuBase.screen)
 				self.player_status[i].render(MenuBase.screen)
 
+			# Render the page buttons, only when there's more than one page.
+			if self.page_count() > 1:
+				self.page_text.render(MenuBase.screen)
+				for button in (self.previous_page_button, self.next_page_button):
+					button.update(MenuBase.screen, 0, mx, my, self.click)
+					button.render(MenuBase.screen)
+
 			# Render the status text.
 			self.status_text.render(MenuBase.screen)
 
-			# Render the launch button, only for the host lobby.
-			if self.is_host:
+			# Render the launch button, only for the host or the lobby leader.
+			if self.can_launch:
 				self.fade_alpha = self.launch_button.update(MenuBase.screen, self.fade_alpha, mx, my, self.click)
 				self.launch_button.render(MenuBase.screen)
 
@@ -441,29 +526,54 @@ class Lobby(SubMenuBase):
 			MenuBase.clock.tick(60)
 
 
+	def update_launch_rights(self):
+		# On a dedicated server, the first client to join leads the lobby instead of a host.
+		# Clients are numbered again as others leave, whoever ends up first takes the lead.
+		can_launch = self.is_host or self.game_instance.client.client_index == 0
+		if can_launch == self.can_launch:
+			return
+
+		self.can_launch = can_launch
+		# The back button sits next to the launch button, or alone in the middle.
+		back_pos = (220, 390) if can_launch else (CENTER, 390)
+		self.back_button.pos = back_pos
+		self.back_button.display_text.pos = back_pos
+
+
+	def page_count(self):
+		# One more slot than the connected players, so there's always an empty one to show.
+		return min(self.connected_players // SLOTS_PER_PAGE + 1, (MAX_CLIENT_COUNT - 1) // SLOTS_PER_PAGE + 1)
+
+
+	def turn_page(self, step):
+		self.page = (self.page + step) % self.page_count()
+
+
 	def update_player_slots(self):
-		for i in range(MAX_CLIENT_COUNT):
-			player = self.game_players[i]
+		# Players who left may leave the current page empty.
+		self.page = min(self.page, self.page_count() - 1)
+		self.page_text.set_text(f"Page {self.page + 1}/{self.page_count()}")
+
+		for i in range(SLOTS_PER_PAGE):
+			player = self.game_players.get(self.page * SLOTS_PER_PAGE + i)
 			# Update player slots when new players joined.
-			if player.initialized:
+			if player is not None:
 				self.borders[i].color = FOREST_GREEN if player.ready else FIRE_BRICK
 				if self.player_names[i].text != player.player_name:
 					self.player_names[i].set_text(player.player_name)
 					self.player_names[i].color = DARK_GOLDEN_ROD if player.id == "main_player" else DARK_SLATE_GRAY
 					self.player_status[i].set_text("--- Host ---" if player.client_id == "host" else "--- Connected ---")
-					self.connected_players += 1
 			
 			# Or reset slots when players left.
-			elif not player.initialized and self.player_names[i].text != "EMPTY SLOT":
+			elif self.player_names[i].text != "EMPTY SLOT":
 				self.borders[i].color = AZURE4
 				self.player_names[i].set_text("EMPTY SLOT")
 				self.player_names[i].color = DARK_SLATE_GRAY
 				self.player_status[i].set_text("--- Disconnected ---")
-				self.connected_players -= 1
 
 
 	def launch(self):
-		if all(player.ready for player in self.game_players[:self.connected_players]):
+		if all(player.ready for player in self.game_players):
 			threading.Thread(target=self.game_instance.launch_session, args=(self.status_text, self.set_buttons_interactable)).start()
 		else:
 			self.status_text.set_text("[WAITING]: Players joining, can not launch.")
@@ -472,7 +582,7 @@ class Lobby(SubMenuBase):
 	def set_buttons_interactable(self, state):
 		if self.back_button.interactable != state:
 			self.back_button.interactable = bool(state)
-			if self.is_host:
+			if self.can_launch:
 				self.launch_button.interactable = bool(state)
 
 
@@ -1,29 +1,20 @@
 import math
 import pygame
 
-class Projectile:
-	def __init__(self, game, pos, direction, alive_time=0):
-		self.game = game
-		self.pos = list(pos)
-		self.direction = direction
-		self.alive_time = alive_time
-
-	def update(self):
-		self.pos[0] += self.direction
-		self.alive_time += 1
-
-	def render(self, surface, offset=(0, 0)):
-		img = self.game.assets["projectile"]
-		surface.blit(img, (self.pos[0] - img.get_width() / 2 - offset[0],
-							self.pos[1] - img.get_height() / 2 - offset[1]))
-
-
+# Effects come and go by the hundreds every second, slots make each one smaller and quicker to build.
 class Spark:
+	__slots__ = ("pos", "angle", "speed")
+
 	def __init__(self, pos, angle, speed):
 		self.pos = list(pos)
 		self.angle = angle
 		self.speed = speed
 
+	def reset(self, pos, angle, speed):
+		self.pos[0], self.pos[1] = pos[0], pos[1]
+		self.angle = angle
+		self.speed = speed
+
 	def update(self):
 		self.pos[0] += math.cos(self.angle) * self.speed
 		self.pos[1] += math.sin(self.angle) * self.speed
@@ -42,6 +33,8 @@ class Spark:
 
 
 class Particle:
+	__slots__ = ("game", "type", "pos", "velocity", "animation")
+
 	def __init__(self, game, p_type, pos, velocity=[0, 0], start_frame=0):
 		self.game = game
 		self.type = p_type
@@ -51,6 +44,19 @@ class Particle:
 		self.animation.frame = start_frame
 
 
+	def reset(self, game, p_type, pos, velocity=[0, 0], start_frame=0):
+		# The animation is kept for another particle of the same type.
+		if p_type != self.type or game is not self.game:
+			self.game = game
+			self.type = p_type
+			self.animation = self.game.assets["particle/" + self.type].copy()
+		else:
+			self.animation.restart()
+		self.animation.frame = start_frame
+		self.pos[0], self.pos[1] = pos[0], pos[1]
+		self.velocity[0], self.velocity[1] = velocity[0], velocity[1]
+
+
 	def update(self):
 		kill = self.animation.done
 
@@ -0,0 +1,34 @@
+class WorldMixin:
+	""" What a world does with its pooled objects, shared by the displayed games and the headless ones.
+		Needs no display, the class it's mixed in holds the lists, the pools and the enemy store. """
+	def spawn_spark(self, pos, angle, speed):
+		self.sparks.append(self.spark_pool.acquire(pos, angle, speed))
+
+
+	def spawn_particle(self, p_type, pos, velocity=(0, 0), start_frame=0):
+		self.particles.append(self.particle_pool.acquire(self, p_type, pos, velocity=velocity, start_frame=start_frame))
+
+
+	def clear_effects(self):
+		self.particle_pool.release_all(self.particles)
+		self.particles.clear()
+		self.projectiles.clear()
+		self.spark_pool.release_all(self.sparks)
+		self.sparks.clear()
+
+
+	def spawn_enemy(self, enemy):
+		return self.enemy_store.add(enemy)
+
+
+	def despawn_enemies(self, enemy_ids):
+		# Removed in place, the other threads only ever iterate over copies of the list.
+		for enemy_id in enemy_ids:
+			enemy = self.enemy_store.discard(enemy_id)
+			if enemy is not None:
+				self.enemy_pool.release(enemy)
+
+
+	def clear_enemies(self):
+		self.enemy_pool.release_all(self.enemies)
+		self.enemy_store.clear()
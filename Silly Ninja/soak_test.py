@@ -0,0 +1,42 @@
+import os
+import json
+import argparse
+
+# The whole session runs without a window or audio device.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from scripts.soak import SoakTest, print_report
+from scripts.socket.impairment import NetworkConditions
+from scripts.socket.capture import TrafficRecorder
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Soak test a multiplayer session on localhost through an impaired network.")
+	parser.add_argument("--bots", type=int, default=3, help="Number of headless clients.")
+	parser.add_argument("--duration", type=float, default=30, help="Length of the session, in seconds.")
+	parser.add_argument("--port", type=int, default=5055)
+	parser.add_argument("--transport", choices=("tcp", "udp"), default="tcp")
+	parser.add_argument("--latency", type=float, default=0, help="One-way delay added to every packet, in milliseconds.")
+	parser.add_argument("--jitter", type=float, default=0, help="Random variation of the delay, in milliseconds.")
+	parser.add_argument("--loss", type=float, default=0, help="Probability of losing a packet.")
+	parser.add_argument("--reorder", type=float, default=0, help="Probability of a datagram being overtaken.")
+	parser.add_argument("--bandwidth", type=float, default=None, help="Link capacity per socket, in KiB/s.")
+	parser.add_argument("--json", help="Also write the report to this file.")
+	parser.add_argument("--capture", help="Record the server's traffic to this file, for traffic_report.py.")
+	args = parser.parse_args()
+
+	conditions = NetworkConditions(latency=args.latency / 1000, jitter=args.jitter / 1000, loss=args.loss, reorder=args.reorder,
+									bandwidth=None if args.bandwidth is None else args.bandwidth * 1024)
+	capture = TrafficRecorder(args.capture, "server") if args.capture else None
+	report = SoakTest(bot_count=args.bots, duration=args.duration, port=args.port,
+						transport=args.transport, conditions=conditions, capture=capture).run()
+	print_report(report)
+	if capture is not None:
+		capture.close()
+
+	if args.json:
+		with open(args.json, "w") as f:
+			json.dump(report, f, indent=4)
+
+
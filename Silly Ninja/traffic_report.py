@@ -0,0 +1,29 @@
+import os
+import json
+import argparse
+
+# Replays run a headless client, without a window or audio device.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from scripts.socket.capture import analyze_capture, print_analysis, replay_capture, print_replay
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Analyze a traffic capture of a Silly Ninja session, or replay it into a headless client.")
+	parser.add_argument("capture", help="File written by --capture.")
+	parser.add_argument("--replay", action="store_true", help="Also feed what a client received into a headless client.")
+	parser.add_argument("--peer", help="Client to replay from a server's capture, as \"ip:port\". Defaults to the first one.")
+	parser.add_argument("--speed", type=float, default=0, help="Replay speed, 1 is real time, 0 as fast as possible.")
+	parser.add_argument("--json", help="Also write the report to this file.")
+	args = parser.parse_args()
+
+	report = {"analysis": analyze_capture(args.capture)}
+	print_analysis(report["analysis"])
+	if args.replay:
+		report["replay"] = replay_capture(args.capture, peer=args.peer, speed=args.speed)
+		print_replay(report["replay"])
+
+	if args.json:
+		with open(args.json, "w") as f:
+			json.dump(report, f, indent=4)